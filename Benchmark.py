@@ -0,0 +1,216 @@
+'''
+Benchmark.py runs every demo without a display and measures it.
+
+Each demo runs in its own process with an offscreen render window while
+this process plays TUIO to it over localhost, either a recorded trace (see
+TuioRecorder.py) or the load generator. For every demo it reports the
+frames rendered per second, Render() time and touch-to-photon latency
+percentiles from the demo's instrumentation, the CPU time used and the
+peak resident memory.
+
+    python Benchmark.py --output results.json
+    python Benchmark.py --trace session.trace --baseline results.json --threshold 0.15
+
+With --baseline the run fails (exit status 1) when any demo is slower or
+bigger than the baseline by more than the threshold fraction.
+
+Offscreen rendering still needs an OpenGL implementation. On a machine
+without display or GPU use a VTK built against OSMesa, or run under
+xvfb-run with Mesa's software rasterizer.
+'''
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+
+from Clock import monotonic
+from Instrumentation import RENDER, LATENCY
+from TuioProtocol import TUIO_PORT
+from TuioLoadGenerator import LoadGenerator, run
+from TuioRecorder import replay
+
+DEMOS = ('DemoChooser', 'SingleSlice', 'MultipleSlices', 'MultiTouchTest', 'VolumeRendering')
+
+# simulated fingers per demo, kept below each demo's close gesture
+FINGERS = {'DemoChooser': 1, 'SingleSlice': 2, 'MultipleSlices': 3, 'MultiTouchTest': 5, 'VolumeRendering': 3}
+
+DURATION = 20.0
+RATE = 60.0
+THRESHOLD = 0.1
+
+# the numbers compared with the baseline, and whether bigger is better
+METRICS = (('fps', True),
+           ('render_p95', False),
+           ('latency_p95', False),
+           ('cpu_seconds', False),
+           ('peak_rss_mb', False))
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on OS X
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+'''
+DEMO PROCESS
+'''
+
+def stop(demo):
+    # end the demo's RunTUIO loop
+    if hasattr(demo, 'pickedDemo'):
+        demo.pickedDemo = -1
+    else:
+        demo.terminate = True
+
+def measure(name, out):
+    '''
+    Create the demo offscreen, say ready, and run it until stdin closes.
+    Writes the results as one line of JSON to out.
+    '''
+    demo = getattr(__import__(name), name)()
+    demo.renwin.SetOffScreenRendering(1)
+
+    # the first frame builds the pipelines, it is not part of the measurement
+    demo.Reset()
+    demo.context.activate(demo)
+    demo.scheduler.render()
+    demo.stats.reset()
+    renders = demo.scheduler.renders
+
+    watcher = threading.Thread(target=lambda: (sys.stdin.read(), stop(demo)))
+    watcher.daemon = True
+    watcher.start()
+
+    cpu = cpu_seconds()
+    start = monotonic()
+    out.write('ready\n')
+    out.flush()
+    demo.RunTUIO()
+    elapsed = monotonic() - start
+    cpu = cpu_seconds() - cpu
+
+    summary = demo.stats.summary()
+    render = summary.get(RENDER, {})
+    latency = summary.get(LATENCY, {})
+    result = {'demo': name,
+              'seconds': elapsed,
+              'renders': demo.scheduler.renders - renders,
+              'fps': (demo.scheduler.renders - renders) / elapsed,
+              'render_p50': render.get('p50', 0.0),
+              'render_p95': render.get('p95', 0.0),
+              'render_p99': render.get('p99', 0.0),
+              'latency_p50': latency.get('p50', 0.0),
+              'latency_p95': latency.get('p95', 0.0),
+              'latency_p99': latency.get('p99', 0.0),
+              'cpu_seconds': cpu,
+              'peak_rss_mb': peak_rss_mb()}
+    demo.Kill()
+    out.write(json.dumps(result) + '\n')
+    out.flush()
+
+'''
+DRIVER
+'''
+
+def benchmark(name, trace=None, duration=DURATION, rate=RATE, stats=None, port=TUIO_PORT):
+    env = dict(os.environ)
+    env['TUIO_STATS'] = stats or os.path.join(tempfile.gettempdir(), 'benchmark.json')
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--demo', name],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        line = child.stdout.readline()
+        if line.strip() != 'ready':
+            raise RuntimeError('%s did not start' % name)
+        if trace is not None:
+            replay(trace, port=port, loop=True, duration=duration)
+        else:
+            run(LoadGenerator(FINGERS[name]), rate, duration, port=port)
+        child.stdin.close()
+        result = child.stdout.readline()
+        if child.wait() != 0 or not result:
+            raise RuntimeError('%s exited with status %s' % (name, child.returncode))
+        return json.loads(result)
+    finally:
+        if child.poll() is None:
+            child.kill()
+
+def compare(results, baseline, threshold=THRESHOLD):
+    '''
+    Return a message for every metric of every demo that is worse than the
+    baseline by more than threshold (a fraction).
+    '''
+    failures = []
+    for result in results:
+        before = baseline.get(result['demo'])
+        if before is None:
+            continue
+        for metric, higher_is_better in METRICS:
+            old, new = before.get(metric), result[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if higher_is_better:
+                change = -change
+            if change > threshold:
+                failures.append('%s %s: %.3f, baseline %.3f (%+.0f%%)' % (result['demo'], metric, new, old,
+                                                                         100 * (new - old) / old))
+    return failures
+
+def report(results):
+    print '%-15s %8s %10s %10s %10s %11s %9s %8s' % ('demo', 'fps', 'render p50', 'render p95',
+                                                     'render p99', 'latency p95', 'cpu s', 'rss MB')
+    for r in results:
+        print '%-15s %8.1f %10.2f %10.2f %10.2f %11.2f %9.2f %8.1f' % (r['demo'], r['fps'], r['render_p50'],
+            r['render_p95'], r['render_p99'], r['latency_p95'], r['cpu_seconds'], r['peak_rss_mb'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the demos offscreen.')
+    parser.add_argument('demos', nargs='*', default=DEMOS, help='default: %s' % ' '.join(DEMOS))
+    parser.add_argument('--trace', default=None, help='replay a recorded trace instead of the load generator')
+    parser.add_argument('--duration', type=float, default=DURATION, help='seconds per demo')
+    parser.add_argument('--rate', type=float, default=RATE, help='load generator frames per second')
+    parser.add_argument('--output', default=None, help='write the results as JSON, usable as a baseline')
+    parser.add_argument('--baseline', default=None, help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='allowed fraction of regression')
+    parser.add_argument('--stats', default=None, help='where each demo writes its latency histograms')
+    parser.add_argument('--demo', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.demo:
+        # running as one demo's process: the results go out on a copy of
+        # stdout, and stdout itself, which VTK and other C code print to as
+        # well as the demo, goes to devnull
+        out = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+        sys.stdout.flush()
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+        measure(args.demo, out)
+        sys.exit(0)
+
+    for name in args.demos:
+        if name not in DEMOS:
+            parser.error('unknown demo %r' % name)
+
+    results = [benchmark(name, args.trace, args.duration, args.rate, args.stats) for name in args.demos]
+    report(results)
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(dict((r['demo'], r) for r in results), out, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = compare(results, baseline, args.threshold)
+        for failure in failures:
+            print 'REGRESSION', failure
+        sys.exit(1 if failures else 0)
@@ -0,0 +1,37 @@
+'''
+Clock.py provides a monotonic clock for timestamps and frame timing.
+
+Python 2 has no time.monotonic, so CLOCK_MONOTONIC is read through ctypes.
+Falls back to time.time where clock_gettime is not available.
+'''
+
+import ctypes
+import ctypes.util
+import sys
+import time
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+def _clock_gettime():
+    CLOCK_MONOTONIC = 6 if sys.platform == 'darwin' else 1
+    libname = ctypes.util.find_library('rt') or ctypes.util.find_library('c')
+    clock_gettime = ctypes.CDLL(libname, use_errno=True).clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+
+    def monotonic():
+        # a timespec per call: threads calling at once would overwrite a
+        # shared one between reading its two fields
+        ts = _timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            return time.time()
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    return monotonic
+
+try:
+    monotonic = time.monotonic
+except AttributeError:
+    try:
+        monotonic = _clock_gettime()
+    except (OSError, AttributeError, TypeError):
+        monotonic = time.time
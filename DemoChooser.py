@@ -6,16 +6,13 @@ The program will terminate once the user selects a demo and will be relaunched b
 
 import vtk
 import math
-from MultiTouch import CursorTracker
+import numpy
+from MultiTouch import CursorTracker, OneEuroFilter, WIDTH, HEIGHT
+from Interaction import SceneIntent, TripleBuffer
+from DemoContext import DemoContext
+from Instrumentation import TRACK, GESTURE, QUEUE, CAMERA
+from Gestures import GestureEngine, NONE, ROTATE, PICK
 
-try:
-    import tuio
-except ImportError, ioe:
-    print >>sys.stderr, """
-    You have to install PyTUIO and copy it into your $PYTHONPATH.
-    You can grab a tarball from: http://code.google.com/p/pytuio/
-    """
-    sys.exit(2)
     
 class Sphere:
     def __init__(self, center, radius, color):
@@ -49,15 +46,15 @@ class Marker:
 
 class DemoChooser:
 
-    def __init__(self):
+    def __init__(self, context=None):
 
-        # Create the Renderer, RenderWindow, etc. and set the Picker.
+        # Create the Renderer, take the RenderWindow etc. from the context
+        # (shared with the other demos when there is one) and set the Picker.
+        self.context = context or DemoContext()
         self.ren = vtk.vtkRenderer()
-        self.renwin = vtk.vtkRenderWindow()
-        self.renwin.AddRenderer(self.ren)
+        self.renwin = self.context.renwin
         self.ren.SetViewport(0,0,1,1)
-        self.iren = vtk.vtkRenderWindowInteractor()
-        self.iren.SetRenderWindow(self.renwin)
+        self.iren = self.context.iren
         self.propPicker = vtk.vtkPropPicker()
         self.iren.SetPicker(self.propPicker)
         
@@ -84,78 +81,126 @@ class DemoChooser:
         self.ren.AddActor2D(self.fingerMarker2.textActor)
         self.propPicker.AddObserver("EndPickEvent", self.Pick)
         self.ren.SetBackground(0, 0, 0)
-        self.renwin.SetSize(680, 460)
+        # the window is sized to the touch area when the chooser is shown
+        self.size = (WIDTH, HEIGHT)
         #self.renwin.FullScreenOn()
         
         '''
         TUIO STUFF
         '''
-        self.tracking = tuio.Tracking('')
-        self.tracker = CursorTracker(2)
+        # the socket, input thread, stats and log belong to the context
+        self.stats = self.context.stats
+        self.log = self.context.log
+        self.tracking = self.context.tracking
+        self.input = self.context.input
+        # smooth tracker jitter so a resting hand does not re-render the scene
+        self.tracker = CursorTracker(2, filter=OneEuroFilter(2))
+        self.gestures = GestureEngine(self.tracker, {0: NONE, 1: ROTATE, 2: PICK})
+        self.gestures.on_transition(lambda old, new: self.log.info('gesture %s -> %s', old, new))
+        self.gestures.on(NONE, self.NoFingers)
+        self.gestures.on(ROTATE, self.OnRotate)
+        self.gestures.on(PICK, self.OnPick)
+        self.fingerMarkers = [self.fingerMarker1, self.fingerMarker2]
+
+        # gesture handlers run on the input thread and only record what the
+        # scene should become, the render thread applies the newest record
+        self.intent = SceneIntent(len(self.fingerMarkers))
+        self.intents = TripleBuffer(lambda: SceneIntent(len(self.fingerMarkers)))
+        self.applied = numpy.zeros(6)
+        self.picks = 0
+        
+        # the scene is marked dirty when an intent is applied, the scheduler renders it
+        self.scheduler = self.context.scheduler
         self.pickedDemo = 0
         
     def Start(self):
-        self.renwin.Render()
+        self.Reset()
+        self.context.activate(self)
+        self.scheduler.render()
         self.RunTUIO()
         
+    def Reset(self):
+        # back to the blue sphere alone, with no fingers left over from the
+        # last time the chooser was shown
+        self.pickedDemo = 0
+        self.intents.read(0)
+        self.gestures.reset()
+        self.intent.markerCount = 0
+        self.ShowMarkers(self.intent)
+        self.Wireframe(self.ren)
+        for sphere in (self.greenSphere, self.redSphere, self.yellowSphere, self.purpleSphere):
+            sphere.sphereActor.VisibilityOff()
+
     def RunTUIO(self):
         while (self.pickedDemo == 0) :
-            while self.tracking.update():
-                # read the socket empty
-                pass
+            # sleep until the input thread publishes a new scene state or a
+            # pending render is due
+            intent = self.intents.read(self.scheduler.timeout())
+            if intent is not None:
+                self.ApplyIntent(intent)
+            self.scheduler.service()
 
-            self.tracker.update(self.tracking.cursors())
-            self.CheckGesture()
+    def OnInput(self, timestamp, cursors):
+        # input thread: track the fingers, run the gestures, publish the result
+        start = self.stats.clock()
+        if self.tracker.update(cursors, timestamp) or self.gestures.pending():
+            start = self.stats.lap(TRACK, start)
+            self.gestures.process()
+            self.stats.lap(GESTURE, start)
+            self.intent.stamp = timestamp
+            self.intents.publish(self.intent)
 
-    def CheckGesture(self):
-        self.NONE = 0 
-        self.ROTATE = 1 
-        self.PICK = 2
-        
-        if self.tracker.fingers_detected() == self.NONE:
-            print "No Fingers Detected"
-            self.fingerMarker1.textActor.VisibilityOff()
-            self.fingerMarker2.textActor.VisibilityOff()
-            self.renwin.Render()
-        
-        elif self.tracker.fingers_detected() == self.ROTATE:
-            print "Rotating"
-            fingerID1 = self.tracker._seen.keys()[0]
-            fingerPrevCoords = self.tracker._prevCoords[fingerID1]
-            fingerCurrCoords = self.tracker._coords[fingerID1]
-            
-            # show finger marker
-            self.fingerMarker1.textActor.SetPosition(fingerCurrCoords[:2])
-            self.fingerMarker1.textActor.VisibilityOn()
-            
-            # hide all other markers
-            self.fingerMarker2.textActor.VisibilityOff()
-            
-            self.Rotate(self.ren, self.renwin, self.ren.GetActiveCamera(), fingerPrevCoords[0]/10, fingerPrevCoords[1]/10, fingerCurrCoords[0]/10, fingerCurrCoords[1]/10)
+    def ApplyIntent(self, intent):
+        # render thread: bring the scene up to date with the newest intent
+        start = self.stats.lap(QUEUE, intent.stamp)
+        azimuth, elevation = intent.camera[:2] - self.applied[:2]
+        self.applied[:] = intent.camera
+        if azimuth or elevation:
+            self.Rotate(self.ren, self.ren.GetActiveCamera(), azimuth, elevation)
+        self.ShowMarkers(intent)
+        if intent.picks != self.picks:
+            self.picks = intent.picks
+            self.propPicker.PickProp(intent.pick[0], intent.pick[1], self.ren)
+        self.stats.lap(CAMERA, start)
+        self.scheduler.mark_dirty(intent.stamp)
+
+    def ShowMarkers(self, intent):
+        # one marker per finger, in touch order
+        for i, marker in enumerate(self.fingerMarkers):
+            if i < intent.markerCount:
+                marker.textActor.SetPosition(intent.markers[i])
+                marker.textActor.VisibilityOn()
+            else:
+                marker.textActor.VisibilityOff()
+
+    def NoFingers(self, frame):
+        self.log.debug('no fingers')
+        self.intent.set_markers(frame.positions)
+
+    def OnRotate(self, frame):
+        self.intent.set_markers(frame.positions)
+        prev, curr = frame.previous[0], frame.positions[0]
+        azimuth, elevation = (prev[0]-curr[0])/10, (prev[1]-curr[1])/10
+        self.log.debug('rotating %.2f %.2f', azimuth, elevation)
+        self.intent.rotate(azimuth, elevation)
 
-        elif self.tracker.fingers_detected() == self.PICK:
-            print "Picking Mode"
-            fingerID1 = self.tracker._seen.keys()[0]
-            fingerID2 = self.tracker._seen.keys()[1]
-                        
-            # show finger markers
-            self.fingerMarker1.textActor.SetPosition(self.tracker._coords[fingerID1][:2])
-            self.fingerMarker2.textActor.SetPosition(self.tracker._coords[fingerID2][:2])
-            self.fingerMarker2.textActor.VisibilityOn()  
-            self.propPicker.PickProp(self.tracker._coords[fingerID2][0], self.tracker._coords[fingerID2][1], self.ren)
+    def OnPick(self, frame):
+        self.log.debug('picking at %d %d', frame.positions[1, 0], frame.positions[1, 1])
+        self.intent.set_markers(frame.positions)
+        # the second finger picks
+        self.intent.request_pick(frame.positions[1, 0], frame.positions[1, 1])
         
-    def Rotate(self, ren, renwin, camera, startx, starty, curx, cury):  
-        camera.Azimuth(startx-curx)
-        camera.Elevation(starty-cury)
+    def Rotate(self, ren, camera, azimuth, elevation):  
+        camera.Azimuth(azimuth)
+        camera.Elevation(elevation)
         camera.OrthogonalizeViewUp()
-        renwin.Render()
         
     def Pick(self, object, event):        
         pickedSphere = self.propPicker.GetActor()
         if pickedSphere == None:            
-            self.Wireframe(self.ren, self.renwin)
+            self.Wireframe(self.ren)
         elif pickedSphere.GetBounds() == self.blueSphere.sphereActor.GetBounds():
-            print 'you picked blue'
+            self.log.info('picked blue')
             pickedSphere.GetProperty().SetRepresentationToSurface()
             self.blueSphere.sphereActor.VisibilityOn()
             self.greenSphere.sphereActor.VisibilityOn()
@@ -163,37 +208,41 @@ class DemoChooser:
             self.yellowSphere.sphereActor.VisibilityOn()
             self.purpleSphere.sphereActor.VisibilityOn()
         elif pickedSphere.GetBounds() == self.greenSphere.sphereActor.GetBounds():
-            print 'you picked green'
+            self.log.info('picked green')
             pickedSphere.GetProperty().SetRepresentationToSurface()
             self.pickedDemo = 1
         elif pickedSphere.GetBounds() == self.redSphere.sphereActor.GetBounds():
-            print 'you picked red'
+            self.log.info('picked red')
             pickedSphere.GetProperty().SetRepresentationToSurface()
             self.pickedDemo = 2
         elif pickedSphere.GetBounds() == self.yellowSphere.sphereActor.GetBounds():
-            print 'you picked yellow'
+            self.log.info('picked yellow')
             pickedSphere.GetProperty().SetRepresentationToSurface()
             self.pickedDemo = 3
         elif pickedSphere.GetBounds() == self.purpleSphere.sphereActor.GetBounds():
-            print 'you picked purple'
+            self.log.info('picked purple')
             pickedSphere.GetProperty().SetRepresentationToSurface()
             self.pickedDemo = 4
-        self.iren.Render()
+        self.scheduler.mark_dirty()
         
-    def Wireframe(self, ren, renwin):
+    def Wireframe(self, ren):
         actors = ren.GetActors()
         actors.InitTraversal()
         actor = actors.GetNextItem()
         while actor:
             actor.GetProperty().SetRepresentationToWireframe()
             actor = actors.GetNextItem()
-        renwin.Render()
+        self.scheduler.mark_dirty()
         
     def GetPickedDemo(self):
         return self.pickedDemo
         
     def Kill(self):
         print "Stopping DemoChooser TUIO tracking"
-        self.tracking.stop()
+        self.log.flush()
+        print "%.1f renders/s" % self.scheduler.renders_per_second()
+        if self.stats.enabled:
+            print self.stats.report()
+            print "Latency histograms written to %s" % self.stats.dump("DemoChooser")
+        self.context.stop()
         print "DemoChooser.py Terminated"
-        self.iren.GetRenderWindow().Finalize()
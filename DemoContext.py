@@ -0,0 +1,69 @@
+'''
+DemoContext.py holds what every demo needs but none of them owns: the render
+window and interactor, the TUIO socket and its input thread, the render
+scheduler, the latency stats, the event log and the settings of the volume
+the demos show (see VolumeCache.volume_settings()).
+
+A demo created without a context makes a private one and behaves as a
+standalone program. DemoManager creates one context and hands it to every
+demo, so switching demos never opens a window or a socket. activate() puts
+a demo's renderer in the window, resizes the window to the demo's size and
+routes the input thread's frames to it.
+'''
+
+import vtk
+
+from TuioInput import TuioInputThread
+from TuioProtocol import TuioSource, TUIO_PORT
+from RenderScheduler import RenderScheduler
+from Instrumentation import open_stats
+from FlightRecorder import get_recorder
+from VolumeCache import volume_settings
+
+class DemoContext(object):
+    def __init__(self, host='', port=TUIO_PORT, volume=None):
+        self.renwin = vtk.vtkRenderWindow()
+        self.iren = vtk.vtkRenderWindowInteractor()
+        self.iren.SetRenderWindow(self.renwin)
+
+        # latency histograms, only collected when TUIO_STATS is set
+        self.stats = open_stats()
+        self.log = get_recorder()
+        self.tracking = TuioSource(host, port, stats=self.stats)
+        self.input = TuioInputThread(self.tracking, self.on_input)
+        self.scheduler = RenderScheduler(self.renwin, stats=self.stats)
+        self.volume = volume or volume_settings()
+        self.active = None
+        self._renderer = None
+
+    def on_input(self, timestamp, cursors):
+        # input thread: hand the frame to whichever demo is showing
+        demo = self.active
+        if demo is not None:
+            demo.OnInput(timestamp, cursors)
+
+    def activate(self, demo):
+        '''
+        Show demo's renderer in the window at the demo's size, (width,
+        height) in pixels, and send it the TUIO input, in place of the demo
+        that was active.
+        '''
+        self.active = None
+        if tuple(self.renwin.GetSize()) != demo.size:
+            self.renwin.SetSize(*demo.size)
+        if self._renderer is not demo.ren:
+            if self._renderer is not None:
+                self.renwin.RemoveRenderer(self._renderer)
+            self.renwin.AddRenderer(demo.ren)
+            self._renderer = demo.ren
+        self.active = demo
+        self.scheduler.mark_dirty()
+        if not self.input.is_alive():
+            self.input.start()
+        self.log.info('showing %s', demo.__class__.__name__)
+
+    def stop(self):
+        self.active = None
+        self.input.stop()
+        self.tracking.stop()
+        self.renwin.Finalize()
@@ -0,0 +1,54 @@
+'''
+DemoManager.py runs the demos in one window, switching between them warm.
+
+Every demo is built once, up front, on a single DemoContext: one render
+window, one TUIO socket and input thread, one render scheduler. The demos
+are kept in a pool. Switching from one to another puts the next demo's
+renderer in the window and points the input thread at its gesture handlers;
+no window, socket or pipeline is created or torn down, so the next demo's
+first frame is the only cost of a switch and no touch input is lost.
+
+DemoChooser (demo 0) picks the next demo. When any other demo closes, the
+chooser comes back.
+'''
+
+from DemoContext import DemoContext
+from DemoChooser import DemoChooser
+from SingleSlice import SingleSlice
+from MultipleSlices import MultipleSlices
+from MultiTouchTest import MultiTouchTest
+from VolumeRendering import VolumeRendering
+
+CHOOSER = 0
+DEMOS = {CHOOSER: DemoChooser, 1: SingleSlice, 2: MultipleSlices, 3: MultiTouchTest, 4: VolumeRendering}
+
+class DemoManager(object):
+    def __init__(self, demos=DEMOS, context=None):
+        self.context = context or DemoContext()
+        self.log = self.context.log
+        self.pool = {}
+        for number, demo in sorted(demos.items()):
+            self.log.info('building %s', demo.__name__)
+            self.pool[number] = demo(self.context)
+
+    def run(self, number=CHOOSER):
+        # show demos until interrupted, starting with demo number
+        while True:
+            demo = self.pool.get(number)
+            if demo is None:
+                # the chooser offers demos that do not exist yet
+                self.log.warning('no demo %s', number)
+                number = CHOOSER
+                continue
+            demo.Start()
+            number = demo.GetPickedDemo() if number == CHOOSER else CHOOSER
+
+    def kill(self):
+        print "Stopping TUIO tracking"
+        self.log.flush()
+        print "%.1f renders/s" % self.context.scheduler.renders_per_second()
+        stats = self.context.stats
+        if stats.enabled:
+            print stats.report()
+            print "Latency histograms written to %s" % stats.dump("Main")
+        self.context.stop()
@@ -0,0 +1,225 @@
+'''
+FlightRecorder.py is the demos' event log.
+
+Logging an event only stores its time, level, format string and arguments
+in a preallocated ring of the last CAPACITY events; nothing is formatted or
+written on the calling thread. A background writer wakes a few times a
+second and prints the new events at or above the configured level, at most
+RATE lines per second. Whatever the rate limit holds back is summarized in
+one line, so a stuck finger cannot flood the terminal or the journal.
+
+Events below the level (per-frame gesture details, frame times, cursor
+counts) are still kept in the ring. The whole ring is dumped, oldest first,
+when an exception goes uncaught and whenever the process gets SIGUSR1:
+
+    kill -USR1 <pid>
+
+The level is read from TUIO_LOG_LEVEL (debug, info, warning or error,
+default info), dumps go to the file named by TUIO_FLIGHT_DUMP, or to
+stderr.
+'''
+
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+from Clock import monotonic
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+CAPACITY = 4096
+# lines per second the writer prints at most
+RATE = 20.0
+# how often the writer wakes up, in seconds
+INTERVAL = 0.2
+
+class FlightRecorder(object):
+    def __init__(self, capacity=CAPACITY, level=INFO, stream=None, rate=RATE, dump_path=None):
+        self.capacity = capacity
+        self.level = level
+        self.stream = stream or sys.stdout
+        self.rate = rate
+        self.dumpPath = dump_path
+        self._times = [0.0] * capacity
+        self._levels = [0] * capacity
+        self._formats = [None] * capacity
+        self._args = [None] * capacity
+        # events logged so far, and how many of them the writer has seen
+        self._count = 0
+        self._written = 0
+        self._suppressed = 0
+        self._tokens = rate
+        self._refilled = monotonic()
+        self._start = monotonic()
+        self._lock = threading.Lock()
+        # demos flush from their own threads while the writer does
+        self._flushLock = threading.Lock()
+        self._wake = threading.Event()
+        self._halt = threading.Event()
+        self._writer = None
+        self._dumpReason = None
+
+    def log(self, level, format, *args):
+        with self._lock:
+            slot = self._count % self.capacity
+            self._times[slot] = monotonic()
+            self._levels[slot] = level
+            self._formats[slot] = format
+            self._args[slot] = args
+            self._count += 1
+        if level >= ERROR:
+            self._wake.set()
+
+    def debug(self, format, *args):
+        self.log(DEBUG, format, *args)
+
+    def info(self, format, *args):
+        self.log(INFO, format, *args)
+
+    def warning(self, format, *args):
+        self.log(WARNING, format, *args)
+
+    def error(self, format, *args):
+        self.log(ERROR, format, *args)
+
+    def events(self, first=0, last=None):
+        '''
+        Copy out (time, level, format, args) of events first to last (by
+        default the newest) that are still in the ring, oldest first.
+        '''
+        with self._lock:
+            if last is None:
+                last = self._count
+            first = max(first, self._count - self.capacity)
+            slots = [i % self.capacity for i in range(first, last)]
+            return [(self._times[s], self._levels[s], self._formats[s], self._args[s]) for s in slots]
+
+    def line(self, event):
+        timestamp, level, format, args = event
+        try:
+            message = format % args if args else format
+        except (TypeError, ValueError):
+            message = '%s %r' % (format, args)
+        return '%10.3f %-7s %s' % (timestamp - self._start, LEVELS.get(level, level), message)
+
+    '''
+    WRITER
+    '''
+
+    def start(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run)
+            self._writer.daemon = True
+            self._writer.start()
+        return self
+
+    def stop(self):
+        self._halt.set()
+        self._wake.set()
+        if self._writer is not None:
+            self._writer.join(2 * INTERVAL)
+        self.flush()
+
+    def _run(self):
+        while not self._halt.is_set():
+            self._wake.wait(INTERVAL)
+            self._wake.clear()
+            self.flush()
+            if self._dumpReason is not None:
+                reason, self._dumpReason = self._dumpReason, None
+                self.dump(reason)
+
+    def flush(self):
+        # write the events logged since the last flush, within the rate limit
+        with self._flushLock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            first = self._written
+            last = self._written = self._count
+        lost = max(0, last - self.capacity - first)
+        lines = [self.line(event) for event in self.events(first, last) if event[1] >= self.level]
+
+        now = monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        allowed = int(self._tokens)
+        if len(lines) > allowed:
+            self._suppressed += len(lines) - allowed
+            lines = lines[:allowed]
+        self._tokens -= len(lines)
+
+        if lost:
+            lines.append('%10.3f %-7s %d events overwritten before they were written' % (now - self._start, 'WARNING', lost))
+        if self._suppressed and self._tokens >= 1:
+            lines.append('%10.3f %-7s %d events held back by the rate limit' % (now - self._start, 'WARNING', self._suppressed))
+            self._suppressed = 0
+        if lines:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+
+    '''
+    DUMPS
+    '''
+
+    def dump(self, reason='dump requested'):
+        # write the whole ring, every level, to the dump file or stderr
+        lines = ['=== flight recorder: %s, %s ===' % (reason, time.strftime('%Y-%m-%d %H:%M:%S'))]
+        lines += [self.line(event) for event in self.events()]
+        lines.append('=== end of flight recorder ===')
+        text = '\n'.join(lines) + '\n'
+        if self.dumpPath:
+            with open(self.dumpPath, 'a') as out:
+                out.write(text)
+        else:
+            sys.stderr.write(text)
+            sys.stderr.flush()
+
+    def dump_exception(self, exc_type, value, tb):
+        self.error('%s', ''.join(traceback.format_exception(exc_type, value, tb)).rstrip())
+        self.dump('uncaught %s' % exc_type.__name__)
+
+    def install(self):
+        '''
+        Dump the ring on uncaught exceptions and on SIGUSR1. The signal
+        handler can only be set from the main thread.
+        '''
+        hook = sys.excepthook
+        def excepthook(exc_type, value, tb):
+            self.dump_exception(exc_type, value, tb)
+            hook(exc_type, value, tb)
+        sys.excepthook = excepthook
+        if hasattr(signal, 'SIGUSR1'):
+            try:
+                signal.signal(signal.SIGUSR1, self._on_signal)
+            except ValueError:
+                pass
+        return self
+
+    def _on_signal(self, signum, frame):
+        # the main thread may be inside log() holding the lock, leave the
+        # dump to the writer
+        self._dumpReason = 'SIGUSR1'
+        self._wake.set()
+
+_recorder = None
+_recorderLock = threading.Lock()
+
+def get_recorder():
+    # the process wide recorder, started and installed on first use
+    global _recorder
+    with _recorderLock:
+        if _recorder is None:
+            name = os.environ.get('TUIO_LOG_LEVEL', 'info').upper()
+            level = dict((v, k) for k, v in LEVELS.items()).get(name, INFO)
+            _recorder = FlightRecorder(level=level, dump_path=os.environ.get('TUIO_FLIGHT_DUMP'))
+            _recorder.install().start()
+        return _recorder
@@ -0,0 +1,210 @@
+'''
+Gestures.py turns CursorTracker state into gesture callbacks.
+
+Each demo maps finger counts to gestures and registers one handler per
+gesture. Every frame the engine takes a GestureFrame snapshot of the tracker,
+with the positions of all fingers gathered in touch order and the usual
+deltas computed once, and passes it to the handler of the active gesture.
+A finger count may also map to a function of the GestureFrame returning the
+gesture, for gestures told apart by where the fingers are.
+
+A change of finger count only switches gesture once it has held for
+`settle` seconds. Fingers never land or lift at exactly the same time, so
+without this a pinch would start with a few frames of rotation and a four
+finger close would fire while the hand is still coming down. Lifting every
+finger switches to NONE at once. Settling is timed rather than counted in
+frames because fingers held still send no new frames: while pending() is
+true the demo runs process() again on the frames the input thread repeats
+while fingers rest (see TuioInput.py), and the gesture switches once the
+time is up.
+
+solve_similarity() fits one translation, rotation and scale to the motion
+of any number of fingers, which is what the multi-finger camera gestures use.
+
+Running this module times the engine against the per-finger dict lookups
+the demos used before.
+'''
+
+import math
+
+import numpy
+
+from Clock import monotonic
+
+NONE = 'none'
+ROTATE = 'rotate'
+ZOOM = 'zoom'
+PAN = 'pan'
+MANIPULATE = 'manipulate'
+PICK = 'pick'
+SCRUB = 'scrub'
+SLICE = 'slice'
+TOUCH = 'touch'
+TERMINATE = 'terminate'
+
+# finger counts not mapped to any gesture
+IDLE = 'idle'
+
+# seconds a new finger count must hold before its gesture starts
+SETTLE = 0.04
+
+_origin = numpy.zeros(2)
+_origin.setflags(write=False)
+
+def solve_similarity(previous, positions):
+    '''
+    Least squares (Procrustes) fit of the similarity transform that takes the
+    (n, 2) points previous onto positions. Returns (dx, dy, angle, scale):
+    the centroid translation and the rotation (radians, counterclockwise)
+    and scale about the centroid. One point gives a pure translation.
+    '''
+    count = len(previous)
+    if count == 0:
+        return 0.0, 0.0, 0.0, 1.0
+    before = numpy.add.reduce(previous) / count
+    after = numpy.add.reduce(positions) / count
+    dx, dy = after - before
+    p = previous - before
+    q = positions - after
+
+    # with points as complex numbers the best fit is q = a * p, with
+    # a = sum(conj(p) * q) / sum(|p|^2) = scale * exp(i * angle)
+    norm = (p * p).sum()
+    if norm < 1e-9:
+        return dx, dy, 0.0, 1.0
+    re = (p[:, 0] * q[:, 0] + p[:, 1] * q[:, 1]).sum() / norm
+    im = (p[:, 0] * q[:, 1] - p[:, 1] * q[:, 0]).sum() / norm
+    return dx, dy, math.atan2(im, re), math.hypot(re, im)
+
+class GestureFrame(object):
+    '''
+    Snapshot of the tracker for one frame. Row i of every array belongs to
+    the i-th finger in touch order.
+    '''
+    def __init__(self, tracker):
+        slots = tracker.active_slots()
+        self.count = len(slots)
+        self.slots = slots
+        self.ids = [tracker.session_id(slot) for slot in slots]
+        self.start, self.previous, self.positions = tracker.slot_positions()[:, slots]
+        self.delta = self.positions - self.previous
+        self.moved = bool(self.delta.any())
+        if self.count:
+            self.centroid = numpy.add.reduce(self.positions) / self.count
+            self.centroidDelta = numpy.add.reduce(self.delta) / self.count
+        else:
+            self.centroid = self.centroidDelta = _origin
+
+    def distance(self, i, j, a=None, b=None):
+        # distance between finger i in array a and finger j in array b,
+        # both default to the current positions
+        a = self.positions if a is None else a
+        b = self.positions if b is None else b
+        return math.hypot(a[i, 0] - b[j, 0], a[i, 1] - b[j, 1])
+
+    def similarity(self):
+        # incremental (dx, dy, angle, scale) of all fingers since the last frame
+        return solve_similarity(self.previous, self.positions)
+
+class GestureEngine(object):
+    def __init__(self, tracker, gestures, settle=SETTLE, clock=monotonic):
+        self.tracker = tracker
+        self.gestures = gestures
+        self.settle = settle
+        self.clock = clock
+        self.state = NONE
+        self._handlers = {}
+        self._transitionHandlers = []
+        self._candidate = None
+        self._since = 0.0
+
+    def on(self, gesture, handler):
+        self._handlers[gesture] = handler
+
+    def on_transition(self, handler):
+        # handler(old, new) runs whenever the active gesture changes
+        self._transitionHandlers.append(handler)
+
+    def process(self):
+        frame = GestureFrame(self.tracker)
+        gesture = self.gestures.get(frame.count, IDLE)
+        if callable(gesture):
+            gesture = gesture(frame)
+
+        if gesture != self.state:
+            now = self.clock()
+            if gesture != self._candidate:
+                self._candidate = gesture
+                self._since = now
+            if gesture != NONE and now - self._since < self.settle:
+                # still settling, hold the current gesture without acting on it
+                return frame
+            self.transition(gesture)
+        else:
+            self._candidate = None
+
+        handler = self._handlers.get(self.state)
+        if handler is not None:
+            handler(frame)
+        return frame
+
+    def pending(self):
+        # whether a new gesture is settling and process() should run again
+        # even if the fingers did not move
+        return self._candidate is not None
+
+    def reset(self):
+        # lift every finger, for a demo that is shown again
+        self.tracker.update(())
+        self._candidate = None
+        if self.state != NONE:
+            self.transition(NONE)
+
+    def transition(self, gesture):
+        old, self.state = self.state, gesture
+        self._candidate = None
+        for handler in self._transitionHandlers:
+            handler(old, gesture)
+
+'''
+BENCHMARK
+'''
+
+def _legacy_frame(tracker):
+    # the lookups MultipleSlices.CheckGesture did for each frame
+    count = tracker.fingers_detected()
+    if 1 <= count <= 3:
+        ids = [tracker._seen.keys()[i] for i in range(count)]
+        for id in ids:
+            tracker._startCoords[id]
+            tracker._prevCoords[id]
+            tracker._coords[id]
+        if count == 2:
+            a, b = tracker._coords[ids[0]], tracker._coords[ids[1]]
+            math.sqrt((a[0] - b[0])**2 + (a[1] - b[1])**2)
+
+def benchmark(fingers=3, frames=5000):
+    import time
+    from MultiTouch import CursorTracker, Cursor
+    from TuioLoadGenerator import LoadGenerator
+
+    generator = LoadGenerator(fingers, ('pinch',))
+    stream = [[Cursor(*c) for c in generator.cursors(i / 60.0)] for i in range(frames)]
+    tracker = CursorTracker(fingers)
+    engine = GestureEngine(tracker, {0: NONE, 1: ROTATE, 2: ZOOM, 3: PAN, 4: TERMINATE})
+    engine.on(ROTATE, lambda frame: frame.delta)
+    engine.on(ZOOM, lambda frame: frame.distance(0, 1))
+    engine.on(PAN, lambda frame: frame.centroidDelta)
+
+    for name, step in (('legacy lookups', lambda: _legacy_frame(tracker)), ('GestureEngine', engine.process)):
+        elapsed = 0.0
+        for cursors in stream:
+            tracker.update(cursors)
+            start = time.time()
+            step()
+            elapsed += time.time() - start
+        print '%-15s %8.2f us/frame' % (name, 1e6 * elapsed / frames)
+
+if __name__ == '__main__':
+    import sys
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
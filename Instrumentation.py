@@ -0,0 +1,210 @@
+'''
+Instrumentation.py measures where the time goes between a TUIO datagram
+arriving and the frame it causes reaching the screen.
+
+Every stage of the pipeline records its duration into a histogram:
+
+    receive   recv_into() of one datagram                 (input thread)
+    decode    TuioDecoder.decode() of one datagram        (input thread)
+    track     CursorTracker.update()                      (input thread)
+    gesture   GestureEngine.process()                     (input thread)
+    queue     arrival of the input to the render thread picking it up
+    camera    applying the intent to the camera and markers
+    render    Render()
+    latency   arrival of the input to the end of the Render() showing it
+
+Histograms use logarithmic buckets, SUBBUCKETS per power of two from one
+microsecond up, so recording is a frexp() and an increment and percentiles
+are accurate to about 10%.
+
+Instrumentation is off unless the TUIO_STATS environment variable names an
+output file. Each demo then writes its histograms there when it ends, as
+CSV if the name ends in .csv and as JSON otherwise, with the demo name
+added before the extension:
+
+    TUIO_STATS=/tmp/latency.json python Main.py
+
+When it is off the demos get NULL_STATS, whose clock() and lap() return 0.0
+without reading the clock and whose record() does nothing.
+'''
+
+import csv
+import json
+import math
+import os
+
+from Clock import monotonic
+
+RECEIVE = 'receive'
+DECODE = 'decode'
+TRACK = 'track'
+GESTURE = 'gesture'
+QUEUE = 'queue'
+CAMERA = 'camera'
+RENDER = 'render'
+LATENCY = 'latency'
+STAGES = (RECEIVE, DECODE, TRACK, GESTURE, QUEUE, CAMERA, RENDER, LATENCY)
+
+PERCENTILES = (50, 95, 99)
+
+# smallest duration told apart, and buckets per doubling above it
+MIN_TIME = 1e-6
+SUBBUCKETS = 8
+# 2**26 microseconds is over a minute
+BUCKETS = 27 * SUBBUCKETS
+
+class Histogram(object):
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds > MIN_TIME:
+            # seconds / MIN_TIME = mantissa * 2**exponent, mantissa in [0.5, 1)
+            mantissa, exponent = math.frexp(seconds / MIN_TIME)
+            index = min(exponent * SUBBUCKETS + int((mantissa - 0.5) * 2 * SUBBUCKETS), BUCKETS - 1)
+        else:
+            index = 0
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def upper(self, index):
+        # largest duration that falls into bucket index
+        exponent, sub = divmod(index, SUBBUCKETS)
+        return MIN_TIME * 2.0 ** (exponent - 1) * (1.0 + (sub + 1.0) / SUBBUCKETS)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.upper(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def buckets(self):
+        # (upper bound, count) of every bucket in use
+        return [(self.upper(i), c) for i, c in enumerate(self.counts) if c]
+
+class Stats(object):
+    enabled = True
+
+    def __init__(self, path=None):
+        self.path = path
+        self.histograms = dict((stage, Histogram()) for stage in STAGES)
+
+    def clock(self):
+        return monotonic()
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.clear()
+
+    def record(self, stage, seconds):
+        self.histograms[stage].add(seconds)
+
+    def lap(self, stage, since):
+        # record the time from since until now, and return now
+        now = monotonic()
+        self.histograms[stage].add(now - since)
+        return now
+
+    def summary(self):
+        '''
+        {stage: {'count', 'mean', 'p50', 'p95', 'p99', 'max'}} with the
+        times in milliseconds, for the stages that recorded anything.
+        Safe to call while the demo is running.
+        '''
+        summary = {}
+        for stage in STAGES:
+            histogram = self.histograms[stage]
+            if not histogram.count:
+                continue
+            row = {'count': histogram.count,
+                   'mean': 1e3 * histogram.mean(),
+                   'max': 1e3 * histogram.max}
+            for p in PERCENTILES:
+                row['p%d' % p] = 1e3 * histogram.percentile(p)
+            summary[stage] = row
+        return summary
+
+    def report(self):
+        lines = ['%-8s %7s %8s %8s %8s %8s %8s' % ('stage', 'count', 'mean', 'p50', 'p95', 'p99', 'max')]
+        summary = self.summary()
+        for stage in STAGES:
+            if stage in summary:
+                row = summary[stage]
+                lines.append('%-8s %7d %8.3f %8.3f %8.3f %8.3f %8.3f' % (stage, row['count'], row['mean'],
+                             row['p50'], row['p95'], row['p99'], row['max']))
+        return '\n'.join(lines)
+
+    def dump(self, name=None):
+        '''
+        Write the histograms to self.path, with name added before the
+        extension. Returns the file written.
+        '''
+        if self.path is None:
+            return None
+        root, ext = os.path.splitext(self.path)
+        path = '%s-%s%s' % (root, name, ext) if name else self.path
+        summary = self.summary()
+        with open(path, 'wb') as out:
+            if ext.lower() == '.csv':
+                writer = csv.writer(out)
+                writer.writerow(['stage', 'count', 'mean_ms'] + ['p%d_ms' % p for p in PERCENTILES] + ['max_ms'])
+                for stage in STAGES:
+                    if stage in summary:
+                        row = summary[stage]
+                        writer.writerow([stage, row['count'], row['mean']] +
+                                        [row['p%d' % p] for p in PERCENTILES] + [row['max']])
+            else:
+                for stage in summary:
+                    summary[stage]['buckets'] = [(1e3 * upper, count) for upper, count in self.histograms[stage].buckets()]
+                json.dump(summary, out, indent=2, sort_keys=True)
+        return path
+
+class NullStats(object):
+    enabled = False
+    path = None
+
+    def clock(self):
+        return 0.0
+
+    def reset(self):
+        pass
+
+    def record(self, stage, seconds):
+        pass
+
+    def lap(self, stage, since):
+        return 0.0
+
+    def summary(self):
+        return {}
+
+    def report(self):
+        return ''
+
+    def dump(self, name=None):
+        return None
+
+NULL_STATS = NullStats()
+
+def open_stats(path=None):
+    # Stats writing to path, by default to $TUIO_STATS, or NULL_STATS if neither is set
+    if path is None:
+        path = os.environ.get('TUIO_STATS')
+    return Stats(path) if path else NULL_STATS
@@ -0,0 +1,120 @@
+'''
+Interaction.py hands gesture results from the input thread to the render thread.
+
+The input thread runs tracking and gesture recognition and records what the
+scene should look like in a SceneIntent: cumulative camera motion, iso
+value change and slice scrolling, finger marker positions, pick requests and the terminate flag. After every frame it
+publishes the intent through a TripleBuffer. The render thread only ever
+picks up the newest published intent, intermediate ones are overwritten
+without being rendered, and since the camera motion is cumulative nothing is
+lost when a frame is skipped. A slow Render() therefore never holds up
+packet reading.
+'''
+
+import threading
+
+import numpy
+
+# SceneIntent.camera entries, all cumulative since the demo started
+AZIMUTH = 0     # degrees
+ELEVATION = 1   # degrees
+ROLL = 2        # radians
+ZOOM = 3        # log of the dolly factor
+PAN_X = 4       # display pixels
+PAN_Y = 5
+
+class SceneIntent(object):
+    def __init__(self, max_markers=8):
+        self.camera = numpy.zeros(6)
+        self.markers = numpy.zeros((max_markers, 2))
+        self.markerCount = 0
+        self.pick = numpy.zeros(2)
+        self.picks = 0
+        # cumulative change of the scrubbed iso value
+        self.iso = 0.0
+        # cumulative slices scrolled towards the viewer
+        self.slice = 0.0
+        # whether a scrub gesture is going on
+        self.scrubbing = False
+        self.terminate = False
+        # arrival time of the newest input that went into this state
+        self.stamp = 0.0
+
+    def copy_from(self, other):
+        self.camera[:] = other.camera
+        self.markers[:] = other.markers
+        self.markerCount = other.markerCount
+        self.pick[:] = other.pick
+        self.picks = other.picks
+        self.iso = other.iso
+        self.slice = other.slice
+        self.scrubbing = other.scrubbing
+        self.terminate = other.terminate
+        self.stamp = other.stamp
+
+    def set_markers(self, positions):
+        count = min(len(positions), len(self.markers))
+        self.markers[:count] = positions[:count]
+        self.markerCount = count
+
+    def rotate(self, azimuth, elevation):
+        self.camera[AZIMUTH] += azimuth
+        self.camera[ELEVATION] += elevation
+
+    def manipulate(self, dx, dy, angle, scale):
+        self.camera[PAN_X] += dx
+        self.camera[PAN_Y] += dy
+        self.camera[ROLL] += angle
+        self.camera[ZOOM] += numpy.log(scale)
+
+    def scrub(self, delta):
+        self.iso += delta
+
+    def scroll(self, slices):
+        self.slice += slices
+
+    def request_pick(self, x, y):
+        self.pick[:] = (x, y)
+        self.picks += 1
+
+class TripleBuffer(object):
+    '''
+    Three preallocated states: the writer fills the back one and swaps it
+    with the middle one, the reader swaps the middle one into the front.
+    Neither side ever waits for the other to finish with a state, the lock
+    only covers the index swap.
+    '''
+    def __init__(self, factory):
+        self._states = [factory(), factory(), factory()]
+        self._back, self._middle, self._front = 0, 1, 2
+        self._fresh = False
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.published = 0
+        self.skipped = 0
+
+    def publish(self, state):
+        self._states[self._back].copy_from(state)
+        with self._lock:
+            self._back, self._middle = self._middle, self._back
+            if self._fresh:
+                # the reader never saw the state we just replaced
+                self.skipped += 1
+            self._fresh = True
+            self.published += 1
+        self._ready.set()
+
+    def read(self, timeout=None):
+        '''
+        Return the newest published state, waiting up to timeout seconds for
+        one. Returns None if nothing new was published.
+        '''
+        if timeout is None or timeout > 0:
+            self._ready.wait(timeout)
+        with self._lock:
+            if not self._fresh:
+                return None
+            self._front, self._middle = self._middle, self._front
+            self._fresh = False
+            self._ready.clear()
+        return self._states[self._front]
@@ -0,0 +1,181 @@
+'''
+IsosurfaceCache.py keeps extracted isosurfaces on disk between runs.
+
+The demos build their skin and bone surfaces with the same chain: an
+IsosurfaceEngine backend (see IsosurfaceEngine.py), vtkPolyDataNormals and
+vtkStripper. surface() runs that chain once per volume, iso value and
+feature angle and stores the stripped polydata as a raw binary VTK XML file.
+Later calls with the same inputs read the file back instead of contouring,
+which takes milliseconds. extract() puts several surfaces of a volume in
+the cache at once, contouring the missing ones together.
+
+Files are named by a hash of the volume's contents, the iso value, the
+feature angle and PIPELINE_VERSION, so a changed dataset or a changed chain
+never picks up a stale surface. The backend is not part of the name, they all
+extract the same surface. Bump PIPELINE_VERSION whenever the chain
+below changes. Reading a file marks it as recently used; when the directory
+grows past max_bytes the least recently used files are deleted.
+
+The directory is TUIO_CACHE_DIR, by default ~/.cache/python-vtk-tuio.
+'''
+
+import hashlib
+import os
+
+import vtk
+from vtk.util import numpy_support
+
+from FlightRecorder import get_recorder
+from VolumeCache import volume_checksum
+from IsosurfaceEngine import IsosurfaceEngine
+
+PIPELINE_VERSION = 2
+
+MAX_BYTES = 256 * 1024 * 1024
+CACHE_EXTENSION = '.vtp'
+
+def cache_directory(kind='isosurfaces'):
+    directory = os.environ.get('TUIO_CACHE_DIR')
+    if not directory:
+        directory = os.path.join(os.path.expanduser('~'), '.cache', 'python-vtk-tuio')
+    return os.path.join(directory, kind)
+
+def content_hash(source):
+    '''
+    Hex digest identifying the volume produced by the algorithm source:
+    the slice checksum for volumes from open_volume(), otherwise a hash of
+    the scalars, extent and spacing.
+    '''
+    checksum = volume_checksum(source)
+    if checksum is not None:
+        return checksum.encode('hex')
+    source.Update()
+    image = source.GetOutput()
+    digest = hashlib.sha1()
+    digest.update(repr((image.GetExtent(), image.GetSpacing(), image.GetOrigin())))
+    digest.update(numpy_support.vtk_to_numpy(image.GetPointData().GetScalars()))
+    return digest.hexdigest()
+
+class IsosurfaceCache(object):
+    def __init__(self, directory=None, max_bytes=MAX_BYTES, engine=None):
+        self.directory = directory or cache_directory()
+        self.maxBytes = max_bytes
+        self.engine = engine or IsosurfaceEngine()
+        self.hits = 0
+        self.misses = 0
+        self.log = get_recorder()
+        self._hashes = {}
+        self._warned = False
+
+    def key(self, source, value, feature_angle):
+        volume = self._hashes.get(source)
+        if volume is None:
+            volume = self._hashes[source] = content_hash(source)
+        description = repr((PIPELINE_VERSION, volume, float(value), float(feature_angle)))
+        return hashlib.sha1(description).hexdigest()
+
+    def path(self, source, value, feature_angle):
+        return os.path.join(self.directory, self.key(source, value, feature_angle) + CACHE_EXTENSION)
+
+    def surface(self, source, value, feature_angle=60.0):
+        '''
+        Return an algorithm whose output is the stripped isosurface of the
+        volume source at value, read from the cache or extracted and stored.
+        '''
+        path = self.path(source, value, feature_angle)
+        if os.path.exists(path):
+            reader = vtk.vtkXMLPolyDataReader()
+            reader.SetFileName(path)
+            reader.Update()
+            if reader.GetOutput().GetNumberOfPoints():
+                self.hits += 1
+                self.touch(path)
+                return reader
+        return self.contour(source, [value], feature_angle)[0]
+
+    def extract(self, source, values, feature_angle=60.0):
+        # cache the surfaces of source at each of values not cached yet
+        missing = [value for value in values if not os.path.exists(self.path(source, value, feature_angle))]
+        if missing:
+            self.contour(source, missing, feature_angle)
+
+    def contour(self, source, values, feature_angle):
+        # extract, finish and store the surfaces at values, all together
+        surfaces = []
+        for value, polys in zip(values, self.engine.extract(source, values)):
+            self.misses += 1
+            normals = vtk.vtkPolyDataNormals()
+            normals.SetInputData(polys)
+            normals.SetFeatureAngle(feature_angle)
+            stripper = vtk.vtkStripper()
+            stripper.SetInputConnection(normals.GetOutputPort())
+            stripper.Update()
+            self.store(self.path(source, value, feature_angle), stripper)
+            surfaces.append(stripper)
+        return surfaces
+
+    def store(self, path, algorithm):
+        try:
+            self.write(path, algorithm)
+            self.evict()
+        except (IOError, OSError) as error:
+            if not self._warned:
+                # every later store fails the same way, say so once
+                self._warned = True
+                self.log.warning('isosurface cache %s is not written, surfaces are contoured every run: %s',
+                                 self.directory, error)
+
+    def write(self, path, algorithm):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        # write under a temporary name so no reader sees half a file
+        temp = '%s.%d.tmp' % (path, os.getpid())
+        writer = vtk.vtkXMLPolyDataWriter()
+        writer.SetFileName(temp)
+        writer.SetInputConnection(algorithm.GetOutputPort())
+        writer.SetDataModeToAppended()
+        writer.EncodeAppendedDataOff()
+        writer.SetCompressorTypeToNone()
+        try:
+            if not writer.Write():
+                raise IOError('cannot write %s' % temp)
+            os.rename(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def touch(self, path):
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def evict(self):
+        # delete the least recently used surfaces until the cache fits
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_EXTENSION):
+                try:
+                    info = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((info.st_mtime, info.st_size, name))
+        entries.sort()
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in entries:
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+_cache = None
+
+def get_isosurface_cache():
+    # the process wide cache, so the demos share the volume hashes
+    global _cache
+    if _cache is None:
+        _cache = IsosurfaceCache()
+    return _cache
@@ -0,0 +1,327 @@
+'''
+IsosurfaceEngine.py extracts isosurfaces from a volume with a choice of VTK
+contouring backends, spread over worker processes when the volume is large.
+
+BACKENDS names the filters: 'flying-edges' (vtkFlyingEdges3D, the default),
+'synchronized-templates' (vtkSynchronizedTemplates3D), 'contour'
+(vtkContourFilter, which the demos used before) and 'marching-cubes'
+(vtkMarchingCubes). All of them return bare triangles; the caller adds
+normals and strips (see IsosurfaceCache.py).
+
+VTK's Python wrapping holds the interpreter lock while a filter runs, so
+threads cannot contour two surfaces at once. Instead, for volumes of at
+least POOL_VOXELS voxels, extract() cuts the volume into slabs along z that
+share their boundary slice and hands every (iso value, slab) pair to a pool
+of worker processes. The skin and bone, and the slabs of each, are then
+contoured on all cores together. The workers are forked with the volume
+already in memory and only send back triangles. The slabs of each surface
+are joined, and the vertices on the cut planes, which both neighbouring
+slabs produce, are merged. Smaller volumes such as headsq are contoured in
+this process, where starting a pool would cost more than it saves.
+
+TUIO_ISO_BACKEND and TUIO_ISO_PROCESSES override the backend and the
+number of worker processes (1 turns the pool off).
+
+    python IsosurfaceEngine.py headsq/Data_headsq_quarter --scales 1 2 4.6
+
+times every backend on the volume and on copies upsampled by each scale
+per axis, in this process and with the pool.
+'''
+
+import multiprocessing
+import os
+
+import numpy
+import vtk
+from vtk.util import numpy_support
+
+BACKENDS = {'flying-edges': vtk.vtkFlyingEdges3D,
+            'synchronized-templates': vtk.vtkSynchronizedTemplates3D,
+            'contour': vtk.vtkContourFilter,
+            'marching-cubes': vtk.vtkMarchingCubes}
+DEFAULT_BACKEND = 'flying-edges'
+
+# volumes smaller than this are contoured without the process pool, which
+# takes a tenth of a second to start and join
+POOL_VOXELS = 16 * 1024 * 1024
+
+# the largest slab handed to one worker
+SLAB_VOXELS = 2 * 1024 * 1024
+
+def contour_filter(backend, value):
+    # a filter of the backend giving only the triangles of one isosurface
+    extractor = BACKENDS[backend]()
+    extractor.SetValue(0, value)
+    extractor.ComputeNormalsOff()
+    extractor.ComputeGradientsOff()
+    extractor.ComputeScalarsOff()
+    return extractor
+
+def slab_bounds(count, slice_voxels, slabs=1, slab_voxels=SLAB_VOXELS):
+    '''
+    First and last slice of each slab of a volume count slices deep; there
+    are at least slabs of them, each at most about slab_voxels.
+    '''
+    cells = count - 1
+    by_size = int(numpy.ceil(float(cells * slice_voxels) / slab_voxels))
+    slabs = max(1, min(cells, max(slabs, by_size)))
+    edges = numpy.linspace(0, cells, slabs + 1).round().astype(int)
+    return zip(edges[:-1], edges[1:])
+
+def triangles_to_polydata(points, triangles):
+    polys = vtk.vtkPolyData()
+    vertices = vtk.vtkPoints()
+    vertices.SetData(numpy_support.numpy_to_vtk(points, deep=1))
+    polys.SetPoints(vertices)
+    cells = numpy.empty((len(triangles), 4), numpy_support.ID_TYPE_CODE)
+    cells[:, 0] = 3
+    cells[:, 1:] = triangles
+    array = vtk.vtkCellArray()
+    array.SetCells(len(triangles), numpy_support.numpy_to_vtkIdTypeArray(cells.ravel(), deep=1))
+    polys.SetPolys(array)
+    return polys
+
+def polydata_to_triangles(polys):
+    if not polys.GetNumberOfPoints():
+        return numpy.empty((0, 3), numpy.float32), numpy.empty((0, 3), numpy.int64)
+    points = numpy_support.vtk_to_numpy(polys.GetPoints().GetData()).astype(numpy.float32)
+    cells = numpy_support.vtk_to_numpy(polys.GetPolys().GetData())
+    return points, cells.reshape(-1, 4)[:, 1:].astype(numpy.int64)
+
+# backends giving each voxel edge the surface crosses a point of its own, even
+# where an iso value equal to a sample puts several of them on that sample
+EDGE_POINTS = ('flying-edges',)
+
+# the edges at a sample in the order flying edges numbers their points:
+# (axis, step to the other end)
+SAMPLE_EDGES = ((2, -1), (1, -1), (0, -1), (0, 1), (1, 1), (2, 1))
+
+def vertex_edges(index, volume=None, value=None, pieces=None, extents=None):
+    '''
+    The voxel edge each point lies on, as the (x, y, z) of the edge's lower
+    end and its axis, from index, the points' voxel coordinates. A point on
+    a sample lies on any of the edges there and gets axis 3, unless volume,
+    the (z, y, x) point values, and the iso value are given: then the
+    points are those of an EDGE_POINTS backend, which numbers the points of
+    a sample's crossing edges in SAMPLE_EDGES order, and each gets its own
+    edge. pieces gives the piece (slab) each point was contoured in and
+    extents[piece] the first and last (x, y, z) sample of that piece, by
+    default the points are of one piece covering volume.
+    '''
+    grid = numpy.round(index)
+    offset = abs(index - grid)
+    axis = numpy.argmax(offset, axis=1)
+    lower = grid.astype(numpy.int64)
+    on_edge = numpy.nonzero(offset.max(axis=1) > 1e-4)[0]
+    lower[on_edge, axis[on_edge]] = numpy.floor(index[on_edge, axis[on_edge]])
+    samples = numpy.nonzero(offset.max(axis=1) <= 1e-4)[0]
+    axis[samples] = 3
+    if volume is None or not len(samples):
+        return lower, axis
+
+    if pieces is None:
+        pieces = numpy.zeros(len(index), int)
+        extents = numpy.array([[(0, 0, 0), numpy.subtract(volume.shape[::-1], 1)]])
+    at = lower[samples]
+    piece = pieces[samples]
+    first, last = extents[piece, 0], extents[piece, 1]
+    inside = volume[at[:, 2], at[:, 1], at[:, 0]] >= value
+    crossing = numpy.zeros((len(samples), len(SAMPLE_EDGES)), bool)
+    for edge, (along, step) in enumerate(SAMPLE_EDGES):
+        other = at.copy()
+        other[:, along] += step
+        within = (other >= first).all(axis=1) & (other <= last).all(axis=1)
+        other[~within] = at[~within]
+        crossing[:, edge] = within & ((volume[other[:, 2], other[:, 1], other[:, 0]] >= value) != inside)
+
+    # the points of one piece on one sample, in the order they were made
+    key = (at[:, 2] * volume.shape[1] + at[:, 1]) * volume.shape[2] + at[:, 0]
+    order = numpy.lexsort((samples, key, piece))
+    start = numpy.ones(len(order), bool)
+    start[1:] = (key[order][1:] != key[order][:-1]) | (piece[order][1:] != piece[order][:-1])
+    group = numpy.cumsum(start) - 1
+    first_of_group = numpy.nonzero(start)[0]
+    rank = numpy.empty(len(order), int)
+    rank[order] = numpy.arange(len(order)) - first_of_group[group]
+    size = numpy.empty(len(order), int)
+    size[order] = numpy.bincount(group)[group]
+
+    # the rank-th crossing edge of the sample, where there are as many
+    # points as crossing edges
+    matched = numpy.nonzero(size == crossing.sum(axis=1))[0]
+    edge = numpy.argmax(crossing[matched] & (numpy.cumsum(crossing[matched], axis=1) == rank[matched, None] + 1), axis=1)
+    along, step = numpy.array(SAMPLE_EDGES)[edge].T
+    points = samples[matched]
+    axis[points] = along
+    lower[points, along] += numpy.minimum(step, 0)
+    return lower, axis
+
+def merge_vertices(points, triangles, shared, lower, axis, shape):
+    '''
+    Merge the points shared that lie on the same voxel edge, an isosurface
+    crosses an edge only once, drop the triangles this collapses and the
+    points no triangle uses. lower and axis give every point's edge (see
+    vertex_edges()), shape the (x, y, z) point counts of the volume. Returns
+    the new points and triangles.
+    '''
+    edges = ((lower[shared, 2] * shape[1] + lower[shared, 1]) * shape[0] + lower[shared, 0]) * 4 + axis[shared]
+    unique, first, inverse = numpy.unique(edges, return_index=True, return_inverse=True)
+    remap = numpy.arange(len(points))
+    remap[shared] = shared[first[inverse]]
+    triangles = remap[triangles]
+    triangles = triangles[(triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2])
+                          & (triangles[:, 2] != triangles[:, 0])]
+    used = numpy.zeros(len(points), bool)
+    used[triangles] = True
+    renumber = numpy.cumsum(used) - 1
+    return points[used], renumber[triangles]
+
+def triangle_cells(points, triangles, lower, axis):
+    # the (x, y, z) voxel cell each triangle lies in: every corner is on an
+    # edge of the cell, so the cell starts at most one sample below it. A
+    # triangle with a corner on a sample but no edge (axis 3) is placed by
+    # its centre, which lies inside the cell, or on the face between two
+    # cells if the triangle lies in it; it then belongs to the cell its
+    # normal points into.
+    bounds = lower[triangles] - (axis[triangles][:, :, None] != numpy.arange(3))
+    cells = bounds.max(axis=1)
+    loose = numpy.nonzero((axis[triangles] == 3).any(axis=1))[0]
+    corners = points[triangles[loose]]
+    cells[loose] = numpy.floor(corners.mean(axis=1))
+    flat = (abs(corners - corners[:, :1]) < 1e-4).all(axis=1)
+    normal = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    cells[loose] -= flat & (normal < 0)
+    return cells
+
+def join_slabs(pieces, slabs, volume, value, backend, origin, spacing):
+    '''
+    One vtkPolyData from the (points, triangles) backend made of the slabs
+    (first, last slice) of volume, the (z, y, x) point values, at value,
+    merging the vertices on the same voxel edge, such as those neighbouring
+    slabs share on the slices between them.
+    '''
+    sizes = [len(piece[0]) for piece in pieces]
+    offsets = numpy.cumsum([0] + sizes)
+    points = numpy.concatenate([piece[0] for piece in pieces])
+    triangles = numpy.concatenate([piece[1] + offset for piece, offset in zip(pieces, offsets)])
+
+    index = (points - origin) / spacing
+    if backend in EDGE_POINTS:
+        count, rows, columns = volume.shape
+        extents = numpy.array([[(0, 0, first), (columns - 1, rows - 1, last)] for first, last in slabs])
+        lower, axis = vertex_edges(index, volume, value, numpy.repeat(numpy.arange(len(slabs)), sizes), extents)
+    else:
+        lower, axis = vertex_edges(index)
+
+    # all of them: marching cubes leaves some points of a slab unmerged
+    shared = numpy.arange(len(points))
+    return triangles_to_polydata(*merge_vertices(points, triangles, shared, lower, axis, volume.shape[::-1]))
+
+# the volume and its placement, set before the pool forks its workers
+_volume = None
+_geometry = None
+
+def _extract_slab(task):
+    # worker process: triangles of one iso value between two slices
+    backend, value, first, last = task
+    origin, spacing = _geometry
+    slab = _volume[first:last + 1]
+    count, rows, columns = slab.shape
+    image = vtk.vtkImageData()
+    image.SetDimensions(columns, rows, count)
+    image.SetSpacing(spacing)
+    image.SetOrigin(origin[0], origin[1], origin[2] + first * spacing[2])
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(slab.ravel(), deep=0))
+    extractor = contour_filter(backend, value)
+    extractor.SetInputData(image)
+    extractor.Update()
+    return polydata_to_triangles(extractor.GetOutput())
+
+class IsosurfaceEngine(object):
+    def __init__(self, backend=None, processes=None, pool_voxels=POOL_VOXELS):
+        self.backend = backend or os.environ.get('TUIO_ISO_BACKEND') or DEFAULT_BACKEND
+        if self.backend not in BACKENDS:
+            raise ValueError('unknown isosurface backend %r, expected one of %s'
+                             % (self.backend, ', '.join(sorted(BACKENDS))))
+        if processes is None:
+            processes = int(os.environ.get('TUIO_ISO_PROCESSES') or multiprocessing.cpu_count())
+        self.processes = processes
+        self.poolVoxels = pool_voxels
+
+    def extract(self, source, values):
+        '''
+        A vtkPolyData of triangles for each of values, the isosurfaces of
+        the volume produced by the algorithm source.
+        '''
+        source.Update()
+        image = source.GetOutput()
+        if self.processes > 1 and image.GetNumberOfPoints() >= self.poolVoxels:
+            return self.extract_pooled(image, values)
+        return [self.extract_one(image, value) for value in values]
+
+    def extract_one(self, image, value):
+        extractor = contour_filter(self.backend, value)
+        extractor.SetInputData(image)
+        extractor.Update()
+        return extractor.GetOutput()
+
+    def extract_pooled(self, image, values):
+        global _volume, _geometry
+        columns, rows, count = image.GetDimensions()
+        extent = image.GetExtent()
+        spacing = numpy.array(image.GetSpacing())
+        origin = numpy.array(image.GetOrigin()) + spacing * extent[::2]
+        slabs = slab_bounds(count, columns * rows, self.processes)
+        tasks = [(self.backend, value, first, last) for value in values for first, last in slabs]
+
+        scalars = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())
+        volume = _volume = scalars.reshape(count, rows, columns)
+        _geometry = (origin, spacing)
+        pool = multiprocessing.Pool(min(self.processes, len(tasks)))
+        try:
+            pieces = pool.map(_extract_slab, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            _volume = _geometry = None
+
+        return [join_slabs(pieces[i * len(slabs):(i + 1) * len(slabs)], slabs, volume, value, self.backend,
+                           origin, spacing)
+                for i, value in enumerate(values)]
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from VolumeCache import open_volume
+
+    parser = argparse.ArgumentParser(description='Time the isosurface backends on a volume.')
+    parser.add_argument('prefix', help='slice files are prefix.1, prefix.2, ...')
+    parser.add_argument('--dimensions', type=int, nargs=2, default=(64, 64))
+    parser.add_argument('--range', type=int, nargs=2, default=(1, 93))
+    parser.add_argument('--spacing', type=float, nargs=3, default=(3.2, 3.2, 1.5))
+    parser.add_argument('--values', type=float, nargs='+', default=(500, 1150), help='default: skin and bone')
+    parser.add_argument('--scales', type=float, nargs='+', default=(1, 2, 4.6),
+                        help='upsampling per axis, 4.6 makes a volume about 100 times bigger')
+    parser.add_argument('--backends', nargs='+', default=sorted(BACKENDS), choices=sorted(BACKENDS))
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    volume = open_volume(args.prefix, args.dimensions, args.range, args.spacing)
+    print '%6s %12s %-24s %9s %10s %10s' % ('scale', 'voxels', 'backend', 'processes', 'ms', 'triangles')
+    for scale in args.scales:
+        resample = vtk.vtkImageResample()
+        resample.SetInputConnection(volume.GetOutputPort())
+        resample.SetInterpolationModeToLinear()
+        for axis in range(3):
+            resample.SetAxisMagnificationFactor(axis, scale)
+        resample.Update()
+        voxels = resample.GetOutput().GetNumberOfPoints()
+        for backend in args.backends:
+            for processes in sorted(set((1, args.processes))):
+                engine = IsosurfaceEngine(backend, processes, pool_voxels=0)
+                start = time.time()
+                surfaces = engine.extract(resample, args.values)
+                elapsed = time.time() - start
+                triangles = sum(surface.GetNumberOfPolys() for surface in surfaces)
+                print '%6.2f %12d %-24s %9d %10.1f %10d' % (scale, voxels, backend, processes, 1e3 * elapsed, triangles)
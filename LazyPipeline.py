@@ -0,0 +1,39 @@
+'''
+LazyPipeline.py defers building the pipeline behind an actor until the actor
+can be seen.
+
+A LazyActor wraps a vtkActor (or vtkImageActor) whose properties are set up
+front but whose mapper input, filters and lookup tables are made by a build
+function. The actor starts hidden. The first time anything turns it visible,
+whether the demo or a gesture, build(actor) runs, before the next render.
+The filters it makes are kept, so hiding and showing the actor again costs
+nothing. An actor that is never shown never reads, contours or colours any
+data, and holds no memory beyond the empty actor.
+'''
+
+class LazyActor(object):
+    def __init__(self, actor, build):
+        '''
+        build(actor) connects actor to the pipeline it draws and returns
+        nothing; it runs at most once.
+        '''
+        self.actor = actor
+        self.build = build
+        self.built = False
+        actor.VisibilityOff()
+        self._observer = actor.AddObserver('ModifiedEvent', self._on_modified)
+
+    def _on_modified(self, actor, event):
+        if actor.GetVisibility():
+            self.realize()
+
+    def realize(self):
+        # build the pipeline now, whether or not the actor is visible
+        if self.built:
+            return
+        self.built = True
+        self.actor.RemoveObserver(self._observer)
+        self.build(self.actor)
+
+    def show(self, visible=True):
+        self.actor.SetVisibility(visible)
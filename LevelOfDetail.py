@@ -0,0 +1,156 @@
+'''
+LevelOfDetail.py keeps interaction smooth on machines that render in software.
+
+A SurfaceLOD holds decimated copies of one isosurface actor's mesh. Each
+level is decimated once, the first time it is needed (or up front with
+build()), and gets its own mapper, so switching levels is just a SetMapper()
+on the actor and never re-runs a filter.
+
+A LodController picks the level. While a gesture is moving the scene it
+times every frame rendered at each level and uses the finest level whose
+frame time fits the target frame rate, trying the next coarser level when
+none is known to fit. Once nothing has moved for idle seconds it switches
+back to full resolution for a last, sharp frame. Frames rendered before the
+demo calls resync() (the first render of the scene, which also runs the
+pipeline, or frames other demos rendered through the same scheduler) are not
+timed.
+'''
+
+import vtk
+
+from Clock import monotonic
+
+# fraction of the triangles removed at levels 1, 2, 3...
+REDUCTIONS = (0.5, 0.75, 0.9)
+
+TARGET_FPS = 15.0
+
+# seconds without camera motion before full resolution comes back
+IDLE_RESTORE = 0.4
+
+# weight of the newest frame in the per level frame time estimates
+SMOOTHING = 0.3
+
+class SurfaceLOD(object):
+    def __init__(self, actor, polys, reductions=REDUCTIONS, feature_angle=60.0):
+        '''
+        actor is drawn at full resolution by its current mapper, polys()
+        returns the output port of the full resolution surface to decimate.
+        Both are looked up when the first level is built, so the actor's
+        pipeline may be built lazily (see LazyPipeline.py).
+        '''
+        self.actor = actor
+        self.polys = polys
+        self.reductions = reductions
+        self.featureAngle = feature_angle
+        self.mappers = [None] * (len(reductions) + 1)
+        self.level = 0
+        self._filters = []
+
+    def levels(self):
+        return len(self.mappers)
+
+    def build(self, level=None):
+        # decimate one level, or all of them
+        if level is None:
+            for level in range(1, self.levels()):
+                self.build(level)
+            return
+        if self.mappers[level] is not None:
+            return
+        if self.mappers[0] is None:
+            self.mappers[0] = self.actor.GetMapper()
+
+        # the decimation only takes triangles, not strips
+        triangles = vtk.vtkTriangleFilter()
+        triangles.SetInputConnection(self.polys())
+        decimate = vtk.vtkQuadricDecimation()
+        decimate.SetInputConnection(triangles.GetOutputPort())
+        decimate.SetTargetReduction(self.reductions[level - 1])
+        normals = vtk.vtkPolyDataNormals()
+        normals.SetInputConnection(decimate.GetOutputPort())
+        normals.SetFeatureAngle(self.featureAngle)
+        stripper = vtk.vtkStripper()
+        stripper.SetInputConnection(normals.GetOutputPort())
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputConnection(stripper.GetOutputPort())
+        mapper.SetScalarVisibility(self.mappers[0].GetScalarVisibility())
+
+        # run the decimation now, the result stays in the pipeline for good
+        mapper.Update()
+        self._filters.append((triangles, decimate, normals, stripper))
+        self.mappers[level] = mapper
+
+    def set_level(self, level):
+        level = min(level, self.levels() - 1)
+        if level == self.level:
+            return
+        if self.mappers[level] is None:
+            if not self.actor.GetVisibility():
+                # do not decimate a surface nobody sees
+                return
+            self.build(level)
+        self.actor.SetMapper(self.mappers[level])
+        self.level = level
+
+class LodController(object):
+    def __init__(self, scheduler, levels, apply, target_fps=TARGET_FPS, idle=IDLE_RESTORE):
+        '''
+        apply(level) switches the scene to a level, 0 being full resolution;
+        the frame times are read from the RenderScheduler scheduler.
+        '''
+        self.scheduler = scheduler
+        self.apply = apply
+        self.budget = 1.0 / target_fps
+        self.idle = idle
+        self.level = 0
+        self.frameTimes = [None] * levels
+        self._renders = scheduler.renders
+        self._lastMotion = None
+
+    def resync(self):
+        # call after the first render of the demo, so the next measure() does
+        # not credit it to the current level
+        self._renders = self.scheduler.renders
+
+    def measure(self):
+        # credit the frames rendered since the last call to the current level
+        if self.scheduler.renders == self._renders:
+            return
+        self._renders = self.scheduler.renders
+        elapsed = self.scheduler.lastFrameTime
+        known = self.frameTimes[self.level]
+        if known is None:
+            self.frameTimes[self.level] = elapsed
+        else:
+            self.frameTimes[self.level] = known + SMOOTHING * (elapsed - known)
+
+    def choose(self):
+        # finest level known to fit the budget, or the first one not yet tried
+        for level, elapsed in enumerate(self.frameTimes):
+            if elapsed is None or elapsed <= self.budget:
+                return level
+        return len(self.frameTimes) - 1
+
+    def interacting(self):
+        # call whenever a gesture moves the scene
+        self.measure()
+        self._lastMotion = monotonic()
+        self.switch(self.choose())
+
+    def service(self):
+        # call from the demo loop, restores full resolution once idle
+        self.measure()
+        if self.level and monotonic() - self._lastMotion >= self.idle:
+            self.switch(0)
+
+    def timeout(self):
+        # how long the demo loop may sleep before service() has work to do
+        if not self.level:
+            return None
+        return max(0.0, self._lastMotion + self.idle - monotonic())
+
+    def switch(self, level):
+        if level != self.level:
+            self.level = level
+            self.apply(level)
@@ -1,44 +1,26 @@
+import argparse
+
 from vtk import *
-from DemoChooser import DemoChooser
-from MultipleSlices import MultipleSlices
-from SingleSlice import SingleSlice
-from MultiTouchTest import MultiTouchTest
+from DemoContext import DemoContext
+from DemoManager import DemoManager
+from VolumeCache import volume_settings
 
 if __name__ == '__main__':
-    gui = DemoChooser()
-    gui.Start()
-    nextDemo = gui.GetPickedDemo()
-    gui.Kill()
-        
+    # the volume defaults to headsq, or the TUIO_VOLUME* environment variables
+    volume = volume_settings()
+    parser = argparse.ArgumentParser(description='Run the TUIO demos.')
+    parser.add_argument('--volume', default=volume.prefix, help='slice files are VOLUME.1, VOLUME.2, ...')
+    parser.add_argument('--dimensions', type=int, nargs=2, default=volume.dimensions, help='columns and rows of a slice')
+    parser.add_argument('--range', type=int, nargs=2, default=volume.image_range, help='first and last slice')
+    parser.add_argument('--spacing', type=float, nargs=3, default=volume.spacing)
+    parser.add_argument('--big-endian', action='store_true', default=volume.byte_order == 'big')
+    args = parser.parse_args()
+    volume = volume._replace(prefix=args.volume, dimensions=tuple(args.dimensions), image_range=tuple(args.range),
+                             spacing=tuple(args.spacing), byte_order='big' if args.big_endian else 'little')
+
+    manager = DemoManager(context=DemoContext(volume=volume))
     try:
-        while True:
-            
-            if nextDemo == 0:
-                gui = DemoChooser()
-                gui.Start()
-                nextDemo = gui.GetPickedDemo()
-                gui.Kill()
-                
-            elif nextDemo == 1:
-                singleSlice = SingleSlice()
-                singleSlice.Start()
-                singleSlice.Kill()
-                nextDemo = 0
-                
-            elif nextDemo == 2:
-                multipleSlices = MultipleSlices()
-                multipleSlices.Start()
-                multipleSlices.Kill()
-                nextDemo = 0
-                
-            elif nextDemo == 3:
-                multiTouchTest = MultiTouchTest()
-                multiTouchTest.Start()
-                multiTouchTest.Kill()
-                nextDemo = 0
-                
-            else:
-                nextDemo = 0
-            
+        manager.run()
     except KeyboardInterrupt:
         print "Program Terminating"
+    manager.kill()
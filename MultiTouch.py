@@ -2,6 +2,17 @@
 CursorTracker.py will maintain a real-time list of all cursors 
 and their respective positions. It is updated via a tuio "thread"
 
+Every cursor owns a slot in a set of fixed size NumPy arrays holding its
+start, previous and current position, so a frame is applied with a handful
+of vectorized operations no matter how many fingers are on the table. The
+cursors of a frame are picked out by boolean masks over the slots and every
+operation writes into preallocated buffers, so applying a frame builds no
+arrays and no per-cursor objects unless a cursor appears or vanishes.
+Each slot also keeps a ring buffer of its last samples with timestamps, from
+which velocities and accelerations of all cursors are estimated at once.
+An optional OneEuroFilter smooths tracker jitter so that a resting finger
+does not report any change.
+
 Modified from Python Input Module for NumptyPhysics 
 '''
 
@@ -9,57 +20,284 @@ import sys
 import collections
 import math
 
+import numpy
+
+from Clock import monotonic
+from FlightRecorder import get_recorder
+
 WIDTH = 680
 HEIGHT = 460
 
+# Minimal cursor record handed across threads. It carries the same attribute
+# names as the pyTUIO cursor objects so CursorTracker.update accepts either.
+Cursor = collections.namedtuple('Cursor', 'sessionid xpos ypos')
+
+class _CoordsView(object):
+    '''
+    Read-only, dict style access to one of the position arrays keyed by
+    session id, for gesture code that looks cursors up one by one.
+    '''
+    def __init__(self, seen, array):
+        self._seen = seen
+        self._array = array
+
+    def __getitem__(self, id):
+        x, y = self._array[self._seen[id]]
+        return (int(x), int(y))
+
+    def __contains__(self, id):
+        return id in self._seen
+
+    def __len__(self):
+        return len(self._seen)
+
+class OneEuroFilter(object):
+    '''
+    One Euro filter (Casiez et al. 2012) run over all cursor slots at once,
+    followed by a dead-band: a filtered position is only reported once it has
+    moved more than deadband pixels away from the last reported one.
+    min_cutoff (Hz) sets the smoothing of slow motion, beta how quickly the
+    cutoff rises with speed (per pixel/s), so fast swipes keep little lag.
+    Slots are selected by a boolean mask and every step writes into
+    preallocated buffers.
+    '''
+    def __init__(self, max_cursors, min_cutoff=1.0, beta=0.01, d_cutoff=1.0, deadband=2.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.deadband = deadband
+        self._x = numpy.zeros((max_cursors, 2))
+        self._dx = numpy.zeros((max_cursors, 2))
+        self._t = numpy.zeros(max_cursors)
+        self._out = numpy.zeros((max_cursors, 2))
+
+        # scratch buffers, and column views of them for (n, 2) arrays
+        self._dt = numpy.zeros(max_cursors)
+        self._a = numpy.zeros(max_cursors)
+        self._b = numpy.zeros(max_cursors)
+        self._speed = numpy.zeros(max_cursors)
+        self._velocity = numpy.zeros((max_cursors, 2))
+        self._filtered = numpy.zeros((max_cursors, 2))
+        self._term = numpy.zeros((max_cursors, 2))
+        self._moved = numpy.zeros(max_cursors, bool)
+        self._dtColumn = self._dt[:, None]
+        self._aColumn = self._a[:, None]
+        self._bColumn = self._b[:, None]
+        self._movedColumn = self._moved[:, None]
+        self._termX, self._termY = self._term.T
+        self._columns = {}
+
+    def _column(self, mask):
+        # mask[:, None], made once for each mask buffer the tracker passes
+        cached = self._columns.get(id(mask))
+        if cached is None or cached[0] is not mask:
+            cached = self._columns[id(mask)] = (mask, mask[:, None])
+        return cached[1]
+
+    def _alpha(self, cutoff):
+        # smoothing factor for cutoff into _a, and 1 - it into _b
+        numpy.multiply(2 * math.pi, cutoff, out=self._a)
+        numpy.reciprocal(self._a, out=self._a)
+        self._a /= self._dt
+        self._a += 1.0
+        numpy.reciprocal(self._a, out=self._a)
+        numpy.subtract(1.0, self._a, out=self._b)
+
+    def _blend(self, out, new, old):
+        # out = a * new + (1 - a) * old
+        numpy.multiply(self._aColumn, new, out=out)
+        numpy.multiply(self._bColumn, old, out=self._term)
+        out += self._term
+
+    def _length(self, xy):
+        # squared length of every row of xy into _speed
+        numpy.multiply(xy, xy, out=self._term)
+        numpy.add(self._termX, self._termY, out=self._speed)
+
+    def reset(self, mask, xy, timestamp):
+        # start filtering the slots in mask at positions xy, indexed by slot
+        column = self._column(mask)
+        numpy.copyto(self._x, xy, where=column)
+        numpy.copyto(self._dx, 0.0, where=column)
+        numpy.copyto(self._t, timestamp, where=mask)
+        numpy.copyto(self._out, xy, where=column)
+
+    def apply(self, mask, xy, timestamp):
+        # filter the positions in xy of the slots in mask, in place
+        column = self._column(mask)
+        dt = self._dt
+        numpy.subtract(timestamp, self._t, out=dt)
+        numpy.less_equal(dt, 0.0, out=self._moved)
+        numpy.copyto(dt, 1.0 / 60, where=self._moved)
+
+        velocity = self._velocity
+        numpy.subtract(xy, self._x, out=velocity)
+        velocity /= self._dtColumn
+        self._alpha(self.d_cutoff)
+        self._blend(velocity, velocity, self._dx)
+        self._length(velocity)
+        numpy.sqrt(self._speed, out=self._speed)
+        self._speed *= self.beta
+        self._speed += self.min_cutoff
+        self._alpha(self._speed)
+        filtered = self._filtered
+        self._blend(filtered, xy, self._x)
+
+        numpy.copyto(self._x, filtered, where=column)
+        numpy.copyto(self._dx, velocity, where=column)
+        numpy.copyto(self._t, timestamp, where=mask)
+
+        # the filtered positions still within the dead-band keep the last
+        # reported one
+        numpy.subtract(filtered, self._out, out=velocity)
+        self._length(velocity)
+        numpy.greater(self._speed, self.deadband * self.deadband, out=self._moved)
+        self._moved &= mask
+        numpy.copyto(self._out, filtered, where=self._movedColumn)
+        numpy.copyto(xy, self._out, where=column)
+
+def _readonly(array):
+    view = array.view()
+    view.setflags(write=False)
+    return view
+
 class CursorTracker(object):
-    def __init__(self, max_cursors):
+    def __init__(self, max_cursors, history=8, filter=None):
+        self.max_cursors = max_cursors
+        self.filter = filter
         self._seen = {}
-        self._coords = {}
-        self._prevCoords = {}
-        self._startCoords = {}
+        self._slotIds = [None] * max_cursors
         self._freeslots = collections.deque(range(max_cursors))
+
+        # per slot state, start/previous/current positions share one block so
+        # they can be gathered together
+        self._positions = numpy.zeros((3, max_cursors, 2))
+        self._start, self._prev, self._curr = self._positions
+        self._active = numpy.zeros(max_cursors, bool)
+        self._arrival = numpy.zeros(max_cursors, numpy.int64)
+        self._arrivals = 0
+        self._order = None
+
+        # motion history: ring of (x, y, t) samples per slot, _histHead is
+        # the index of the newest sample
+        self._history = numpy.zeros((max_cursors, history, 3))
+        self._histHead = numpy.zeros(max_cursors, numpy.intp)
+        self._histCount = numpy.zeros(max_cursors, numpy.intp)
+        self._histIndex = numpy.arange(history)
+        self._histRows = self._history.reshape(-1, 3)
+        self._histBase = numpy.arange(max_cursors) * history
+
+        # scratch buffers reused by every update, indexed by slot like the
+        # state: the cursors of a frame are selected by masks, not by slot
+        # lists, so the update only writes into these
+        self._present = numpy.zeros(max_cursors, bool)
+        self._fresh = numpy.zeros(max_cursors, bool)
+        self._vanished = numpy.zeros(max_cursors, bool)
+        self._xy = numpy.zeros((max_cursors, 2))
+        self._moved = numpy.zeros((max_cursors, 2), bool)
+        self._ring = numpy.zeros(max_cursors, numpy.intp)
+        self._counts = numpy.zeros(max_cursors, numpy.intp)
+        self._sample = numpy.zeros((max_cursors, 3))
+        self._presentColumn = self._present[:, None]
+        self._freshColumn = self._fresh[:, None]
+        self._sampleXY = self._sample[:, :2]
+        self._sampleT = self._sample[:, 2]
+        self._scale = numpy.array((WIDTH, -HEIGHT), float)
+        self._offset = numpy.array((0, HEIGHT), float)
+
+        self._startCoords = _CoordsView(self._seen, self._start)
+        self._prevCoords = _CoordsView(self._seen, self._prev)
+        self._coords = _CoordsView(self._seen, self._curr)
+        self._startView = _readonly(self._start)
+        self._prevView = _readonly(self._prev)
+        self._currView = _readonly(self._curr)
+        self._positionsView = _readonly(self._positions)
+        self._activeView = _readonly(self._active)
         
     '''
     FINGER DETECTION
     '''
 
-    def update(self, cursors):
-        vanished = list(self._seen)
+    def update(self, cursors, timestamp=None):
+        '''
+        Apply one TUIO frame. Returns True if a cursor appeared, vanished or
+        moved, False if the frame left every position as it was.
+        '''
+        if timestamp is None:
+            timestamp = monotonic()
+        present, fresh, xy = self._present, self._fresh, self._xy
+        present.fill(False)
+        xy.fill(0.0)
+        n = 0
         for cursor in cursors:
-            id, x, y = cursor.sessionid, cursor.xpos, cursor.ypos
-            x, y = self.convert_coords(x, y)
-            
-            if id in self._seen:
-                # cursor still active
-                vanished.remove(id)
-                if self._coords[id] != (x, y):
-                    self._prevCoords[id] = self._coords[id]
-                    self._coords[id] = (x, y)
-                else:
-                    self._prevCoords[id] = self._coords[id]
-            else:
+            id = cursor.sessionid
+            slot = self._seen.get(id)
+            if slot is None:
                 # found a new cursor
-                taken_slot = self.grabslot()
-                if taken_slot is None:
-                    print 'IGNORING EXCESSIVE CURSOR'
+                slot = self.grabslot()
+                if slot is None:
+                    get_recorder().warning('ignoring cursor %d, all %d slots taken', id, self.max_cursors)
                     continue
-                self._seen[id] = taken_slot
-                self._startCoords[id] = (x,y)
-                self._prevCoords[id] = (x,y)
-                self._coords[id] = (x, y)
-
-        for id in vanished:
-            # the cursor vanished
-            self._startCoords[id] = (self._startCoords[id][0]+2, self._startCoords[id][1]+2)
-            self._prevCoords[id] = (self._prevCoords[id][0]+2, self._prevCoords[id][1]+2)
-            self._coords[id] = (self._coords[id][0]+2, self._coords[id][1]+2)
-            self.freeslot(self._seen[id])
-            del self._startCoords[id]
-            del self._prevCoords[id]
-            del self._coords[id]
-            del self._seen[id]
-            
+                self._seen[id] = slot
+                self._slotIds[slot] = id
+                self._arrival[slot] = self._arrivals
+                self._arrivals += 1
+            present[slot] = True
+            xy[slot, 0] = cursor.xpos
+            xy[slot, 1] = cursor.ypos
+            n += 1
+
+        changed = False
+        if n:
+            self.convert_coords(xy)
+            numpy.greater(present, self._active, out=fresh)
+            if self.filter is not None:
+                self.filter.reset(fresh, xy, timestamp)
+                self.filter.apply(present, xy, timestamp)
+            if fresh.any():
+                changed = True
+                self._order = None
+            else:
+                numpy.not_equal(self._curr, xy, out=self._moved)
+                self._moved &= self._presentColumn
+                changed = bool(self._moved.any())
+            numpy.copyto(self._prev, self._curr, where=self._presentColumn)
+            numpy.copyto(self._curr, xy, where=self._presentColumn)
+            numpy.copyto(self._start, self._curr, where=self._freshColumn)
+            numpy.copyto(self._prev, self._curr, where=self._freshColumn)
+            self.record(present, fresh, timestamp)
+
+        numpy.greater(self._active, present, out=self._vanished)
+        numpy.copyto(self._active, present)
+        if self._vanished.any():
+            # the cursors vanished
+            for slot in numpy.flatnonzero(self._vanished):
+                del self._seen[self._slotIds[slot]]
+                self._slotIds[slot] = None
+                self.freeslot(slot)
+            self._order = None
+            changed = True
+        return changed
+
+    def record(self, present, fresh, timestamp):
+        # append the current positions of the slots in present to their
+        # motion history, those in fresh start a new one
+        size = self._history.shape[1]
+        numpy.copyto(self._histCount, 0, where=fresh)
+        numpy.add(self._histHead, 1, out=self._ring)
+        numpy.remainder(self._ring, size, out=self._ring)
+        numpy.copyto(self._histHead, self._ring, where=present)
+        numpy.add(self._histCount, 1, out=self._counts)
+        numpy.minimum(self._counts, size, out=self._counts)
+        numpy.copyto(self._histCount, self._counts, where=present)
+
+        # every slot writes its newest row, the others write it back unchanged
+        numpy.add(self._histBase, self._histHead, out=self._ring)
+        numpy.take(self._histRows, self._ring, axis=0, out=self._sample)
+        numpy.copyto(self._sampleXY, self._curr, where=self._presentColumn)
+        numpy.copyto(self._sampleT, timestamp, where=present)
+        self._histRows[self._ring] = self._sample
+
     def grabslot(self):
         try:
             return self._freeslots.pop()
@@ -69,9 +307,82 @@ class CursorTracker(object):
     def freeslot(self, slot):
         self._freeslots.appendleft(slot)
 
-    def convert_coords(self, x, y):
-        return (int(x*WIDTH), int(HEIGHT-y*HEIGHT))
+    def convert_coords(self, xy):
+        # normalized TUIO coordinates to whole window pixels, in place
+        xy *= self._scale
+        xy += self._offset
+        numpy.trunc(xy, xy)
             
     def fingers_detected(self):
         return len(self._seen)
-        
\ No newline at end of file
+
+    '''
+    READ-ONLY ARRAY VIEWS, indexed by slot
+    '''
+
+    def active_slots(self):
+        # slots of the live cursors, oldest touch first
+        if self._order is None:
+            slots = numpy.flatnonzero(self._active)
+            self._order = _readonly(slots[numpy.argsort(self._arrival[slots], kind='mergesort')])
+        return self._order
+
+    def active_mask(self):
+        return self._activeView
+
+    def start_positions(self):
+        return self._startView
+
+    def previous_positions(self):
+        return self._prevView
+
+    def positions(self):
+        return self._currView
+
+    def slot_positions(self):
+        # start, previous and current positions stacked as (3, max_cursors, 2)
+        return self._positionsView
+
+    def session_id(self, slot):
+        return self._slotIds[slot]
+
+    '''
+    MOTION ESTIMATES, in pixels per second, zero for slots without enough samples
+    '''
+
+    def velocities(self):
+        # least squares slope of position over time across each slot's history
+        size = self._history.shape[1]
+        ages = (self._histHead[:, None] - self._histIndex[None, :]) % size
+        weights = (ages < self._histCount[:, None]) & self._active[:, None]
+        t = self._history[:, :, 2]
+        samples = numpy.maximum(weights.sum(1), 1)
+        tmean = (t * weights).sum(1) / samples
+        dt = (t - tmean[:, None]) * weights
+        denom = (dt * dt).sum(1)
+        denom[denom == 0] = numpy.inf
+        return (dt[:, :, None] * self._history[:, :, :2]).sum(1) / denom[:, None]
+
+    def accelerations(self):
+        # second difference of the three newest samples
+        size = self._history.shape[1]
+        rows = numpy.arange(self.max_cursors)
+        p0 = self._history[rows, self._histHead]
+        p1 = self._history[rows, (self._histHead - 1) % size]
+        p2 = self._history[rows, (self._histHead - 2) % size]
+        dt01 = p0[:, 2] - p1[:, 2]
+        dt12 = p1[:, 2] - p2[:, 2]
+        valid = self._active & (self._histCount >= 3) & (dt01 > 0) & (dt12 > 0)
+        dt01[~valid] = dt12[~valid] = 1.0
+        v01 = (p0[:, :2] - p1[:, :2]) / dt01[:, None]
+        v12 = (p1[:, :2] - p2[:, :2]) / dt12[:, None]
+        accel = (v01 - v12) / (0.5 * (dt01 + dt12))[:, None]
+        accel[~valid] = 0.0
+        return accel
+
+    def history(self, slot):
+        # the slot's samples as (x, y, t) rows, oldest first
+        size = self._history.shape[1]
+        count = self._histCount[slot]
+        order = (self._histHead[slot] - numpy.arange(count)[::-1]) % size
+        return self._history[slot, order]
@@ -5,16 +5,12 @@ A small number will be used to represent cursors.
 
 import vtk
 import math
-from MultiTouch import CursorTracker
+from MultiTouch import CursorTracker, WIDTH, HEIGHT
+from Interaction import SceneIntent, TripleBuffer
+from DemoContext import DemoContext
+from Instrumentation import TRACK, GESTURE, QUEUE, CAMERA
+from Gestures import GestureEngine, NONE, TOUCH, TERMINATE
 
-try:
-    import tuio
-except ImportError, ioe:
-    print >>sys.stderr, """
-    You have to install PyTUIO and copy it into your $PYTHONPATH.
-    You can grab a tarball from: http://code.google.com/p/pytuio/
-    """
-    sys.exit(2)
         
 class Marker:
     def __init__(self, id):
@@ -33,15 +29,15 @@ class Marker:
 
 class MultiTouchTest:
 
-    def __init__(self):
+    def __init__(self, context=None):
 
-        # Create the Renderer, RenderWindow, etc. and set the Picker.
+        # Create the Renderer, take the RenderWindow etc. from the context
+        # (shared with the other demos when there is one) and set the Picker.
+        self.context = context or DemoContext()
         self.ren = vtk.vtkRenderer()
-        self.renwin = vtk.vtkRenderWindow()
-        self.renwin.AddRenderer(self.ren)
+        self.renwin = self.context.renwin
         self.ren.SetViewport(0,0,1,1)
-        self.iren = vtk.vtkRenderWindowInteractor()
-        self.iren.SetRenderWindow(self.renwin)
+        self.iren = self.context.iren
         
         # Create text mappers and 2d actors to display finger position.
         self.fingerMarker1 = Marker("(1)")
@@ -57,153 +53,104 @@ class MultiTouchTest:
         self.ren.AddActor2D(self.fingerMarker4.textActor)
         self.ren.AddActor2D(self.fingerMarker5.textActor)
         self.ren.SetBackground(0, 0, 0)
-        self.renwin.SetSize(680, 460)
+        # the window is sized to the touch area when the demo is shown
+        self.size = (WIDTH, HEIGHT)
         #self.renwin.FullScreenOn()
         
         '''
         TUIO STUFF
         '''
-        self.tracking = tuio.Tracking('')
+        # the socket, input thread, stats and log belong to the context
+        self.stats = self.context.stats
+        self.log = self.context.log
+        self.tracking = self.context.tracking
+        self.input = self.context.input
         self.tracker = CursorTracker(8)
+        self.gestures = GestureEngine(self.tracker, {0: NONE, 1: TOUCH, 2: TOUCH, 3: TOUCH, 4: TOUCH, 5: TOUCH, 8: TERMINATE})
+        self.gestures.on_transition(lambda old, new: self.log.info('gesture %s -> %s', old, new))
+        self.gestures.on(NONE, self.NoFingers)
+        self.gestures.on(TOUCH, self.OnTouch)
+        self.gestures.on(TERMINATE, self.OnTerminate)
+        self.fingerMarkers = [self.fingerMarker1, self.fingerMarker2, self.fingerMarker3, self.fingerMarker4, self.fingerMarker5]
+
+        # gesture handlers run on the input thread and only record what the
+        # scene should become, the render thread applies the newest record
+        self.intent = SceneIntent(len(self.fingerMarkers))
+        self.intents = TripleBuffer(lambda: SceneIntent(len(self.fingerMarkers)))
+        
+        # the scene is marked dirty when an intent is applied, the scheduler renders it
+        self.scheduler = self.context.scheduler
         self.terminate = False
         
     def Start(self):
-        self.renwin.Render()
+        self.Reset()
+        self.context.activate(self)
+        self.scheduler.render()
         self.RunTUIO()
         
+    def Reset(self):
+        # forget the fingers and the close gesture left over from the last run
+        self.terminate = False
+        self.intent.terminate = False
+        self.intents.read(0)
+        self.gestures.reset()
+        self.intent.markerCount = 0
+        self.ShowMarkers(self.intent)
+
     def RunTUIO(self):
         while not self.terminate :
-            while self.tracking.update():
-                # read the socket empty
-                pass
+            # sleep until the input thread publishes a new scene state or a
+            # pending render is due
+            intent = self.intents.read(self.scheduler.timeout())
+            if intent is not None:
+                self.ApplyIntent(intent)
+            self.scheduler.service()
 
-            self.tracker.update(self.tracking.cursors())
-            self.CheckGesture()
+    def OnInput(self, timestamp, cursors):
+        # input thread: track the fingers, run the gestures, publish the result
+        start = self.stats.clock()
+        if self.tracker.update(cursors, timestamp) or self.gestures.pending():
+            start = self.stats.lap(TRACK, start)
+            self.gestures.process()
+            self.stats.lap(GESTURE, start)
+            self.intent.stamp = timestamp
+            self.intents.publish(self.intent)
 
-    def CheckGesture(self):
-        
-        if self.tracker.fingers_detected() == 0:
-            print "No Fingers Detected"
-            self.fingerMarker1.textActor.VisibilityOff()
-            self.fingerMarker2.textActor.VisibilityOff()
-            self.fingerMarker3.textActor.VisibilityOff()
-            self.fingerMarker4.textActor.VisibilityOff()
-            self.fingerMarker5.textActor.VisibilityOff()
-            self.renwin.Render()
-        
-        elif self.tracker.fingers_detected() == 1:
-            print "1 Finger Detected"
-            fingerID1 = self.tracker._seen.keys()[0]
-            finger1CurrCoords = self.tracker._coords[fingerID1]
-            
-            # show finger marker
-            self.fingerMarker1.textActor.SetPosition(finger1CurrCoords[:2])
-            self.fingerMarker1.textActor.VisibilityOn()
-            
-            # hide all other markers
-            self.fingerMarker2.textActor.VisibilityOff()
-            self.fingerMarker3.textActor.VisibilityOff()
-            self.fingerMarker4.textActor.VisibilityOff()
-            self.fingerMarker5.textActor.VisibilityOff()
-            self.renwin.Render()
-                    
-        elif self.tracker.fingers_detected() == 2:
-            print "2 Fingers Detected"
-            fingerID1 = self.tracker._seen.keys()[0]
-            fingerID2 = self.tracker._seen.keys()[1]
-            finger1CurrCoords = self.tracker._coords[fingerID1]
-            finger2CurrCoords = self.tracker._coords[fingerID2]
-            
-            # show finger marker
-            self.fingerMarker1.textActor.SetPosition(finger1CurrCoords[:2])
-            self.fingerMarker2.textActor.SetPosition(finger2CurrCoords[:2])
-            self.fingerMarker1.textActor.VisibilityOn()
-            self.fingerMarker2.textActor.VisibilityOn()
-            
-            # hide all other markers
-            self.fingerMarker3.textActor.VisibilityOff()
-            self.fingerMarker4.textActor.VisibilityOff()
-            self.fingerMarker5.textActor.VisibilityOff()
-            self.renwin.Render()
-            
-        elif self.tracker.fingers_detected() == 3:
-            print "3 Fingers Detected"
-            fingerID1 = self.tracker._seen.keys()[0]
-            fingerID2 = self.tracker._seen.keys()[1]
-            fingerID3 = self.tracker._seen.keys()[2]
-            finger1CurrCoords = self.tracker._coords[fingerID1]
-            finger2CurrCoords = self.tracker._coords[fingerID2]
-            finger3CurrCoords = self.tracker._coords[fingerID3]
-            
-            # show finger marker
-            self.fingerMarker1.textActor.SetPosition(finger1CurrCoords[:2])
-            self.fingerMarker2.textActor.SetPosition(finger2CurrCoords[:2])
-            self.fingerMarker3.textActor.SetPosition(finger3CurrCoords[:2])
-            self.fingerMarker1.textActor.VisibilityOn()
-            self.fingerMarker2.textActor.VisibilityOn()
-            self.fingerMarker3.textActor.VisibilityOn()
-            
-            # hide all other markers
-            self.fingerMarker4.textActor.VisibilityOff()
-            self.fingerMarker5.textActor.VisibilityOff()
-            self.renwin.Render()
-            
-        elif self.tracker.fingers_detected() == 4:
-            print "4 Fingers Detected"
-            fingerID1 = self.tracker._seen.keys()[0]
-            fingerID2 = self.tracker._seen.keys()[1]
-            fingerID3 = self.tracker._seen.keys()[2]
-            fingerID4 = self.tracker._seen.keys()[3]
-            finger1CurrCoords = self.tracker._coords[fingerID1]
-            finger2CurrCoords = self.tracker._coords[fingerID2]
-            finger3CurrCoords = self.tracker._coords[fingerID3]
-            finger4CurrCoords = self.tracker._coords[fingerID4]
-            
-            # show finger marker
-            self.fingerMarker1.textActor.SetPosition(finger1CurrCoords[:2])
-            self.fingerMarker2.textActor.SetPosition(finger2CurrCoords[:2])
-            self.fingerMarker3.textActor.SetPosition(finger3CurrCoords[:2])
-            self.fingerMarker4.textActor.SetPosition(finger4CurrCoords[:2])
-            self.fingerMarker1.textActor.VisibilityOn()
-            self.fingerMarker2.textActor.VisibilityOn()
-            self.fingerMarker3.textActor.VisibilityOn()
-            self.fingerMarker4.textActor.VisibilityOn()
-            
-            # hide all other markers
-            self.fingerMarker5.textActor.VisibilityOff()
-            self.renwin.Render()
-            
-        elif self.tracker.fingers_detected() == 5:
-            print "5 Fingers Detected"
-            fingerID1 = self.tracker._seen.keys()[0]
-            fingerID2 = self.tracker._seen.keys()[1]
-            fingerID3 = self.tracker._seen.keys()[2]
-            fingerID4 = self.tracker._seen.keys()[3]
-            fingerID5 = self.tracker._seen.keys()[4]
-            finger1CurrCoords = self.tracker._coords[fingerID1]
-            finger2CurrCoords = self.tracker._coords[fingerID2]
-            finger3CurrCoords = self.tracker._coords[fingerID3]
-            finger4CurrCoords = self.tracker._coords[fingerID4]
-            finger5CurrCoords = self.tracker._coords[fingerID5]
-            
-            # show finger marker
-            self.fingerMarker1.textActor.SetPosition(finger1CurrCoords[:2])
-            self.fingerMarker2.textActor.SetPosition(finger2CurrCoords[:2])
-            self.fingerMarker3.textActor.SetPosition(finger3CurrCoords[:2])
-            self.fingerMarker4.textActor.SetPosition(finger4CurrCoords[:2])
-            self.fingerMarker5.textActor.SetPosition(finger5CurrCoords[:2])
-            self.fingerMarker1.textActor.VisibilityOn()
-            self.fingerMarker2.textActor.VisibilityOn()
-            self.fingerMarker3.textActor.VisibilityOn()
-            self.fingerMarker4.textActor.VisibilityOn()
-            self.fingerMarker5.textActor.VisibilityOn()
-            self.renwin.Render()
-            
-        elif self.tracker.fingers_detected() == 8:
+    def ApplyIntent(self, intent):
+        # render thread: bring the scene up to date with the newest intent
+        start = self.stats.lap(QUEUE, intent.stamp)
+        self.ShowMarkers(intent)
+        if intent.terminate:
             self.terminate = True
+        self.stats.lap(CAMERA, start)
+        self.scheduler.mark_dirty(intent.stamp)
+
+    def ShowMarkers(self, intent):
+        # one marker per finger, in touch order
+        for i, marker in enumerate(self.fingerMarkers):
+            if i < intent.markerCount:
+                marker.textActor.SetPosition(intent.markers[i])
+                marker.textActor.VisibilityOn()
+            else:
+                marker.textActor.VisibilityOff()
+
+    def NoFingers(self, frame):
+        self.log.debug('no fingers')
+        self.intent.set_markers(frame.positions)
+
+    def OnTouch(self, frame):
+        self.log.debug('%d fingers', frame.count)
+        self.intent.set_markers(frame.positions)
+
+    def OnTerminate(self, frame):
+        self.intent.terminate = True
         
     def Kill(self):
         print "Stopping TestDemo TUIO tracking"
-        self.tracking.stop()
+        self.log.flush()
+        print "%.1f renders/s" % self.scheduler.renders_per_second()
+        if self.stats.enabled:
+            print self.stats.report()
+            print "Latency histograms written to %s" % self.stats.dump("MultiTouchTest")
+        self.context.stop()
         print "TestDemo.py Terminated"
-        self.iren.GetRenderWindow().Finalize()
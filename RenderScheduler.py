@@ -0,0 +1,100 @@
+'''
+RenderScheduler.py decides when a demo's render window is redrawn.
+
+Gesture handlers never call Render() themselves. They mark the scene dirty
+and the demo loop calls service(), which renders at most once per display
+interval and only if something changed since the last frame. While nothing
+is dirty the loop can sleep for as long as it likes (idle mode), timeout()
+tells it for how long.
+
+render() times every Render() call. frameTime is a running average of the
+last few, which is what the level of detail controllers steer by. With instrumentation on,
+each Render() and the time from the arrival of the oldest input it shows to
+the end of the Render() also go into the stats histograms.
+'''
+
+from Clock import monotonic
+from Instrumentation import NULL_STATS, RENDER, LATENCY
+from FlightRecorder import get_recorder
+
+MAX_FPS = 60.0
+
+# how long an idle demo loop sleeps between checks of its exit conditions
+IDLE_TIMEOUT = 0.5
+
+# weight of the newest Render() duration in frameTime
+FRAME_TIME_SMOOTHING = 0.3
+
+class RenderScheduler(object):
+    def __init__(self, renwin, max_fps=MAX_FPS, idle_timeout=IDLE_TIMEOUT, stats=NULL_STATS):
+        self.renwin = renwin
+        self.stats = stats
+        self.log = get_recorder()
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self.idle_timeout = idle_timeout
+        self.dirty = False
+        self.requests = 0
+        self.renders = 0
+        self.frameTime = 0.0
+        self.lastFrameTime = 0.0
+        self._last = None
+        self._stamp = None
+        self._start = monotonic()
+
+    def mark_dirty(self, stamp=None):
+        # stamp is the arrival time of the input that made the scene dirty
+        self.dirty = True
+        self.requests += 1
+        if stamp and self._stamp is None:
+            self._stamp = stamp
+
+    def due(self, now=None):
+        if not self.dirty:
+            return False
+        if self._last is None:
+            return True
+        if now is None:
+            now = monotonic()
+        return now - self._last >= self.interval
+
+    def service(self):
+        '''
+        Render if the scene is dirty and the frame rate cap allows it.
+        Returns True if a frame was rendered.
+        '''
+        now = monotonic()
+        if not self.due(now):
+            return False
+        self.render(now)
+        return True
+
+    def render(self, now=None):
+        # render right away, regardless of the dirty flag and the cap
+        self.dirty = False
+        self._last = monotonic() if now is None else now
+        self.renders += 1
+        start = monotonic()
+        self.renwin.Render()
+        end = monotonic()
+        elapsed = end - start
+        self.stats.record(RENDER, elapsed)
+        self.log.debug('frame %d rendered in %.1f ms', self.renders, 1e3 * elapsed)
+        if self._stamp is not None:
+            self.stats.record(LATENCY, end - self._stamp)
+            self._stamp = None
+        if self.renders == 1:
+            self.frameTime = elapsed
+        else:
+            self.frameTime += FRAME_TIME_SMOOTHING * (elapsed - self.frameTime)
+        self.lastFrameTime = elapsed
+
+    def timeout(self):
+        # how long the demo loop may block waiting for input
+        if not self.dirty:
+            return self.idle_timeout
+        if self._last is None:
+            return 0.0
+        return max(0.0, self._last + self.interval - monotonic())
+
+    def renders_per_second(self):
+        return self.renders / max(monotonic() - self._start, 1e-6)
@@ -6,19 +6,25 @@ represent the skin and bone, creates three orthogonal planes
 
 import vtk
 import math
-from MultiTouch import CursorTracker
-
-try:
-    import tuio
-except ImportError, ioe:
-    print >>sys.stderr, """
-    You have to install PyTUIO and copy it into your $PYTHONPATH.
-    You can grab a tarball from: http://code.google.com/p/pytuio/
-    """
-    sys.exit(2)
+import numpy
+from VolumeCache import open_volume
+from IsosurfaceCache import get_isosurface_cache
+from LazyPipeline import LazyActor
+from SlicePlanes import precolored, SlicePlane, facing_plane, SAGITTAL, CORONAL, AXIAL
+from MultiTouch import CursorTracker, OneEuroFilter, WIDTH as TOUCH_WIDTH
+from Interaction import SceneIntent, TripleBuffer
+from DemoContext import DemoContext
+from Instrumentation import TRACK, GESTURE, QUEUE, CAMERA
+from Gestures import GestureEngine, NONE, ROTATE, MANIPULATE, SLICE, TERMINATE
+
     
 WIDTH = 480
 HEIGHT = 640
+
+# two fingers put down this close to the right edge scroll the slice plane
+# facing the camera through the volume, by SLICE_RATE slices per pixel
+SLICE_EDGE = 0.85 * TOUCH_WIDTH
+SLICE_RATE = 0.2
     
 class Marker:
     def __init__(self, id):
@@ -36,85 +42,48 @@ class Marker:
         self.textActor.SetMapper(self.textMapper)
 
 class SingleSlice:
-    def __init__(self):
+    def __init__(self, context=None):
 
-        # Create the renderer, the render window, and the interactor. The
+        # Create the renderer. The render window and the interactor come from
+        # the context, which other demos may share (see DemoContext.py). The
         # renderer draws into the render window, the interactor enables mouse-
         # and keyboard-based interaction with the scene.
+        self.context = context or DemoContext()
         self.ren = vtk.vtkRenderer()
-        self.renwin = vtk.vtkRenderWindow()
-        self.renwin.AddRenderer(self.ren)
-        self.iren = vtk.vtkRenderWindowInteractor()
-        self.iren.SetRenderWindow(self.renwin)
+        self.renwin = self.context.renwin
+        self.iren = self.context.iren
         
         # Create text mappers and 2d actors to display finger position.
         self.fingerMarker1 = Marker("(1)")
         self.fingerMarker2 = Marker("(2)")
         self.fingerMarker3 = Marker("(3)")
 
-        # The following reader is used to read a series of 2D slices (images)
-        # that compose the volume. The slice dimensions are set, and the
-        # pixel spacing. The data Endianness must also be specified. The reader
-        # usese the FilePrefix in combination with the slice number to construct
-        # filenames using the format FilePrefix.%d. (In this case the FilePrefix
-        # is the root name of the file: quarter.)
-        self.v16 = vtk.vtkVolume16Reader()
-        self.v16.SetDataDimensions(64, 64)
-        self.v16.SetDataByteOrderToLittleEndian()
-        self.v16.SetFilePrefix("/Users/eddie/Programming/Python/python-vtk-tuio/headsq/Data_headsq_quarter")
-        self.v16.SetImageRange(1, 93)
-        self.v16.SetDataSpacing(3.2, 3.2, 1.5)
-
-        # An isosurface, or contour value of 500 is known to correspond to the
-        # skin of the patient. Once generated, a vtkPolyDataNormals filter is
-        # is used to create normals for smooth surface shading during rendering.
-        # The triangle stripper is used to create triangle strips from the
-        # isosurface these render much faster on may systems.
-        self.skinExtractor = vtk.vtkContourFilter()
-        self.skinExtractor.SetInputConnection(self.v16.GetOutputPort())
-        self.skinExtractor.SetValue(0, 500)
-        self.skinNormals = vtk.vtkPolyDataNormals()
-        self.skinNormals.SetInputConnection(self.skinExtractor.GetOutputPort())
-        self.skinNormals.SetFeatureAngle(60.0)
-        self.skinStripper = vtk.vtkStripper()
-        self.skinStripper.SetInputConnection(self.skinNormals.GetOutputPort())
-        self.skinMapper = vtk.vtkPolyDataMapper()
-        self.skinMapper.SetInputConnection(self.skinStripper.GetOutputPort())
-        self.skinMapper.ScalarVisibilityOff()
+        # The volume is a series of 2D slices (images) of 16 bit pixels, named
+        # FilePrefix.%d, headsq's 64x64 little-endian slices unless the
+        # context was given another stack. The first time it is opened the
+        # slices are read in parallel and converted into a single volume file
+        # next to them, from then on that file is memory-mapped and imported
+        # into VTK without reading or copying the slices again.
+        self.volume = open_volume(*self.context.volume)
+
+        # The filters behind the skin, bone and outline actors are only made,
+        # and run, the first time each actor is made visible (see
+        # LazyPipeline.py and the Build methods below). Until then an actor
+        # is just its look.
+        self.surfaces = get_isosurface_cache()
         self.skin = vtk.vtkActor()
-        self.skin.SetMapper(self.skinMapper)
         self.skin.GetProperty().SetDiffuseColor(1, .49, .25)
         self.skin.GetProperty().SetSpecular(.3)
         self.skin.GetProperty().SetSpecularPower(20)
+        self.skinStage = LazyActor(self.skin, self.BuildSkin)
 
-        # An isosurface, or contour value of 1150 is known to correspond to the
-        # skin of the patient. Once generated, a vtkPolyDataNormals filter is
-        # is used to create normals for smooth surface shading during rendering.
-        # The triangle stripper is used to create triangle strips from the
-        # isosurface these render much faster on may systems.
-        self.boneExtractor = vtk.vtkContourFilter()
-        self.boneExtractor.SetInputConnection(self.v16.GetOutputPort())
-        self.boneExtractor.SetValue(0, 1150)
-        self.boneNormals = vtk.vtkPolyDataNormals()
-        self.boneNormals.SetInputConnection(self.boneExtractor.GetOutputPort())
-        self.boneNormals.SetFeatureAngle(60.0)
-        self.boneStripper = vtk.vtkStripper()
-        self.boneStripper.SetInputConnection(self.boneNormals.GetOutputPort())
-        self.boneMapper = vtk.vtkPolyDataMapper()
-        self.boneMapper.SetInputConnection(self.boneStripper.GetOutputPort())
-        self.boneMapper.ScalarVisibilityOff()
         self.bone = vtk.vtkActor()
-        self.bone.SetMapper(self.boneMapper)
         self.bone.GetProperty().SetDiffuseColor(1, 1, .9412)
+        self.boneStage = LazyActor(self.bone, self.BuildBone)
 
-        # An outline provides context around the data.
-        self.outlineData = vtk.vtkOutlineFilter()
-        self.outlineData.SetInputConnection(self.v16.GetOutputPort())
-        self.mapOutline = vtk.vtkPolyDataMapper()
-        self.mapOutline.SetInputConnection(self.outlineData.GetOutputPort())
         self.outline = vtk.vtkActor()
-        self.outline.SetMapper(self.mapOutline)
         self.outline.GetProperty().SetColor(0, 0, 0)
+        self.outlineStage = LazyActor(self.outline, self.BuildOutline)
 
         # Now we are creating three orthogonal planes passing through the
         # volume. Each plane uses a different texture map and therefore has
@@ -128,57 +97,29 @@ class SingleSlice:
         self.bwLut.SetValueRange(0, 1)
         self.bwLut.Build()
 
-        # Now create a lookup table that consists of the full hue circle (from
-        # HSV).
-        self.hueLut = vtk.vtkLookupTable()
-        self.hueLut.SetTableRange(0, 2000)
-        self.hueLut.SetHueRange(0, 1)
-        self.hueLut.SetSaturationRange(1, 1)
-        self.hueLut.SetValueRange(1, 1)
-        self.hueLut.Build()
-
-        # Finally, create a lookup table with a single hue but having a range
-        # in the saturation of the hue.
-        self.satLut = vtk.vtkLookupTable()
-        self.satLut.SetTableRange(0, 2000)
-        self.satLut.SetHueRange(.6, .6)
-        self.satLut.SetSaturationRange(0, 1)
-        self.satLut.SetValueRange(1, 1)
-        self.satLut.Build()
-
-        # Create the first of the three planes. The filter vtkImageMapToColors
-        # maps the data through the corresponding lookup table created above.
-        # The vtkImageActor is a type of vtkProp and conveniently displays an
-        # image on a single quadrilateral plane. It does this using texture
-        # mapping and as a result is quite fast. (Note: the input image has to
-        # be unsigned char values, which the vtkImageMapToColors produces.)
-        # Note also that by specifying the DisplayExtent, the pipeline
-        # requests data of this extent and the vtkImageMapToColors only
-        # processes a slice of data.
-        self.sagittalColors = vtk.vtkImageMapToColors()
-        self.sagittalColors.SetInputConnection(self.v16.GetOutputPort())
-        self.sagittalColors.SetLookupTable(self.bwLut)
+        # Create the first of the three planes. The whole volume is mapped
+        # through the corresponding lookup table created above once, into an
+        # RGBA volume that is shared by every demo using the same table (see
+        # SlicePlanes.py). The vtkImageActor is a type of vtkProp and
+        # conveniently displays an image on a single quadrilateral plane. It
+        # does this using texture mapping and as a result is quite fast.
+        # (Note: the input image has to be unsigned char values, which the
+        # coloured volume is.) The SlicePlane picks the slice shown through
+        # the actor's DisplayExtent, so moving it maps no colours at all.
+        self.sagittalColors = precolored(self.volume, self.bwLut)
         self.sagittal = vtk.vtkImageActor()
         self.sagittal.GetMapper().SetInputConnection(self.sagittalColors.GetOutputPort())
-        self.sagittal.SetDisplayExtent(32, 32, 0, 63, 0, 92)
+        self.sagittalPlane = SlicePlane(self.sagittal, self.volume.GetWholeExtent(), SAGITTAL)
 
-        # Create the second (axial) plane of the three planes. We use the same
-        # approach as before except that the extent differs.
-        self.axialColors = vtk.vtkImageMapToColors()
-        self.axialColors.SetInputConnection(self.v16.GetOutputPort())
-        self.axialColors.SetLookupTable(self.hueLut)
+        # The axial and coronal planes are not shown by this demo either, their
+        # lookup tables and colour maps are made when they are first shown.
         self.axial = vtk.vtkImageActor()
-        self.axial.GetMapper().SetInputConnection(self.axialColors.GetOutputPort())
-        self.axial.SetDisplayExtent(0, 63, 0, 63, 46, 46)
-
-        # Create the third (coronal) plane of the three planes. We use the same
-        # approach as before except that the extent differs.
-        self.coronalColors = vtk.vtkImageMapToColors()
-        self.coronalColors.SetInputConnection(self.v16.GetOutputPort())
-        self.coronalColors.SetLookupTable(self.satLut)
+        self.axialStage = LazyActor(self.axial, self.BuildAxial)
+        self.axialPlane = SlicePlane(self.axial, self.volume.GetWholeExtent(), AXIAL)
         self.coronal = vtk.vtkImageActor()
-        self.coronal.GetMapper().SetInputConnection(self.coronalColors.GetOutputPort())
-        self.coronal.SetDisplayExtent(0, 63, 32, 32, 0, 92)
+        self.coronalStage = LazyActor(self.coronal, self.BuildCoronal)
+        self.coronalPlane = SlicePlane(self.coronal, self.volume.GetWholeExtent(), CORONAL)
+        self.planes = [self.sagittalPlane, self.axialPlane, self.coronalPlane]
 
         # move camera to view sagital slice 
         self.aCamera = vtk.vtkCamera()
@@ -209,10 +150,11 @@ class SingleSlice:
         self.ren.ResetCamera()
         self.aCamera.Dolly(1.5)
 
-        # Set a background color for the renderer and set the size of the
-        # render window (expressed in pixels).
+        # Set a background color for the renderer and the size of the
+        # render window (expressed in pixels), which the context applies
+        # when the demo is shown.
         self.ren.SetBackground(1, 1, 1)
-        self.renwin.SetSize(640, 480)
+        self.size = (640, 480)
         #self.renwin.FullScreenOn()
 
         # Note that when camera movement occurs (as it does in the Dolly()
@@ -226,178 +168,243 @@ class SingleSlice:
         '''
         TUIO STUFF
         '''
-        self.tracking = tuio.Tracking('')
-        self.tracker = CursorTracker(4)
-        self.terminate = False
-
-    def Start(self):
-        self.renwin.Render()
-        self.RunTUIO()
+        # the socket, input thread, stats and log belong to the context
+        self.stats = self.context.stats
+        self.log = self.context.log
+        self.tracking = self.context.tracking
+        self.input = self.context.input
+        # smooth tracker jitter so a resting hand does not re-render the scene
+        self.tracker = CursorTracker(4, filter=OneEuroFilter(4))
+        self.gestures = GestureEngine(self.tracker, {0: NONE, 1: ROTATE, 2: self.TwoFingers, 3: MANIPULATE, 4: TERMINATE})
+        self.gestures.on_transition(lambda old, new: self.log.info('gesture %s -> %s', old, new))
+        self.gestures.on(NONE, self.NoFingers)
+        self.gestures.on(ROTATE, self.OnRotate)
+        self.gestures.on(MANIPULATE, self.OnManipulate)
+        self.gestures.on(SLICE, self.OnSlice)
+        self.gestures.on(TERMINATE, self.OnTerminate)
+        self.fingerMarkers = [self.fingerMarker1, self.fingerMarker2, self.fingerMarker3]
+
+        # gesture handlers run on the input thread and only record what the
+        # scene should become, the render thread applies the newest record
+        self.intent = SceneIntent(len(self.fingerMarkers))
+        self.intents = TripleBuffer(lambda: SceneIntent(len(self.fingerMarkers)))
+        self.applied = numpy.zeros(6)
         
-    def RunTUIO(self):
-        while not self.terminate :
-            while self.tracking.update():
-                # read the socket empty
-                pass
+        # the scene is marked dirty when an intent is applied, the scheduler renders it
+        self.scheduler = self.context.scheduler
+        self.appliedSlice = 0.0
+        self.terminate = False
 
-            self.tracker.update(self.tracking.cursors())
-            self.CheckGesture()
-            
-    def CheckGesture(self):
-        self.NONE = 0 
-        self.ROTATE = 1 
-        self.ZOOM = 2
-        self.PAN = 3
-        self.TERMINATE = 4
-        
-        if self.tracker.fingers_detected() == self.NONE:
-            print "No Fingers Detected"
-            self.fingerMarker1.textActor.VisibilityOff()
-            self.fingerMarker2.textActor.VisibilityOff()
-            self.fingerMarker3.textActor.VisibilityOff()
-            self.renwin.Render()
-        
-        elif self.tracker.fingers_detected() == self.ROTATE:
-            print "Rotating"
-            fingerID1 = self.tracker._seen.keys()[0]
-            fingerPrevCoords = self.tracker._prevCoords[fingerID1]
-            fingerCurrCoords = self.tracker._coords[fingerID1]
-            
-            # show finger marker
-            self.fingerMarker1.textActor.SetPosition(fingerCurrCoords[:2])
-            self.fingerMarker1.textActor.VisibilityOn()
-            
-            # hide all other markers
-            self.fingerMarker2.textActor.VisibilityOff()
-            self.fingerMarker3.textActor.VisibilityOff()
-            
-            self.Rotate(self.ren, self.renwin, self.ren.GetActiveCamera(), fingerPrevCoords[0]/10, fingerPrevCoords[1]/10, fingerCurrCoords[0]/10, fingerCurrCoords[1]/10)
-
-        elif self.tracker.fingers_detected() == self.ZOOM:
-            '''
-            BUG DESCRIPTION: zooming in/out depends on dollyFactor >/< 1 respectively. 
-                             if user zooms out and dollyFactor reaches some value n, where n<1,
-                             and then begins to zoom in, the camera will continue to zoom out even 
-                             though n is increasing. Only after n>=1 will the camera begin to zoom in.
-                             The same effect occurs for the inverse.
-            
-            BUG STATUS: not fixed, in progress
-            '''
-            
-            #print "Zooming"
-            fingerID1 = self.tracker._seen.keys()[0]
-            fingerID2 = self.tracker._seen.keys()[1]
-            
-            finger1StartCoords = self.tracker._startCoords[fingerID1]
-            finger1PrevCoords = self.tracker._prevCoords[fingerID1]
-            finger1CurrCoords = self.tracker._coords[fingerID1]
-            
-            finger2StartCoords = self.tracker._startCoords[fingerID2]
-            finger2PrevCoords = self.tracker._prevCoords[fingerID2]
-            finger2CurrCoords = self.tracker._coords[fingerID2]
+    def BuildSkin(self, actor):
+        # An isosurface, or contour value of 500 is known to correspond to the
+        # skin of the patient. Once generated, a vtkPolyDataNormals filter is
+        # is used to create normals for smooth surface shading during rendering.
+        # The triangle stripper is used to create triangle strips from the
+        # isosurface these render much faster on may systems. The finished
+        # surfaces are cached on disk (see IsosurfaceCache.py), so this only
+        # runs the first time a volume is shown. The skin and bone are
+        # extracted together, on all cores for a large volume (see
+        # IsosurfaceEngine.py), and the bone waits on disk until it is shown.
+        self.surfaces.extract(self.volume, (500, 1150), 60.0)
+        self.skinSurface = self.surfaces.surface(self.volume, 500, 60.0)
+        self.skinMapper = vtk.vtkPolyDataMapper()
+        self.skinMapper.SetInputConnection(self.skinSurface.GetOutputPort())
+        self.skinMapper.ScalarVisibilityOff()
+        actor.SetMapper(self.skinMapper)
 
-            # calculate distance between the finger1's current position and finger2's starting position
-            startDist = math.sqrt( (finger1CurrCoords[0] - finger2StartCoords[0])**2 + (finger1CurrCoords[1] - finger2StartCoords[1])**2 )
+    def BuildBone(self, actor):
+        # An isosurface, or contour value of 1150 is known to correspond to the
+        # bone of the patient, built the same way as the skin.
+        self.surfaces.extract(self.volume, (500, 1150), 60.0)
+        self.boneSurface = self.surfaces.surface(self.volume, 1150, 60.0)
+        self.boneMapper = vtk.vtkPolyDataMapper()
+        self.boneMapper.SetInputConnection(self.boneSurface.GetOutputPort())
+        self.boneMapper.ScalarVisibilityOff()
+        actor.SetMapper(self.boneMapper)
 
-            # calculate distance between the finger1's current position and finger2's current position
-            currentDist = math.sqrt( (finger1CurrCoords[0] - finger2CurrCoords[0])**2 + (finger1CurrCoords[1] - finger2CurrCoords[1])**2 )
+    def BuildOutline(self, actor):
+        # An outline provides context around the data.
+        self.outlineData = vtk.vtkOutlineFilter()
+        self.outlineData.SetInputConnection(self.volume.GetOutputPort())
+        self.mapOutline = vtk.vtkPolyDataMapper()
+        self.mapOutline.SetInputConnection(self.outlineData.GetOutputPort())
+        actor.SetMapper(self.mapOutline)
 
-            # show finger markers
-            self.fingerMarker1.textActor.SetPosition(finger1CurrCoords[:2])
-            self.fingerMarker2.textActor.SetPosition(finger2CurrCoords[:2])
-            self.fingerMarker2.textActor.VisibilityOn()  
-            
-            # hide all other markers
-            self.fingerMarker3.textActor.VisibilityOff() 
+    def BuildAxial(self, actor):
+        # Now create a lookup table that consists of the full hue circle (from
+        # HSV).
+        self.hueLut = vtk.vtkLookupTable()
+        self.hueLut.SetTableRange(0, 2000)
+        self.hueLut.SetHueRange(0, 1)
+        self.hueLut.SetSaturationRange(1, 1)
+        self.hueLut.SetValueRange(1, 1)
+        self.hueLut.Build()
 
-            if finger1CurrCoords != finger1PrevCoords or finger2CurrCoords != finger2PrevCoords:
-                self.Zoom(self.ren, self.renwin, self.ren.GetActiveCamera(), startDist, currentDist)
-            else:
-                #print 'WILL NOT ZOOM. No change in finger position.'
-                pass
-            
-        elif self.tracker.fingers_detected() == self.PAN:
-            print "Panning"
-            fingerID1 = self.tracker._seen.keys()[0]
-            fingerID2 = self.tracker._seen.keys()[1]
-            fingerID3 = self.tracker._seen.keys()[2]
-            
-            finger1PrevCoords = self.tracker._prevCoords[fingerID1]
-            finger1CurrCoords = self.tracker._coords[fingerID1]
-            
-            finger2PrevCoords = self.tracker._prevCoords[fingerID2]
-            finger2CurrCoords = self.tracker._coords[fingerID2]
+        # Create the second (axial) plane of the three planes. We use the same
+        # approach as for the sagittal plane except that the extent differs.
+        self.axialColors = precolored(self.volume, self.hueLut)
+        actor.GetMapper().SetInputConnection(self.axialColors.GetOutputPort())
 
-            finger3PrevCoords = self.tracker._prevCoords[fingerID3]
-            finger3CurrCoords = self.tracker._coords[fingerID3]
+    def BuildCoronal(self, actor):
+        # Finally, create a lookup table with a single hue but having a range
+        # in the saturation of the hue.
+        self.satLut = vtk.vtkLookupTable()
+        self.satLut.SetTableRange(0, 2000)
+        self.satLut.SetHueRange(.6, .6)
+        self.satLut.SetSaturationRange(0, 1)
+        self.satLut.SetValueRange(1, 1)
+        self.satLut.Build()
 
-            # show finger markers
-            self.fingerMarker1.textActor.SetPosition(finger1CurrCoords[0], finger1CurrCoords[1])
-            self.fingerMarker2.textActor.SetPosition(finger2CurrCoords[0], finger2CurrCoords[1])
-            self.fingerMarker3.textActor.SetPosition(finger3CurrCoords[0], finger3CurrCoords[1])
-            self.fingerMarker3.textActor.VisibilityOn() 
+        # Create the third (coronal) plane of the three planes. We use the same
+        # approach as for the sagittal plane except that the extent differs.
+        self.coronalColors = precolored(self.volume, self.satLut)
+        actor.GetMapper().SetInputConnection(self.coronalColors.GetOutputPort())
 
-            self.Pan(self.ren, self.renwin, self.ren.GetActiveCamera(), finger3PrevCoords[0], finger3PrevCoords[1], finger3CurrCoords[0], finger3CurrCoords[1], self.renwin.GetSize()[0]/2.0, self.renwin.GetSize()[1]/2.0)
+    def Start(self):
+        self.Reset()
+        self.context.activate(self)
+        self.scheduler.render()
+        self.RunTUIO()
+        
+    def Reset(self):
+        # forget the fingers and the close gesture left over from the last run
+        self.terminate = False
+        self.intent.terminate = False
+        self.intents.read(0)
+        self.gestures.reset()
+        self.intent.markerCount = 0
+        self.ShowMarkers(self.intent)
 
-        elif self.tracker.fingers_detected() == self.TERMINATE:
+    def RunTUIO(self):
+        while not self.terminate :
+            # sleep until the input thread publishes a new scene state or a
+            # pending render is due
+            intent = self.intents.read(self.scheduler.timeout())
+            if intent is not None:
+                self.ApplyIntent(intent)
+            self.scheduler.service()
+
+    def OnInput(self, timestamp, cursors):
+        # input thread: track the fingers, run the gestures, publish the result
+        start = self.stats.clock()
+        if self.tracker.update(cursors, timestamp) or self.gestures.pending():
+            start = self.stats.lap(TRACK, start)
+            self.gestures.process()
+            self.stats.lap(GESTURE, start)
+            self.intent.stamp = timestamp
+            self.intents.publish(self.intent)
+
+    def ApplyIntent(self, intent):
+        # render thread: bring the scene up to date with the newest intent
+        start = self.stats.lap(QUEUE, intent.stamp)
+        azimuth, elevation, roll, zoom, dx, dy = intent.camera - self.applied
+        self.applied[:] = intent.camera
+        camera = self.ren.GetActiveCamera()
+        if azimuth or elevation:
+            self.Rotate(self.ren, camera, azimuth, elevation)
+        if dx or dy or roll or zoom:
+            self.Manipulate(self.ren, camera, dx, dy, roll, math.exp(zoom))
+        if intent.slice != self.appliedSlice:
+            self.ScrollSlice(camera, intent.slice - self.appliedSlice)
+            self.appliedSlice = intent.slice
+        self.ShowMarkers(intent)
+        if intent.terminate:
             self.terminate = True
+        self.stats.lap(CAMERA, start)
+        self.scheduler.mark_dirty(intent.stamp)
+            
+    def ScrollSlice(self, camera, slices):
+        # move the plane facing the camera, towards it for positive slices
+        plane, toward = facing_plane(self.planes, camera)
+        if plane is not None and plane.move(toward * slices):
+            self.log.debug('slice %d across axis %d', plane.slice(), plane.axis)
+
+    def ShowMarkers(self, intent):
+        # one marker per finger, in touch order
+        for i, marker in enumerate(self.fingerMarkers):
+            if i < intent.markerCount:
+                marker.textActor.SetPosition(intent.markers[i])
+                marker.textActor.VisibilityOn()
+            else:
+                marker.textActor.VisibilityOff()
+
+    def NoFingers(self, frame):
+        self.log.debug('no fingers')
+        self.intent.set_markers(frame.positions)
+
+    def OnRotate(self, frame):
+        self.intent.set_markers(frame.positions)
+        prev, curr = frame.previous[0], frame.positions[0]
+        azimuth, elevation = (prev[0]-curr[0])/10, (prev[1]-curr[1])/10
+        self.log.debug('rotating %.2f %.2f', azimuth, elevation)
+        self.intent.rotate(azimuth, elevation)
+
+    def OnManipulate(self, frame):
+        # all fingers together pan and zoom the scene, it is not turned
+        # so the sagittal slice stays upright
+        self.intent.set_markers(frame.positions)
+        if frame.moved:
+            dx, dy, angle, scale = frame.similarity()
+            self.intent.manipulate(dx, dy, 0.0, scale)
+
+    def TwoFingers(self, frame):
+        # two fingers that came down at the right edge scroll the slice
+        if (frame.start[:, 0] > SLICE_EDGE).all():
+            return SLICE
+        return MANIPULATE
+
+    def OnSlice(self, frame):
+        self.intent.set_markers(frame.positions)
+        if frame.moved:
+            self.intent.scroll(frame.centroidDelta[1] * SLICE_RATE)
+
+    def OnTerminate(self, frame):
+        self.intent.terminate = True
         
-    def Rotate(self, ren, renwin, camera, prevx, prevy, curx, cury):  
-        camera.Azimuth(prevx-curx)
+    def Rotate(self, ren, camera, azimuth, elevation):  
+        camera.Azimuth(azimuth)
         ''' comment out to fix rotation to x axis only '''
-        #camera.Elevation(prevy-cury)
+        #camera.Elevation(elevation)
         camera.OrthogonalizeViewUp()
-        renwin.Render()
         
-    def Zoom(self, ren, renwin, camera, startDist, currentDist):
-        dollyFactor = pow(1.03,(0.05*(currentDist-startDist)))
-        print 'dollyFactor=' + `dollyFactor`
-        if camera.GetParallelProjection():
-            parallelScale = camera.GetParallelScale()*dollyFactor
-            camera.SetParallelScale(parallelScale)
-        else:
-            camera.Dolly(dollyFactor)
-            ren.ResetCameraClippingRange()
-        renwin.Render()
-        
-    def Pan(self, ren, renwin, camera, prevx, prevy, curx, cury, centerX, centerY):
+    def Manipulate(self, ren, camera, dx, dy, angle, scale):
+        '''
+        Apply one frame of multi-finger motion as a single camera update:
+        the scene follows the fingers' translation (display pixels), turns
+        with their rotation (radians) and zooms with their spread.
+        '''
         FPoint = camera.GetFocalPoint()
-        FPoint0 = FPoint[0]
-        FPoint1 = FPoint[1]
-        FPoint2 = FPoint[2]
-
         PPoint = camera.GetPosition()
-        PPoint0 = PPoint[0]
-        PPoint1 = PPoint[1]
-        PPoint2 = PPoint[2]
 
-        ren.SetWorldPoint(FPoint0, FPoint1, FPoint2, 1.0)
+        # world offset matching the screen translation at the focal depth
+        ren.SetWorldPoint(FPoint[0], FPoint[1], FPoint[2], 1.0)
         ren.WorldToDisplay()
         DPoint = ren.GetDisplayPoint()
-        focalDepth = DPoint[2]
-
-        APoint0 = centerX+(curx-prevx)
-        APoint1 = centerY+(cury-prevy)
-
-        ren.SetDisplayPoint(APoint0, APoint1, focalDepth)
+        ren.SetDisplayPoint(DPoint[0]+dx, DPoint[1]+dy, DPoint[2])
         ren.DisplayToWorld()
         RPoint = ren.GetWorldPoint()
-        RPoint0 = RPoint[0]
-        RPoint1 = RPoint[1]
-        RPoint2 = RPoint[2]
-        RPoint3 = RPoint[3]
+        if RPoint[3] != 0.0:
+            RPoint = [c/RPoint[3] for c in RPoint[:3]]
+        offset = [FPoint[i]-RPoint[i] for i in range(3)]
+        camera.SetFocalPoint(FPoint[0]+offset[0], FPoint[1]+offset[1], FPoint[2]+offset[2])
+        camera.SetPosition(PPoint[0]+offset[0], PPoint[1]+offset[1], PPoint[2]+offset[2])
 
-        if RPoint3 != 0.0:
-            RPoint0 = RPoint0/RPoint3
-            RPoint1 = RPoint1/RPoint3
-            RPoint2 = RPoint2/RPoint3
+        # rolling about the direction of projection turns the image the
+        # same way as the fingers
+        camera.Roll(math.degrees(angle))
 
-        camera.SetFocalPoint( (FPoint0-RPoint0)/2.0 + FPoint0, (FPoint1-RPoint1)/2.0 + FPoint1, (FPoint2-RPoint2)/2.0 + FPoint2)
-        camera.SetPosition( (FPoint0-RPoint0)/2.0 + PPoint0, (FPoint1-RPoint1)/2.0 + PPoint1, (FPoint2-RPoint2)/2.0 + PPoint2)
-        renwin.Render()
+        if camera.GetParallelProjection():
+            camera.SetParallelScale(camera.GetParallelScale()/scale)
+        else:
+            camera.Dolly(scale)
+        ren.ResetCameraClippingRange()
 
     def Kill(self):
         print "Stopping MedicalDemo TUIO tracking"
-        self.tracking.stop()
+        self.log.flush()
+        print "%.1f renders/s" % self.scheduler.renders_per_second()
+        if self.stats.enabled:
+            print self.stats.report()
+            print "Latency histograms written to %s" % self.stats.dump("SingleSlice")
+        self.context.stop()
         print "MedicalDemo.py Terminated"
-        self.iren.GetRenderWindow().Finalize()
@@ -0,0 +1,117 @@
+'''
+SlicePlanes.py shows orthogonal slices of a volume that move through it
+without mapping any colours.
+
+precolored() maps a whole volume through a vtkLookupTable once, into a
+volume of RGBA unsigned chars. For 8 and 16 bit volumes every possible
+value is run through the table once and the volume is coloured with one
+numpy gather, table[volume]; other types go through the table directly.
+The coloured volumes are kept per volume and table, so demos showing the
+same slices share them.
+
+A SlicePlane shows one slice of a precoloured volume in a vtkImageActor,
+across axis 0 (sagittal), 1 (coronal) or 2 (axial). move() only changes the
+actor's display extent: no filter runs, the renderer just uploads the new
+slice as a texture, so scrolling through the volume keeps the frame rate.
+'''
+
+import numpy
+import vtk
+from vtk.util import numpy_support
+
+SAGITTAL = 0
+CORONAL = 1
+AXIAL = 2
+
+def color_table(lut, dtype):
+    # RGBA for every value of an integer type of at most 16 bits, and the
+    # offset of the first value
+    info = numpy.iinfo(dtype)
+    values = numpy.arange(info.min, info.max + 1, dtype=dtype)
+    colors = lut.MapScalars(numpy_support.numpy_to_vtk(values), vtk.VTK_COLOR_MODE_MAP_SCALARS, 0)
+    return numpy_support.vtk_to_numpy(colors).copy(), info.min
+
+# coloured volumes made by this process, the importers point into the arrays
+_colored = {}
+
+def precolored(source, lut):
+    '''
+    vtkImageImport with the volume produced by the algorithm source mapped
+    through lut, computed the first time a volume and table are asked for.
+    '''
+    table = numpy_support.vtk_to_numpy(lut.GetTable())
+    key = (source, lut.GetTableRange(), lut.GetScale(), table.tostring())
+    if key in _colored:
+        return _colored[key][0]
+
+    source.Update()
+    image = source.GetOutput()
+    columns, rows, count = image.GetDimensions()
+    scalars = image.GetPointData().GetScalars()
+    values = numpy_support.vtk_to_numpy(scalars).reshape(count, rows, columns)
+    if values.dtype.kind in 'iu' and values.dtype.itemsize <= 2:
+        rgba, offset = color_table(lut, values.dtype)
+        colors = rgba[values - offset if offset else values]
+    else:
+        mapped = lut.MapScalars(scalars, vtk.VTK_COLOR_MODE_MAP_SCALARS, 0)
+        colors = numpy_support.vtk_to_numpy(mapped).reshape(count, rows, columns, 4).copy()
+
+    importer = vtk.vtkImageImport()
+    importer.SetImportVoidPointer(colors, 1)
+    importer.SetDataScalarTypeToUnsignedChar()
+    importer.SetNumberOfScalarComponents(4)
+    importer.SetWholeExtent(*image.GetExtent())
+    importer.SetDataExtentToWholeExtent()
+    importer.SetDataSpacing(*image.GetSpacing())
+    importer.SetDataOrigin(*image.GetOrigin())
+    _colored[key] = (importer, colors)
+    return importer
+
+class SlicePlane(object):
+    def __init__(self, actor, extent, axis, position=None):
+        '''
+        actor is a vtkImageActor showing a volume of the given whole extent;
+        it shows slice position across axis, the middle one (rounded up)
+        by default.
+        '''
+        self.actor = actor
+        self.extent = tuple(extent)
+        self.axis = axis
+        self.low, self.high = self.extent[2 * axis:2 * axis + 2]
+        if position is None:
+            position = (self.low + self.high + 1) // 2
+        self.position = float(position)
+        self.show()
+
+    def slice(self):
+        return int(round(self.position))
+
+    def move(self, slices):
+        # move by a number of slices, fractions add up; True if the slice changed
+        shown = self.slice()
+        self.position = min(max(self.position + slices, self.low), self.high)
+        if self.slice() == shown:
+            return False
+        self.show()
+        return True
+
+    def show(self):
+        extent = list(self.extent)
+        extent[2 * self.axis] = extent[2 * self.axis + 1] = self.slice()
+        self.actor.SetDisplayExtent(*extent)
+
+def facing_plane(planes, camera):
+    '''
+    The visible plane most nearly facing the camera, and the direction (+1 or
+    -1) that moves it towards the camera. None, 0 if no plane is visible.
+    '''
+    projection = camera.GetDirectionOfProjection()
+    best, toward = None, 0
+    for plane in planes:
+        if not plane.actor.GetVisibility():
+            continue
+        if best is None or abs(projection[plane.axis]) > abs(projection[best.axis]):
+            best = plane
+    if best is not None:
+        toward = -1 if projection[best.axis] > 0 else 1
+    return best, toward
@@ -0,0 +1,264 @@
+'''
+SpanSpace.py finds the parts of a volume an isosurface passes through, so a
+new iso value can be contoured while a finger scrubs it.
+
+A SpanIndex cuts the volume into bricks of BRICK cells per axis and keeps
+the smallest and largest value of each brick. An isosurface at value only
+passes through bricks whose min <= value <= max. Sorted by their minimum
+the bricks form a span space: one binary search finds those starting at or
+below value, and comparing their maxima leaves the active ones. contour()
+gathers just the active bricks into one stack, contours the stack with a
+single filter and moves the triangles back to where their bricks sit in the
+volume, merging the vertices neighbouring bricks share. Its cost follows
+the area of the surface, not the size of the volume. Gathering and joining
+the bricks costs about ten times as much per voxel as contouring in place,
+so when more than DENSE_FRACTION of the bricks are active the whole volume
+is contoured instead.
+
+The last brick along an axis is moved back to end at the volume's edge, so
+no brick is ever partial; the cells it shares with the brick before it are
+contoured by that brick only.
+
+The minima and maxima are measured once per volume and kept on disk under
+TUIO_CACHE_DIR, named by the volume's contents like the isosurfaces (see
+IsosurfaceCache.py).
+
+    python SpanSpace.py headsq/Data_headsq_quarter --scales 1 4.6
+
+times contour() against contouring the whole volume.
+'''
+
+import hashlib
+import os
+
+import numpy
+import vtk
+from vtk.util import numpy_support
+
+from IsosurfaceCache import cache_directory, content_hash
+from IsosurfaceEngine import (DEFAULT_BACKEND, EDGE_POINTS, contour_filter, polydata_to_triangles, vertex_edges,
+                              merge_vertices, triangle_cells, triangles_to_polydata)
+
+INDEX_VERSION = 1
+
+BRICK = 16
+INDEX_EXTENSION = '.npz'
+
+# above this fraction of active bricks the whole volume is contoured
+DENSE_FRACTION = 0.1
+
+def brick_starts(points, brick):
+    # first point of each brick along an axis of points points, and how many
+    # cells at its start belong to the brick before
+    size = max(1, min(brick, points - 1))
+    starts = numpy.arange(0, points - 1, size)
+    owned = numpy.zeros(len(starts), int)
+    last = points - 1 - size
+    owned[-1] = starts[-1] - last
+    starts[-1] = last
+    return size, starts, owned
+
+def window_reduce(reduce, array, axis, starts, size):
+    # reduce over the size + 1 points from each start along axis
+    window = [slice(None)] * array.ndim
+    parts = []
+    for start in starts:
+        window[axis] = slice(start, start + size + 1)
+        parts.append(reduce(array[tuple(window)], axis=axis))
+    return numpy.stack(parts, axis)
+
+class SpanIndex(object):
+    def __init__(self, volume, origin, spacing, brick=BRICK, mins=None, maxs=None):
+        '''
+        volume is the (z, y, x) array of point values, origin and spacing
+        place point (0, 0, 0) and the points after it. mins and maxs are a
+        measured index to reuse.
+        '''
+        self.volume = volume
+        self.origin = numpy.asarray(origin, float)
+        self.spacing = numpy.asarray(spacing, float)
+        self.brick = brick
+        # per axis in z, y, x order
+        self.sizes, self.starts, self.owned = zip(*[brick_starts(points, brick) for points in volume.shape])
+        self.shape = tuple(len(starts) for starts in self.starts)
+        if mins is None:
+            mins, maxs = self.measure()
+        self.mins = mins.ravel()
+        self.maxs = maxs.ravel()
+        self.range = (self.mins.min(), self.maxs.max())
+        self.order = numpy.argsort(self.mins, kind='mergesort')
+        self.sortedMins = self.mins[self.order]
+
+    def measure(self):
+        # min and max of every brick, one axis at a time
+        mins = maxs = self.volume
+        for axis in (2, 1, 0):
+            mins = window_reduce(numpy.min, mins, axis, self.starts[axis], self.sizes[axis])
+            maxs = window_reduce(numpy.max, maxs, axis, self.starts[axis], self.sizes[axis])
+        return mins, maxs
+
+    def active(self, value):
+        # indices of the bricks the isosurface at value passes through
+        candidates = self.order[:numpy.searchsorted(self.sortedMins, value, 'right')]
+        return candidates[self.maxs[candidates] >= value]
+
+    def contour(self, value, backend=DEFAULT_BACKEND):
+        '''
+        vtkPolyData with the triangles of the isosurface at value, made from
+        the active bricks only.
+        '''
+        bricks = self.active(value)
+        if not len(bricks):
+            return vtk.vtkPolyData()
+        if len(bricks) > DENSE_FRACTION * len(self.mins):
+            return self.contour_all(value, backend)
+        bz, by, bx = numpy.unravel_index(bricks, self.shape)
+        first = numpy.column_stack((self.starts[2][bx], self.starts[1][by], self.starts[0][bz]))
+        owned = numpy.column_stack((self.owned[2][bx], self.owned[1][by], self.owned[0][bz]))
+        sz, sy, sx = self.sizes
+        depth = sz + 1
+
+        # stack the active bricks along z, each keeping its own boundary
+        # points, and contour the stack in one go
+        stack = numpy.empty((len(bricks), depth, sy + 1, sx + 1), self.volume.dtype)
+        for brick, (x, y, z) in enumerate(first):
+            stack[brick] = self.volume[z:z + depth, y:y + sy + 1, x:x + sx + 1]
+        image = vtk.vtkImageData()
+        image.SetDimensions(sx + 1, sy + 1, depth * len(bricks))
+        image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(stack.ravel(), deep=0))
+        extractor = contour_filter(backend, value)
+        extractor.SetInputData(image)
+        extractor.Update()
+        points, triangles = polydata_to_triangles(extractor.GetOutput())
+        if backend in EDGE_POINTS:
+            lower, axis = vertex_edges(points, stack.reshape(-1, sy + 1, sx + 1), value)
+        else:
+            lower, axis = vertex_edges(points)
+
+        # drop the triangles between two bricks of the stack, and those in
+        # cells a moved back brick shares with the brick before it
+        cells = triangle_cells(points, triangles, lower, axis)
+        brick = cells[:, 2] // depth
+        cells[:, 2] -= brick * depth
+        triangles = triangles[(cells[:, 2] < sz) & (cells >= owned[brick]).all(axis=1)]
+
+        # move the points back to their bricks, and merge the points of the
+        # same edge made by neighbouring bricks. Only the points of the
+        # triangles kept count, those between the bricks of the stack have
+        # no place in the volume.
+        brick = numpy.minimum(lower[:, 2] // depth, len(bricks) - 1)
+        shift = first[brick] - numpy.column_stack((numpy.zeros((len(brick), 2), int), brick * depth))
+        columns, rows, count = self.volume.shape[::-1]
+        points, triangles = merge_vertices(points + shift, triangles, numpy.unique(triangles), lower + shift, axis,
+                                           (columns, rows, count))
+        points = (self.origin + points * self.spacing).astype(numpy.float32)
+        return triangles_to_polydata(points, triangles)
+
+    def contour_all(self, value, backend=DEFAULT_BACKEND):
+        image = vtk.vtkImageData()
+        count, rows, columns = self.volume.shape
+        image.SetDimensions(columns, rows, count)
+        image.SetOrigin(self.origin)
+        image.SetSpacing(self.spacing)
+        image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(self.volume.ravel(), deep=0))
+        extractor = contour_filter(backend, value)
+        extractor.SetInputData(image)
+        extractor.Update()
+        return extractor.GetOutput()
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # numpy adds the extension to names without one
+        temp = '%s.%d.tmp%s' % (path, os.getpid(), INDEX_EXTENSION)
+        numpy.savez(temp, mins=self.mins.reshape(self.shape), maxs=self.maxs.reshape(self.shape))
+        os.rename(temp, path)
+
+def image_volume(image):
+    # (z, y, x) view of the image's values, its first point and spacing
+    columns, rows, count = image.GetDimensions()
+    volume = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars()).reshape(count, rows, columns)
+    spacing = numpy.array(image.GetSpacing())
+    origin = numpy.array(image.GetOrigin()) + spacing * image.GetExtent()[::2]
+    return volume, origin, spacing
+
+# indexes opened by this process, by source
+_indexes = {}
+
+def open_span_index(source, brick=BRICK, directory=None):
+    '''
+    SpanIndex of the volume produced by the algorithm source, read from the
+    cache directory or measured and stored there.
+    '''
+    if source in _indexes:
+        return _indexes[source]
+    source.Update()
+    image = source.GetOutput()
+    volume, origin, spacing = image_volume(image)
+
+    name = hashlib.sha1(repr((INDEX_VERSION, content_hash(source), brick))).hexdigest()
+    path = os.path.join(directory or cache_directory('spans'), name + INDEX_EXTENSION)
+    index = None
+    if os.path.exists(path):
+        try:
+            stored = numpy.load(path)
+            index = SpanIndex(volume, origin, spacing, brick, stored['mins'], stored['maxs'])
+        except (IOError, KeyError, ValueError):
+            index = None
+        if index is not None and index.mins.size != numpy.prod(index.shape):
+            index = None
+    if index is None:
+        index = SpanIndex(volume, origin, spacing, brick)
+        try:
+            index.save(path)
+        except (IOError, OSError):
+            pass
+    # the volume array is a view of the image's scalars
+    index.image = image
+    _indexes[source] = index
+    return index
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from VolumeCache import open_volume
+    from IsosurfaceEngine import BACKENDS
+
+    parser = argparse.ArgumentParser(description='Time iso value scrubbing with and without the span space index.')
+    parser.add_argument('prefix', help='slice files are prefix.1, prefix.2, ...')
+    parser.add_argument('--dimensions', type=int, nargs=2, default=(64, 64))
+    parser.add_argument('--range', type=int, nargs=2, default=(1, 93))
+    parser.add_argument('--spacing', type=float, nargs=3, default=(3.2, 3.2, 1.5))
+    parser.add_argument('--values', type=float, nargs='+', default=(500, 800, 1150, 1500))
+    parser.add_argument('--scales', type=float, nargs='+', default=(1, 2, 4.6),
+                        help='upsampling per axis, 4.6 makes a volume about 100 times bigger')
+    parser.add_argument('--brick', type=int, default=BRICK)
+    parser.add_argument('--backend', default=DEFAULT_BACKEND, choices=sorted(BACKENDS))
+    args = parser.parse_args()
+
+    source = open_volume(args.prefix, args.dimensions, args.range, args.spacing)
+    print '%6s %12s %8s %10s %10s %10s %10s' % ('scale', 'voxels', 'value', 'bricks', 'index ms', 'full ms', 'triangles')
+    for scale in args.scales:
+        resample = vtk.vtkImageResample()
+        resample.SetInputConnection(source.GetOutputPort())
+        resample.SetInterpolationModeToLinear()
+        for axis in range(3):
+            resample.SetAxisMagnificationFactor(axis, scale)
+        resample.Update()
+        start = time.time()
+        volume, origin, spacing = image_volume(resample.GetOutput())
+        index = SpanIndex(volume, origin, spacing, args.brick)
+        print '%6.2f %12d index measured in %.1f ms' % (scale, index.volume.size, 1e3 * (time.time() - start))
+        for value in args.values:
+            start = time.time()
+            surface = index.contour(value, args.backend)
+            indexed = time.time() - start
+            start = time.time()
+            full = contour_filter(args.backend, value)
+            full.SetInputConnection(resample.GetOutputPort())
+            full.Update()
+            whole = time.time() - start
+            print '%6.2f %12d %8.0f %10d %10.1f %10.1f %10d' % (scale, index.volume.size, value, len(index.active(value)),
+                                                                1e3 * indexed, 1e3 * whole, surface.GetNumberOfPolys())
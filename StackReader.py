@@ -0,0 +1,117 @@
+'''
+StackReader.py reads a stack of slice files into one preallocated volume
+with a pool of threads.
+
+Every slice is read with readinto() straight into its place in the volume,
+so no per-slice strings or arrays are made. File reads release the
+interpreter lock, so up to `threads` slices are in flight at once, which
+hides the latency of network mounts where reading one slice after another
+spends most of its time waiting. The pool keeps reading ahead while the
+calling thread takes the finished slices in order to checksum them, flip
+them to the bottom-row-first order vtkVolume16Reader produces and fix their
+byte order.
+
+The pixels of a slice are the last rows * columns values of its file, any
+header before them is skipped (but checksummed), like vtkVolume16Reader
+with a header size of file size minus image size.
+
+TUIO_READ_THREADS sets the number of threads, 8 by default.
+
+    python StackReader.py headsq/Data_headsq_quarter --threads 1 8
+
+times reading the stack with each number of threads.
+'''
+
+import io
+import os
+import sys
+from multiprocessing.pool import ThreadPool
+
+import numpy
+
+THREADS = 8
+
+def slice_paths(prefix, image_range):
+    # prefix.N for N from first to last, as vtkVolume16Reader names them
+    return ['%s.%d' % (prefix, i) for i in range(image_range[0], image_range[1] + 1)]
+
+def read_threads():
+    return int(os.environ.get('TUIO_READ_THREADS') or THREADS)
+
+# pools by size, kept for the life of the process: closing a pool waits
+# about a tenth of a second for its handler threads
+_pools = {}
+
+def thread_pool(threads):
+    if threads not in _pools:
+        _pools[threads] = ThreadPool(threads)
+    return _pools[threads]
+
+class StackReader(object):
+    def __init__(self, dimensions, byte_order='little', threads=None):
+        '''
+        dimensions is the (columns, rows) of one slice of 16 bit pixels.
+        '''
+        self.columns, self.rows = dimensions[:2]
+        self.swap = byte_order != sys.byteorder
+        self.threads = threads or read_threads()
+
+    def read_into(self, task):
+        # worker thread: one slice's pixels into image, returns the header
+        path, image = task
+        size = image.nbytes
+        with io.open(path, 'rb', buffering=0) as f:
+            header = f.read(max(0, os.fstat(f.fileno()).st_size - size))
+            buffer = memoryview(image.reshape(-1).view(numpy.uint8))
+            done = 0
+            while done < size:
+                count = f.readinto(buffer[done:])
+                if not count:
+                    raise IOError('%s has %d bytes, expected at least %d' % (path, len(header) + done, size))
+                done += count
+        return header
+
+    def read(self, paths, out=None, digest=None):
+        '''
+        The slices as a (count, rows, columns) uint16 volume, in out if
+        given. digest, a hashlib object, is updated with the files' contents
+        in order.
+        '''
+        if out is None:
+            out = numpy.empty((len(paths), self.rows, self.columns), numpy.uint16)
+        if not len(paths):
+            return out
+        headers = thread_pool(self.threads).imap(self.read_into, zip(paths, out), chunksize=1)
+        for image, header in zip(out, headers):
+            if digest is not None:
+                digest.update(header)
+                digest.update(image)
+            # numpy copies overlapping reversed assignments through a buffer
+            image[:] = image[::-1]
+            if self.swap:
+                image.byteswap(True)
+        return out
+
+if __name__ == '__main__':
+    import argparse
+    import hashlib
+    import time
+
+    parser = argparse.ArgumentParser(description='Time reading a slice stack with a number of threads.')
+    parser.add_argument('prefix', help='slice files are prefix.1, prefix.2, ...')
+    parser.add_argument('--dimensions', type=int, nargs=2, default=(64, 64))
+    parser.add_argument('--range', type=int, nargs=2, default=(1, 93))
+    parser.add_argument('--big-endian', action='store_true')
+    parser.add_argument('--threads', type=int, nargs='+', default=(1, THREADS))
+    args = parser.parse_args()
+
+    paths = slice_paths(args.prefix, args.range)
+    out = numpy.empty((len(paths), args.dimensions[1], args.dimensions[0]), numpy.uint16)
+    print '%8s %10s %10s %s' % ('threads', 'ms', 'MB/s', 'sha1')
+    for threads in args.threads:
+        reader = StackReader(args.dimensions, 'big' if args.big_endian else 'little', threads)
+        digest = hashlib.sha1()
+        start = time.time()
+        reader.read(paths, out, digest)
+        elapsed = time.time() - start
+        print '%8d %10.1f %10.1f %s' % (threads, 1e3 * elapsed, out.nbytes / 1048576.0 / elapsed, digest.hexdigest())
@@ -0,0 +1,119 @@
+'''
+TuioInput.py runs the TUIO socket on its own thread.
+
+The thread blocks in select() on the tracking socket instead of spinning on
+tracking.update(). Whenever a bundle arrives the socket is drained, the live
+cursors are copied into plain Cursor records and the frame is handed to the
+demo through a small bounded queue, stamped with the time select() saw the
+first datagram of the frame arrive.
+Frames identical to the last one published are dropped, so the demo only
+wakes up when the touch state really changed. While fingers rest on the
+table the consumer is handed the last frame again every `resting` seconds,
+so gestures that settle over time (see Gestures.py) still start when the
+fingers hold still.
+
+Given a consumer, the thread calls consumer(timestamp, cursors) itself
+instead of queueing the frame, so tracking and gesture recognition run on the
+input thread and a slow render cannot delay draining the socket.
+'''
+
+import select
+import socket
+import sys
+import threading
+import Queue
+
+from Clock import monotonic
+from FlightRecorder import get_recorder
+from MultiTouch import Cursor
+
+class TuioInputThread(threading.Thread):
+    def __init__(self, tracking, consumer=None, max_frames=8, timeout=0.1, resting=0.02):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.tracking = tracking
+        self.consumer = consumer
+        self.timeout = timeout
+        self.resting = resting
+        self._frames = Queue.Queue(max_frames)
+        self._halt = threading.Event()
+        self._last = None
+        self._handed = 0.0
+        self.log = get_recorder()
+
+    def run(self):
+        try:
+            self.read()
+        except Exception:
+            # threads do not go through sys.excepthook
+            self.log.dump_exception(*sys.exc_info())
+            raise
+
+    def read(self):
+        sock = self.tracking.socket
+        while not self._halt.is_set():
+            try:
+                readable, _, _ = select.select([sock], [], [], self.resting if self._last else self.timeout)
+            except (select.error, socket.error):
+                # socket closed underneath us by stop()
+                break
+            if not readable:
+                self.repeat(monotonic())
+                continue
+            arrival = monotonic()
+
+            while self.tracking.update():
+                # read the socket empty
+                pass
+
+            frame = self.snapshot(self.tracking.cursors())
+            if frame != self._last:
+                self._last = frame
+                self.log.debug('frame with %d cursors', len(frame))
+                if self.consumer is not None:
+                    self._handed = arrival
+                    self.consumer(arrival, frame)
+                else:
+                    self.publish((arrival, frame))
+            else:
+                self.repeat(arrival)
+
+    def repeat(self, now):
+        # fingers resting: hand the consumer the same frame again now and then
+        # so gestures waiting to settle still start
+        if self._last and self.consumer is not None and now - self._handed >= self.resting:
+            self._handed = now
+            self.consumer(now, self._last)
+
+    def snapshot(self, cursors):
+        # copy the cursors so the demo never sees pyTUIO mutate them
+        return tuple(sorted(Cursor(c.sessionid, c.xpos, c.ypos) for c in cursors))
+
+    def publish(self, frame):
+        # the queue is bounded: when the demo falls behind drop the oldest
+        # frame rather than blocking the socket reader
+        while True:
+            try:
+                self._frames.put_nowait(frame)
+                return
+            except Queue.Full:
+                try:
+                    self._frames.get_nowait()
+                except Queue.Empty:
+                    pass
+
+    def next_frame(self, timeout=None):
+        '''
+        Block until a new cursor frame arrives and return it with its
+        timestamp. Returns (None, None) on timeout so the caller can check its
+        own exit conditions.
+        '''
+        try:
+            return self._frames.get(True, timeout)
+        except Queue.Empty:
+            return None, None
+
+    def stop(self):
+        self._halt.set()
+        if self.is_alive():
+            self.join(2 * self.timeout)
@@ -0,0 +1,145 @@
+'''
+TuioLoadGenerator.py pretends to be a TUIO tracker for stress testing.
+
+It sends N simulated fingers going through a script of pinch, rotate, pan and
+tap motions to a TUIO port at a fixed frame rate. The rest motion keeps the
+hand still; together with jitter it reproduces the sensor noise of a resting
+hand. The bundles use the standard
+alive/set/fseq layout and are split to fit max_packet bytes the way the TUIO
+reference server splits them (continuation bundles carry fseq -1), so both
+TuioSource and pyTUIO's tuio.Tracking accept them.
+
+    python TuioLoadGenerator.py --fingers 40 --rate 240 --script pinch,rotate,pan,tap
+    python TuioLoadGenerator.py --fingers 2 --script rest --jitter 0.001
+'''
+
+import argparse
+import math
+import random
+import socket
+import time
+
+from Clock import monotonic
+from TuioProtocol import TUIO_PORT, encode_cursor_bundle
+
+MOTIONS = ('pinch', 'rotate', 'pan', 'tap', 'rest')
+SCRIPT = ('pinch', 'rotate', 'pan', 'tap')
+
+# pyTUIO reads at most 1024 bytes per datagram
+MAX_PACKET = 1024
+
+# bytes added to a bundle by one set message
+_SET_SIZE = len(encode_cursor_bundle([(0, 0.0, 0.0)], 0, ids=[])) - len(encode_cursor_bundle([], 0, ids=[]))
+
+class LoadGenerator(object):
+    def __init__(self, fingers, script=SCRIPT, segment=4.0, period=2.0, jitter=0.0):
+        self.fingers = fingers
+        self.jitter = jitter
+        self.script = script
+        self.segment = segment
+        self.period = period
+        self.fseq = 0
+        self._touches = [None] * fingers
+        self._nextid = 1
+
+    def motion(self, t):
+        return self.script[int(t / self.segment) % len(self.script)]
+
+    def cursors(self, t):
+        '''
+        Return the (sessionid, x, y) tuples of every finger touching at time t.
+        Fingers sit on a ring around the middle of the table.
+        '''
+        motion = self.motion(t)
+        phase = 2 * math.pi * t / self.period
+        cx, cy, radius, spin = 0.5, 0.5, 0.25, 0.0
+        if motion == 'pinch':
+            radius = 0.25 + 0.15 * math.sin(phase)
+        elif motion == 'rotate':
+            spin = phase
+        elif motion == 'pan':
+            cx += 0.15 * math.cos(phase)
+            cy += 0.15 * math.sin(phase)
+
+        cursors = []
+        for i in range(self.fingers):
+            down = True
+            if motion == 'tap':
+                # each finger taps once per period, staggered around the ring
+                down = (t / self.period + float(i) / self.fingers) % 1.0 < 0.5
+            if not down:
+                self._touches[i] = None
+                continue
+            if self._touches[i] is None:
+                # a new touch gets a new session id, like a real tracker
+                self._touches[i] = self._nextid
+                self._nextid += 1
+            angle = spin + 2 * math.pi * i / self.fingers
+            x = cx + radius * math.cos(angle)
+            y = cy + radius * math.sin(angle)
+            if self.jitter:
+                x += random.gauss(0.0, self.jitter)
+                y += random.gauss(0.0, self.jitter)
+            cursors.append((self._touches[i], x, y))
+        return cursors
+
+    def packets(self, t, max_packet=MAX_PACKET):
+        self.fseq += 1
+        cursors = self.cursors(t)
+        ids = [c[0] for c in cursors]
+
+        # every bundle repeats the full alive list, only the set messages
+        # are spread over the bundles
+        base = len(encode_cursor_bundle([], -1, ids=ids))
+        per_packet = max(1, (max_packet - base) // _SET_SIZE)
+        packets = []
+        for first in range(0, max(len(cursors), 1), per_packet):
+            last = first + per_packet >= len(cursors)
+            fseq = self.fseq if last else -1
+            packets.append(encode_cursor_bundle(cursors[first:first + per_packet], fseq, ids=ids))
+        return packets
+
+def run(generator, rate, duration=None, host='127.0.0.1', port=TUIO_PORT, max_packet=MAX_PACKET):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = (host, port)
+    interval = 1.0 / rate
+    start = monotonic()
+    frames = late = 0
+    try:
+        while duration is None or frames * interval < duration:
+            t = frames * interval
+            delay = start + t - monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -interval:
+                late += 1
+            for packet in generator.packets(t, max_packet):
+                sock.sendto(packet, address)
+            frames += 1
+    except KeyboardInterrupt:
+        pass
+    sock.close()
+    return frames, late
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate a TUIO tracker with many fingers.')
+    parser.add_argument('--fingers', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=60.0, help='frames per second')
+    parser.add_argument('--script', default=','.join(SCRIPT), help='comma separated motions: %s' % ', '.join(MOTIONS))
+    parser.add_argument('--segment', type=float, default=4.0, help='seconds per scripted motion')
+    parser.add_argument('--period', type=float, default=2.0, help='seconds per motion cycle')
+    parser.add_argument('--jitter', type=float, default=0.0, help='position noise, in table widths')
+    parser.add_argument('--duration', type=float, default=None, help='seconds, default until Ctrl-C')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=TUIO_PORT)
+    parser.add_argument('--max-packet', type=int, default=MAX_PACKET)
+    args = parser.parse_args()
+
+    script = tuple(args.script.split(','))
+    for motion in script:
+        if motion not in MOTIONS:
+            parser.error('unknown motion %r' % motion)
+
+    generator = LoadGenerator(args.fingers, script, args.segment, args.period, args.jitter)
+    frames, late = run(generator, args.rate, args.duration, args.host, args.port, args.max_packet)
+    print 'Sent %d frames, %d late' % (frames, late)
@@ -0,0 +1,293 @@
+'''
+TuioProtocol.py decodes TUIO 1.1 /tuio/2Dcur bundles without pyTUIO.
+
+TuioSource is a drop-in replacement for tuio.Tracking: it owns the UDP socket,
+exposes update()/cursors()/stop() and the socket attribute used by
+TuioInputThread. Datagrams are received into a preallocated buffer and parsed
+in place with precompiled struct.Struct objects, so no per-packet strings or
+lists are built besides the resulting Cursor records.
+
+A frame only becomes visible through cursors() once its fseq message has been
+seen. Frames that arrive late or twice (fseq not newer than the last committed
+frame) are dropped, as the TUIO reference client does. A frame whose fseq
+goes backwards is taken as a restarted tracker instead when its bundle names
+another source, carries a later timetag, or when the jump is too large for a
+reordered packet: more than FSEQ_LATE_WINDOW frames, or back to less
+than half the last fseq. Elements and arguments running past the end of
+their datagram or bundle are ignored, so a malformed packet is dropped like
+a lost one.
+
+Running this module benchmarks the decoder against pyTUIO, on a recorded
+trace (see TuioRecorder.py) or on a synthetic stream:
+
+    python TuioProtocol.py [session.trace | frames]
+'''
+
+import socket
+import struct
+import sys
+import time
+
+from MultiTouch import Cursor
+from Instrumentation import NULL_STATS, RECEIVE, DECODE
+
+TUIO_PORT = 3333
+MAX_DATAGRAM = 65536
+
+# UDP reorders packets by a few frames at most, a frame further behind the
+# last one comes from a restarted tracker counting again from 1
+FSEQ_LATE_WINDOW = 16
+
+# the OSC timetag meaning "immediately", which carries no time
+IMMEDIATE = (0, 1)
+
+BUNDLE_TAG = b'#bundle\0'
+CUR_ADDRESS = b'/tuio/2Dcur\0'
+
+_int32 = struct.Struct('>i')
+_float32 = struct.Struct('>f')
+_timetag = struct.Struct('>II')
+_set2Dcur = struct.Struct('>ifffff')
+_setTags = b',sifffff\0'
+
+def _pad4(n):
+    return (n + 3) & ~3
+
+class TuioDecoder(object):
+    def __init__(self):
+        self.fseq = 0
+        self.dropped = 0
+        self.restarts = 0
+        # source and timetag of the bundle being decoded, and of the last committed frame
+        self._source = None
+        self._timetag = IMMEDIATE
+        self._committedSource = None
+        self._committedTimetag = IMMEDIATE
+        self._alive = ()
+        self._pending = {}
+        self._positions = {}
+        self._alive_structs = {}
+        self._cursors = []
+
+    def cursors(self):
+        return self._cursors
+
+    def decode(self, buf, length):
+        '''
+        Decode one datagram held in the first length bytes of buf.
+        Returns True when the datagram completed a new frame. Sizes and
+        arguments running past length are ignored, the rest of buf holds
+        earlier datagrams.
+        '''
+        if buf.startswith(BUNDLE_TAG, 0, length):
+            if length < len(BUNDLE_TAG) + _timetag.size:
+                return False
+            self._source = None
+            self._timetag = _timetag.unpack_from(buf, len(BUNDLE_TAG))
+            return self._decode_bundle(buf, len(BUNDLE_TAG) + _timetag.size, length)
+        return self._decode_message(buf, 0, length)
+
+    def _decode_bundle(self, buf, offset, end):
+        committed = False
+        while offset + 4 <= end:
+            size = _int32.unpack_from(buf, offset)[0]
+            offset += 4
+            if size < 0 or offset + size > end:
+                # a broken element, nothing after it can be trusted
+                break
+            if buf.startswith(BUNDLE_TAG, offset, offset + size):
+                if size < len(BUNDLE_TAG) + _timetag.size:
+                    break
+                committed |= self._decode_bundle(buf, offset + len(BUNDLE_TAG) + _timetag.size, offset + size)
+            else:
+                committed |= self._decode_message(buf, offset, offset + size)
+            offset += size
+        return committed
+
+    def _decode_message(self, buf, offset, end):
+        if not buf.startswith(CUR_ADDRESS, offset, end):
+            # other profiles (objects, blobs) are not used by the demos
+            return False
+        offset += _pad4(len(CUR_ADDRESS))
+        tagEnd = buf.find(b'\0', offset, end)
+        if tagEnd < 0:
+            return False
+        tags = offset
+        ntags = tagEnd - offset - 1
+        offset = _pad4(tagEnd + 1)
+
+        # the first argument is the command string
+        cmdEnd = buf.find(b'\0', offset, end)
+        if cmdEnd < 0:
+            return False
+        cmd = offset
+        offset = _pad4(cmdEnd + 1)
+
+        if buf.startswith(b'set\0', cmd, end):
+            if buf.startswith(_setTags, tags, end) and offset + _set2Dcur.size <= end:
+                # command, then session id, x, y, X, Y, m
+                sid, x, y = _set2Dcur.unpack_from(buf, offset)[:3]
+                self._pending[sid] = (x, y)
+        elif buf.startswith(b'alive\0', cmd, end):
+            count = ntags - 1
+            if count < 0 or offset + 4 * count > end:
+                return False
+            unpack = self._alive_structs.get(count)
+            if unpack is None:
+                unpack = self._alive_structs[count] = struct.Struct('>%di' % count).unpack_from
+            self._alive = unpack(buf, offset)
+        elif buf.startswith(b'fseq\0', cmd, end):
+            if offset + _int32.size > end:
+                return False
+            return self._commit(_int32.unpack_from(buf, offset)[0])
+        elif buf.startswith(b'source\0', cmd, end):
+            sourceEnd = buf.find(b'\0', offset, end)
+            if sourceEnd >= 0:
+                self._source = bytes(buf[offset:sourceEnd])
+        return False
+
+    def _commit(self, fseq):
+        pending = self._pending
+        self._pending = {}
+        if fseq != -1:
+            if fseq <= self.fseq:
+                if not self._restarted(fseq):
+                    # late or duplicate frame
+                    self.dropped += 1
+                    return False
+                self.restarts += 1
+            self.fseq = fseq
+            self._committedSource = self._source
+            self._committedTimetag = self._timetag
+
+        previous = self._positions
+        positions = self._positions = {}
+        cursors = self._cursors = []
+        for sid in self._alive:
+            xy = pending.get(sid) or previous.get(sid)
+            if xy is not None:
+                positions[sid] = xy
+                cursors.append(Cursor(sid, xy[0], xy[1]))
+        return True
+
+    def _restarted(self, fseq):
+        # whether a frame not newer than the last one starts a new session
+        if self._source != self._committedSource:
+            return True
+        if self._timetag != IMMEDIATE and self._committedTimetag != IMMEDIATE and \
+                self._timetag > self._committedTimetag:
+            return True
+        return self.fseq - fseq > FSEQ_LATE_WINDOW or fseq < self.fseq // 2
+
+class TuioSource(object):
+    '''
+    Socket plus decoder with the same surface as tuio.Tracking.
+    '''
+    def __init__(self, host='', port=TUIO_PORT, stats=NULL_STATS):
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.decoder = TuioDecoder()
+        self._buf = bytearray(MAX_DATAGRAM)
+        self.malformed = 0
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(0)
+        self.socket.bind((host, port))
+
+    def update(self):
+        start = self.stats.clock()
+        try:
+            length = self.socket.recv_into(self._buf)
+        except socket.error:
+            return False
+        start = self.stats.lap(RECEIVE, start)
+        try:
+            self.decoder.decode(self._buf, length)
+        except struct.error:
+            # a malformed datagram is dropped like a lost one
+            self.malformed += 1
+        self.stats.lap(DECODE, start)
+        return True
+
+    def cursors(self):
+        return self.decoder.cursors()
+
+    def stop(self):
+        self.socket.close()
+
+'''
+ENCODING (used by the benchmark and the tools that emulate a tracker)
+'''
+
+def _osc_string(s):
+    s += b'\0'
+    return s + b'\0' * (_pad4(len(s)) - len(s))
+
+def _osc_message(command, tags, args):
+    body = CUR_ADDRESS + b'\0' * (_pad4(len(CUR_ADDRESS)) - len(CUR_ADDRESS))
+    body += _osc_string(b',s' + tags) + _osc_string(command)
+    for tag, arg in zip(tags, args):
+        body += (_float32 if tag == b'f' else _int32).pack(arg)
+    return body
+
+def encode_cursor_bundle(cursors, fseq, source=None, ids=None, timetag=IMMEDIATE):
+    '''
+    Build a /tuio/2Dcur bundle from (sessionid, x, y) tuples, laid out the way
+    TUIO trackers send them: source, alive, one set per cursor, fseq. ids
+    overrides the alive list when a frame is split over several bundles,
+    timetag is the bundle's (seconds, fraction).
+    '''
+    messages = []
+    if source is not None:
+        messages.append(_osc_string(CUR_ADDRESS[:-1]) + _osc_string(b',ss') + _osc_string(b'source') + _osc_string(source))
+    if ids is None:
+        ids = [c[0] for c in cursors]
+    messages.append(_osc_message(b'alive', b'i' * len(ids), ids))
+    for sid, x, y in cursors:
+        messages.append(_osc_message(b'set', b'ifffff', (sid, x, y, 0.0, 0.0, 0.0)))
+    messages.append(_osc_message(b'fseq', b'i', (fseq,)))
+
+    packet = BUNDLE_TAG + _timetag.pack(*timetag)
+    for message in messages:
+        packet += _int32.pack(len(message)) + message
+    return packet
+
+def synthetic_stream(frames=20000, fingers=5):
+    packets = []
+    for fseq in range(1, frames + 1):
+        cursors = [(i, (fseq * 0.001 + i * 0.1) % 1.0, 0.5) for i in range(fingers)]
+        packets.append(encode_cursor_bundle(cursors, fseq, b'bench@127.0.0.1'))
+    return packets
+
+def benchmark(packets):
+    buf = bytearray(MAX_DATAGRAM)
+    decoder = TuioDecoder()
+    start = time.time()
+    for packet in packets:
+        length = len(packet)
+        buf[:length] = packet
+        decoder.decode(buf, length)
+    elapsed = time.time() - start
+    print 'TuioDecoder: %8.2f us/packet' % (1e6 * elapsed / len(packets))
+
+    try:
+        import tuio
+    except ImportError:
+        print 'pyTUIO:      not installed, skipped'
+        return
+    tracking = tuio.Tracking('127.0.0.1', 0)
+    start = time.time()
+    for packet in packets:
+        tracking.manager.handle(packet)
+        tracking.cursors()
+    elapsed = time.time() - start
+    tracking.stop()
+    print 'pyTUIO:      %8.2f us/packet' % (1e6 * elapsed / len(packets))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and not sys.argv[1].isdigit():
+        from TuioRecorder import packets
+        benchmark(packets(sys.argv[1]))
+    else:
+        frames = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+        benchmark(synthetic_stream(frames))
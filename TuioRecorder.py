@@ -0,0 +1,162 @@
+'''
+TuioRecorder.py records raw TUIO datagrams to a file and replays them.
+
+A trace starts with an 8 byte magic followed by one record per datagram:
+a little-endian float64 timestamp (seconds since the recording started,
+taken from the monotonic clock), a uint16 payload length and the payload.
+Traces are read through mmap, so replaying a multi-hour session does not
+need the whole file in memory.
+
+Replaying a trace to the TUIO port drives any demo exactly like the table:
+
+    python TuioRecorder.py record session.trace
+    python TuioRecorder.py replay session.trace [--fast | --speed 2]
+
+drive() feeds a trace straight into a CursorTracker without a socket.
+'''
+
+import argparse
+import mmap
+import socket
+import struct
+import time
+
+from Clock import monotonic
+from TuioProtocol import TUIO_PORT, MAX_DATAGRAM, TuioDecoder
+
+TRACE_MAGIC = b'TUIOREC\x01'
+
+_record = struct.Struct('<dH')
+
+class TraceReader(object):
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(TRACE_MAGIC)] != TRACE_MAGIC:
+            self.close()
+            raise ValueError('%s is not a TUIO trace' % path)
+
+    def __iter__(self):
+        '''
+        Yields (timestamp, payload) pairs. The payload is a read-only buffer
+        over the mapped file and is only valid until the reader is closed.
+        '''
+        offset = len(TRACE_MAGIC)
+        end = len(self._map)
+        while offset + _record.size <= end:
+            timestamp, length = _record.unpack_from(self._map, offset)
+            offset += _record.size
+            yield timestamp, buffer(self._map, offset, length)
+            offset += length
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+def record(path, host='', port=TUIO_PORT, duration=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    sock.settimeout(0.5)
+    buf = bytearray(MAX_DATAGRAM)
+    view = memoryview(buf)
+    count = 0
+    with open(path, 'wb') as out:
+        out.write(TRACE_MAGIC)
+        start = monotonic()
+        try:
+            while duration is None or monotonic() - start < duration:
+                try:
+                    length = sock.recv_into(buf)
+                except socket.timeout:
+                    continue
+                out.write(_record.pack(monotonic() - start, length))
+                out.write(view[:length])
+                count += 1
+        except KeyboardInterrupt:
+            pass
+    sock.close()
+    return count
+
+def replay(path, host='127.0.0.1', port=TUIO_PORT, speed=1.0, loop=False, duration=None):
+    '''
+    Send a trace to host:port. speed scales the recorded timing, a speed of
+    0 sends as fast as possible. duration, in seconds, cuts a replay short.
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = (host, port)
+    reader = TraceReader(path)
+    count = 0
+    begin = monotonic()
+    try:
+        while True:
+            start = monotonic()
+            for timestamp, payload in reader:
+                if duration is not None and monotonic() - begin >= duration:
+                    return count
+                if speed > 0:
+                    delay = start + timestamp / speed - monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                sock.sendto(payload, address)
+                count += 1
+            if not loop:
+                break
+    finally:
+        reader.close()
+        sock.close()
+    return count
+
+def packets(path):
+    '''
+    Copy every datagram of a trace into memory, used by the benchmarks.
+    '''
+    reader = TraceReader(path)
+    try:
+        return [str(payload) for timestamp, payload in reader]
+    finally:
+        reader.close()
+
+def drive(path, tracker, callback=None):
+    '''
+    Decode a trace and feed each completed frame into tracker. callback, if
+    given, runs after every tracker update (a demo's gestures.process for example).
+    '''
+    decoder = TuioDecoder()
+    buf = bytearray(MAX_DATAGRAM)
+    reader = TraceReader(path)
+    frames = 0
+    try:
+        for timestamp, payload in reader:
+            length = len(payload)
+            buf[:length] = payload
+            if decoder.decode(buf, length):
+                tracker.update(decoder.cursors())
+                frames += 1
+                if callback is not None:
+                    callback()
+    finally:
+        reader.close()
+    return frames
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record and replay TUIO sessions.')
+    commands = parser.add_subparsers(dest='command')
+    rec = commands.add_parser('record', help='capture TUIO datagrams to a trace')
+    rec.add_argument('trace')
+    rec.add_argument('--port', type=int, default=TUIO_PORT)
+    rec.add_argument('--duration', type=float, default=None, help='seconds, default until Ctrl-C')
+    play = commands.add_parser('replay', help='send a trace to a TUIO port')
+    play.add_argument('trace')
+    play.add_argument('--host', default='127.0.0.1')
+    play.add_argument('--port', type=int, default=TUIO_PORT)
+    play.add_argument('--speed', type=float, default=1.0, help='timing scale, 1 is real time')
+    play.add_argument('--fast', action='store_true', help='send as fast as possible')
+    play.add_argument('--loop', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        print 'Recording TUIO on port %d, Ctrl-C to stop' % args.port
+        print 'Recorded %d datagrams' % record(args.trace, port=args.port, duration=args.duration)
+    else:
+        speed = 0 if args.fast else args.speed
+        print 'Replayed %d datagrams' % replay(args.trace, args.host, args.port, speed, args.loop)
@@ -0,0 +1,237 @@
+'''
+VolumeCache.py converts a stack of 16 bit slice files into one memory-mapped
+volume file and hands it to VTK without copying.
+
+The slices are read once, flipped into the row order vtkVolume16Reader
+produces, converted to native byte order and written after a page sized
+header holding the dimensions, spacing, byte order and checksums of the
+source slices. Later runs map the file and import it through a
+vtkImageImport that points straight at the mapping, so opening a demo
+costs the same no matter how many slices the volume has. Within one
+process open_volume() maps each volume once and hands every demo the same
+importer.
+
+The slices are read by a StackReader (see StackReader.py), many at a time
+into one buffer. volume_settings() gives the slice stack the demos open, by
+default the headsq dataset next to this file; the TUIO_VOLUME,
+TUIO_VOLUME_DIMENSIONS, TUIO_VOLUME_RANGE, TUIO_VOLUME_SPACING and
+TUIO_VOLUME_BYTE_ORDER environment variables, or the options of Main.py,
+point them at another one.
+
+A cache is reused while the sizes and modification times of the slices are
+unchanged. If they changed, the slices are checksummed again and the cache
+is only rebuilt when their contents really differ. Without the slice files
+the cache is used as it is.
+
+    python VolumeCache.py headsq/Data_headsq_quarter
+
+converts the headsq dataset ahead of time.
+'''
+
+import collections
+import hashlib
+import os
+import struct
+import sys
+
+import numpy
+import vtk
+
+from StackReader import StackReader, slice_paths
+
+CACHE_MAGIC = b'VOLCACHE'
+CACHE_VERSION = 1
+# the volume starts one page into the file, so the mapping is aligned
+HEADER_SIZE = 4096
+CACHE_EXTENSION = '.volume'
+
+# magic, version, dimensions, spacing, byte order, signature and checksum of the slices
+_header = struct.Struct('<8sI3I3dc20s20s')
+
+NATIVE_ORDER = b'<' if sys.byteorder == 'little' else b'>'
+
+# a stack of 16 bit slices, as open_volume() takes it
+VolumeSettings = collections.namedtuple('VolumeSettings', 'prefix dimensions image_range spacing byte_order')
+
+HEADSQ = VolumeSettings(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'headsq', 'Data_headsq_quarter'),
+                        (64, 64), (1, 93), (3.2, 3.2, 1.5), 'little')
+
+def volume_settings():
+    '''
+    The VolumeSettings of the volume the demos show: headsq, with any field
+    overridden from the environment. Numbers are separated by commas or x.
+    '''
+    def numbers(name, default, kind):
+        value = os.environ.get(name)
+        if not value:
+            return default
+        return tuple(kind(number) for number in value.replace('x', ',').split(','))
+    return VolumeSettings(os.environ.get('TUIO_VOLUME') or HEADSQ.prefix,
+                          numbers('TUIO_VOLUME_DIMENSIONS', HEADSQ.dimensions, int),
+                          numbers('TUIO_VOLUME_RANGE', HEADSQ.image_range, int),
+                          numbers('TUIO_VOLUME_SPACING', HEADSQ.spacing, float),
+                          os.environ.get('TUIO_VOLUME_BYTE_ORDER') or HEADSQ.byte_order)
+
+class VolumeCache(object):
+    def __init__(self, prefix, dimensions, image_range, spacing, byte_order='little', cache_path=None):
+        '''
+        Slice files are named prefix.N for N in image_range (first, last),
+        like vtkVolume16Reader's FilePrefix and ImageRange. dimensions is
+        the (columns, rows) of one slice.
+        '''
+        self.prefix = prefix
+        self.dimensions = (dimensions[0], dimensions[1], image_range[1] - image_range[0] + 1)
+        self.imageRange = image_range
+        self.spacing = tuple(float(s) for s in spacing)
+        self.byteOrder = byte_order
+        self.path = cache_path or prefix + CACHE_EXTENSION
+        self.array = None
+        self.importer = None
+        # sha1 of the slice files, identifies the volume's contents
+        self.checksum = None
+
+    def slices(self):
+        return slice_paths(self.prefix, self.imageRange)
+
+    def signature(self):
+        # digest of the slices' sizes and modification times, None without slices
+        digest = hashlib.sha1()
+        try:
+            for path in self.slices():
+                info = os.stat(path)
+                digest.update(b'%d:%r;' % (info.st_size, info.st_mtime))
+        except OSError:
+            return None
+        return digest.digest()
+
+    def reader(self):
+        return StackReader(self.dimensions, self.byteOrder)
+
+    def read_slices(self):
+        # the volume as vtkVolume16Reader sees it, bottom row first, and a checksum of the files
+        digest = hashlib.sha1()
+        volume = self.reader().read(self.slices(), digest=digest)
+        return volume, digest.digest()
+
+    def read_header(self):
+        try:
+            with open(self.path, 'rb') as f:
+                fields = _header.unpack(f.read(_header.size))
+        except (IOError, struct.error):
+            return None
+        magic, version = fields[:2]
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            return None
+        return {'dimensions': fields[2:5], 'spacing': fields[5:8], 'order': fields[8],
+                'signature': fields[9], 'checksum': fields[10]}
+
+    def write(self, volume, signature, checksum):
+        header = _header.pack(CACHE_MAGIC, CACHE_VERSION, *(self.dimensions + self.spacing +
+                              (NATIVE_ORDER, signature or b'\0' * 20, checksum)))
+        # write a new file and rename it over the old one, a demo starting
+        # at the same time never maps a half written volume
+        temp = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(temp, 'wb') as out:
+            out.write(header.ljust(HEADER_SIZE, b'\0'))
+            volume.tofile(out)
+        os.rename(temp, self.path)
+
+    def update_signature(self, header, signature):
+        with open(self.path, 'r+b') as f:
+            f.write(_header.pack(CACHE_MAGIC, CACHE_VERSION, *(header['dimensions'] + header['spacing'] +
+                                 (header['order'], signature, header['checksum']))))
+
+    def validate(self):
+        '''
+        Make sure the cache file matches the slices, converting them if
+        needed. Returns True if the cache had to be (re)built.
+        '''
+        header = self.read_header()
+        signature = self.signature()
+        if header is not None and header['dimensions'] == self.dimensions and \
+                header['spacing'] == self.spacing and header['order'] == NATIVE_ORDER:
+            self.checksum = header['checksum']
+            if signature is None or signature == header['signature']:
+                return False
+            # touched slices: only rebuild if the contents changed
+            volume, checksum = self.read_slices()
+            if checksum == header['checksum']:
+                self.update_signature(header, signature)
+                return False
+        else:
+            if signature is None:
+                raise IOError('no volume cache at %s and no slices at %s.*' % (self.path, self.prefix))
+            volume, checksum = self.read_slices()
+        self.checksum = checksum
+        self.write(volume, signature, checksum)
+        return True
+
+    def open(self):
+        '''
+        Return a vtkImageImport whose output is the volume, mapped from the
+        cache file. The importer reads the mapping directly, so the mapping
+        must stay open as long as the importer is used.
+        '''
+        if self.importer is not None:
+            return self.importer
+        columns, rows, count = self.dimensions
+        try:
+            self.validate()
+            self.array = numpy.memmap(self.path, numpy.uint16, 'r', HEADER_SIZE, (count, rows, columns))
+        except (IOError, OSError):
+            if self.signature() is None:
+                raise
+            # the cache cannot be written here, import the slices from the
+            # buffer they were read into
+            self.array, self.checksum = self.read_slices()
+
+        importer = vtk.vtkImageImport()
+        importer.SetImportVoidPointer(self.array, 1)
+        importer.SetDataScalarTypeToUnsignedShort()
+        importer.SetNumberOfScalarComponents(1)
+        importer.SetWholeExtent(0, columns - 1, 0, rows - 1, 0, count - 1)
+        importer.SetDataExtentToWholeExtent()
+        importer.SetDataSpacing(*self.spacing)
+        importer.SetDataOrigin(0.0, 0.0, 0.0)
+        self.importer = importer
+        return importer
+
+# volumes opened by this process; the importers point into their mappings,
+# which therefore stay open until the process ends
+_volumes = {}
+
+def open_volume(prefix, dimensions, image_range, spacing, byte_order='little', cache_path=None):
+    '''
+    vtkImageImport with the volume of the slices prefix.N, through the
+    cache. Demos opening the same volume again share the importer.
+    '''
+    key = (prefix, tuple(dimensions), tuple(image_range), tuple(spacing), byte_order, cache_path)
+    if key not in _volumes:
+        _volumes[key] = VolumeCache(prefix, dimensions, image_range, spacing, byte_order, cache_path)
+    return _volumes[key].open()
+
+def volume_checksum(importer):
+    # the checksum of a volume opened with open_volume(), None for any other source
+    for cache in _volumes.values():
+        if cache.importer is importer:
+            return cache.checksum
+    return None
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Convert a stack of 16 bit slices into a volume cache.')
+    parser.add_argument('prefix', nargs='?', default=HEADSQ.prefix, help='slice files are prefix.1, prefix.2, ...')
+    parser.add_argument('--dimensions', type=int, nargs=2, default=HEADSQ.dimensions)
+    parser.add_argument('--range', type=int, nargs=2, default=HEADSQ.image_range)
+    parser.add_argument('--spacing', type=float, nargs=3, default=HEADSQ.spacing)
+    parser.add_argument('--big-endian', action='store_true')
+    parser.add_argument('--output', default=None, help='default: prefix%s' % CACHE_EXTENSION)
+    args = parser.parse_args()
+
+    cache = VolumeCache(args.prefix, args.dimensions, args.range, args.spacing,
+                        'big' if args.big_endian else 'little', args.output)
+    start = time.time()
+    built = cache.validate()
+    print '%s %s in %.1f ms' % ('Wrote' if built else 'Up to date:', cache.path, 1e3 * (time.time() - start))
@@ -0,0 +1,376 @@
+'''
+VolumePyramid.py keeps volumes too large for memory on disk, as a pyramid of
+bricks, and reads only the parts a view needs.
+
+Level 0 is the volume itself, each level after it half the size of the one
+before along every axis, down to a level that fits in one brick. Every
+level is cut into bricks of BRICK voxels per axis, padded at the far edges,
+and the bricks of all levels are stored one after another in a file next to
+the slices, after a page sized header. The file is built from the slice
+files a brick deep at a time, and every level from the one before it, so
+building never holds more than a few slabs in memory.
+
+read() assembles any extent of any level from the bricks it overlaps. The
+bricks come from the memory-mapped file through a BrickCache, which keeps
+the most recently used ones in memory up to a byte budget and drops the
+least recently used beyond it.
+
+A PyramidPlane is a SlicePlane (see SlicePlanes.py) that shows one slice of
+a pyramid, read at the level screen_level() picks for the camera, and
+coloured as it is read. Moving it reads the bricks of the new slice only.
+
+open_pyramid() builds or reuses the pyramid of a slice stack. Volumes larger
+than TUIO_VOLUME_BUDGET megabytes (1024 by default) are opened through one
+by the demos; half the budget goes to the brick cache, the isosurfaces are
+taken from the finest level that fits in the other half.
+
+    python VolumePyramid.py headsq/Data_headsq_quarter --brick 16
+
+builds the headsq pyramid and times reading slices at every level.
+'''
+
+import collections
+import math
+import os
+import struct
+
+import numpy
+import vtk
+
+from VolumeCache import VolumeCache, NATIVE_ORDER, HEADER_SIZE
+from SlicePlanes import SlicePlane, color_table
+
+PYRAMID_MAGIC = b'VOLPYRMD'
+PYRAMID_VERSION = 1
+PYRAMID_EXTENSION = '.pyramid'
+
+BRICK = 32
+
+# magic, version, dimensions, spacing, byte order, brick size, levels and signature of the slices
+_header = struct.Struct('<8sI3I3dcII20s')
+
+def memory_budget():
+    # bytes the demos may hold of one volume, from TUIO_VOLUME_BUDGET in megabytes
+    return int(float(os.environ.get('TUIO_VOLUME_BUDGET') or 1024) * 1024 * 1024)
+
+def level_dimensions(dimensions, brick):
+    # (x, y, z) points of every level, halving until one brick holds the level
+    levels = [tuple(dimensions)]
+    while max(levels[-1]) > brick:
+        levels.append(tuple((points + 1) // 2 for points in levels[-1]))
+    return levels
+
+def downsample(volume):
+    # half the points along every axis, each the mean of the 2x2x2 it covers
+    pad = [(0, points % 2) for points in volume.shape]
+    volume = numpy.pad(volume, pad, 'edge').astype(numpy.float32)
+    count, rows, columns = volume.shape
+    blocks = volume.reshape(count // 2, 2, rows // 2, 2, columns // 2, 2)
+    return numpy.rint(blocks.mean(axis=(1, 3, 5)))
+
+class BrickCache(object):
+    '''
+    The most recently used bricks, up to budget bytes; the brick just read is
+    always kept.
+    '''
+    def __init__(self, budget):
+        self.budget = budget
+        self.bricks = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        brick = self.bricks.pop(key, None)
+        if brick is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            brick = load()
+            self.size += brick.nbytes
+        self.bricks[key] = brick
+        while self.size > self.budget and len(self.bricks) > 1:
+            self.size -= self.bricks.popitem(last=False)[1].nbytes
+        return brick
+
+    def report(self):
+        total = self.hits + self.misses
+        return '%d bricks, %.1f MB, %d reads, %.0f%% hits' % (len(self.bricks), self.size / 1048576.0,
+                                                             total, 100.0 * self.hits / max(total, 1))
+
+class VolumePyramid(object):
+    def __init__(self, prefix, dimensions, image_range, spacing, byte_order='little', brick=BRICK,
+                 budget=None, path=None):
+        '''
+        The slices are named and laid out as for open_volume(). budget is
+        the brick cache's size in bytes, half of memory_budget() by default.
+        '''
+        self.slices = VolumeCache(prefix, dimensions, image_range, spacing, byte_order)
+        self.dimensions = self.slices.dimensions
+        self.spacing = self.slices.spacing
+        self.dtype = numpy.dtype(numpy.uint16)
+        self.brick = brick
+        self.path = path or prefix + PYRAMID_EXTENSION
+        self.levels = level_dimensions(self.dimensions, brick)
+        # bricks per axis of each level, in z, y, x order, and where each level starts
+        self.counts = [tuple(-(-points // brick) for points in reversed(level)) for level in self.levels]
+        self.offsets = numpy.cumsum([0] + [numpy.prod(counts) for counts in self.counts])
+        self.cache = BrickCache(memory_budget() // 2 if budget is None else budget)
+        self.bricks = None
+        # importers of whole levels, with the arrays they point into
+        self.sources = {}
+
+    def extent(self, level):
+        columns, rows, count = self.levels[level]
+        return (0, columns - 1, 0, rows - 1, 0, count - 1)
+
+    def geometry(self, level):
+        # origin and spacing of a level's points, each centred on the points it averages
+        scale = 2 ** level
+        spacing = numpy.array(self.spacing) * scale
+        origin = numpy.array(self.spacing) * (scale - 1) / 2.0
+        return origin, spacing
+
+    def read_header(self):
+        try:
+            with open(self.path, 'rb') as f:
+                fields = _header.unpack(f.read(_header.size))
+        except (IOError, struct.error):
+            return None
+        magic, version = fields[:2]
+        if magic != PYRAMID_MAGIC or version != PYRAMID_VERSION:
+            return None
+        return {'dimensions': fields[2:5], 'spacing': fields[5:8], 'order': fields[8],
+                'brick': fields[9], 'levels': fields[10], 'signature': fields[11]}
+
+    def validate(self):
+        '''
+        Make sure the pyramid file matches the slices, building it if
+        needed. Returns True if it had to be (re)built.
+        '''
+        header = self.read_header()
+        signature = self.slices.signature()
+        if header is not None and header['dimensions'] == self.dimensions and \
+                header['spacing'] == self.spacing and header['order'] == NATIVE_ORDER and \
+                header['brick'] == self.brick and header['levels'] == len(self.levels) and \
+                (signature is None or signature == header['signature']):
+            return False
+        if signature is None:
+            raise IOError('no volume pyramid at %s and no slices at %s.*' % (self.path, self.slices.prefix))
+        self.build(signature)
+        return True
+
+    def open(self):
+        if self.bricks is None:
+            self.validate()
+            self.bricks = self.map(self.path, 'r')
+        return self
+
+    def map(self, path, mode):
+        brick = self.brick
+        return numpy.memmap(path, self.dtype, mode, HEADER_SIZE, (int(self.offsets[-1]), brick, brick, brick))
+
+    def build(self, signature):
+        # a new file renamed over the old one, like the volume cache
+        temp = '%s.%d.tmp' % (self.path, os.getpid())
+        header = _header.pack(PYRAMID_MAGIC, PYRAMID_VERSION, *(self.dimensions + self.spacing +
+                              (NATIVE_ORDER, self.brick, len(self.levels), signature)))
+        with open(temp, 'wb') as out:
+            out.write(header.ljust(HEADER_SIZE, b'\0'))
+            out.truncate(HEADER_SIZE + int(self.offsets[-1]) * self.brick ** 3 * self.dtype.itemsize)
+        self.bricks = self.map(temp, 'r+')
+        try:
+            paths = self.slices.slices()
+            reader = self.slices.reader()
+            columns, rows, count = self.dimensions
+            slab = numpy.empty((self.brick, rows, columns), numpy.uint16)
+            for bz in range(self.counts[0][0]):
+                first, last = bz * self.brick, min(count, (bz + 1) * self.brick)
+                self.store(0, bz, reader.read(paths[first:last], slab[:last - first]))
+            for level in range(1, len(self.levels)):
+                count = self.levels[level - 1][2]
+                extent = list(self.extent(level - 1))
+                for bz in range(self.counts[level][0]):
+                    extent[4] = 2 * bz * self.brick
+                    extent[5] = min(count, 2 * (bz + 1) * self.brick) - 1
+                    self.store(level, bz, downsample(self.read(level - 1, extent, cached=False)))
+            self.bricks.flush()
+        finally:
+            self.bricks = None
+        os.rename(temp, self.path)
+
+    def store(self, level, bz, slab):
+        # write one brick deep slab of a level, padding it to whole bricks
+        brick = self.brick
+        depth, rows, columns = self.counts[level]
+        pad = [(0, brick - slab.shape[0]), (0, rows * brick - slab.shape[1]), (0, columns * brick - slab.shape[2])]
+        slab = numpy.pad(slab, pad, 'edge').reshape(brick, rows, brick, columns, brick).transpose(1, 3, 0, 2, 4)
+        first = self.offsets[level] + bz * rows * columns
+        self.bricks[first:first + rows * columns] = slab.reshape(-1, brick, brick, brick)
+
+    def get_brick(self, level, bz, by, bx, cached=True):
+        depth, rows, columns = self.counts[level]
+        index = self.offsets[level] + (bz * rows + by) * columns + bx
+        if not cached:
+            return self.bricks[index]
+        return self.cache.get((level, bz, by, bx), lambda: numpy.array(self.bricks[index]))
+
+    def read(self, level, extent, cached=True):
+        '''
+        (z, y, x) array of the points of level within extent, given as
+        (x0, x1, y0, y1, z0, z1) like a VTK extent.
+        '''
+        brick = self.brick
+        low = numpy.array(extent[4::-2])
+        high = numpy.array(extent[5::-2])
+        volume = numpy.empty(high - low + 1, self.dtype)
+        ranges = [range(first // brick, last // brick + 1) for first, last in zip(low, high)]
+        for bz in ranges[0]:
+            for by in ranges[1]:
+                for bx in ranges[2]:
+                    data = self.get_brick(level, bz, by, bx, cached)
+                    start = numpy.array((bz, by, bx)) * brick
+                    first = numpy.maximum(low, start)
+                    last = numpy.minimum(high, start + brick - 1) + 1
+                    volume[tuple(slice(a, b) for a, b in zip(first - low, last - low))] = \
+                        data[tuple(slice(a, b) for a, b in zip(first - start, last - start))]
+        return volume
+
+    def level_within(self, budget):
+        # finest level whose whole volume takes at most budget bytes, else the coarsest
+        for level, dimensions in enumerate(self.levels):
+            if numpy.prod(dimensions) * self.dtype.itemsize <= budget:
+                return level
+        return len(self.levels) - 1
+
+    def level_source(self, level):
+        '''
+        vtkImageImport of a whole level, for the filters that need the
+        entire volume such as the isosurfaces and the outline.
+        '''
+        if level in self.sources:
+            return self.sources[level][0]
+        volume = self.read(level, self.extent(level))
+        origin, spacing = self.geometry(level)
+        importer = vtk.vtkImageImport()
+        importer.SetImportVoidPointer(volume, 1)
+        importer.SetDataScalarTypeToUnsignedShort()
+        importer.SetNumberOfScalarComponents(1)
+        importer.SetWholeExtent(*self.extent(level))
+        importer.SetDataExtentToWholeExtent()
+        importer.SetDataSpacing(*spacing)
+        importer.SetDataOrigin(*origin)
+        self.sources[level] = (importer, volume)
+        return importer
+
+def screen_level(pyramid, renderer):
+    '''
+    Coarsest level of pyramid with about one point per pixel across the
+    volume as renderer's camera shows it.
+    '''
+    columns, rows, count = pyramid.dimensions
+    size = numpy.array(pyramid.spacing) * (columns - 1, rows - 1, count - 1)
+    corners = []
+    for corner in range(8):
+        point = size * ((corner & 1), (corner >> 1) & 1, (corner >> 2) & 1)
+        renderer.SetWorldPoint(point[0], point[1], point[2], 1.0)
+        renderer.WorldToDisplay()
+        corners.append(renderer.GetDisplayPoint()[:2])
+    pixels = numpy.ptp(numpy.array(corners), axis=0).max()
+    points = max(pyramid.dimensions)
+    if points <= pixels:
+        return 0
+    return min(int(math.log(points / max(pixels, 1.0), 2)), len(pyramid.levels) - 1)
+
+class PyramidPlane(SlicePlane):
+    def __init__(self, actor, pyramid, lut, axis, position=None):
+        '''
+        actor is a vtkImageActor that shows slice position of pyramid
+        across axis, coloured through lut.
+        '''
+        self.pyramid = pyramid
+        self.rgba, self.offset = color_table(lut, pyramid.dtype)
+        self.level = 0
+        self.shown = None
+        self.importer = vtk.vtkImageImport()
+        self.importer.SetDataScalarTypeToUnsignedChar()
+        self.importer.SetNumberOfScalarComponents(4)
+        actor.GetMapper().SetInputConnection(self.importer.GetOutputPort())
+        SlicePlane.__init__(self, actor, pyramid.extent(0), axis, position)
+
+    def set_level(self, level):
+        level = min(max(level, 0), len(self.pyramid.levels) - 1)
+        if level != self.level:
+            self.level = level
+            self.show()
+
+    def show(self):
+        extent = list(self.pyramid.extent(self.level))
+        index = min(self.slice() >> self.level, extent[2 * self.axis + 1])
+        extent[2 * self.axis] = extent[2 * self.axis + 1] = index
+        if self.shown == (self.level, index):
+            return
+        self.shown = (self.level, index)
+        values = self.pyramid.read(self.level, extent)
+        self.colors = self.rgba[values - self.offset if self.offset else values]
+        origin, spacing = self.pyramid.geometry(self.level)
+        self.importer.SetImportVoidPointer(self.colors, 1)
+        self.importer.SetWholeExtent(*extent)
+        self.importer.SetDataExtentToWholeExtent()
+        self.importer.SetDataSpacing(*spacing)
+        self.importer.SetDataOrigin(*origin)
+        self.importer.Modified()
+        self.actor.SetDisplayExtent(*extent)
+
+# pyramids opened by this process
+_pyramids = {}
+
+def open_pyramid(prefix, dimensions, image_range, spacing, byte_order='little', brick=BRICK):
+    '''
+    VolumePyramid of the slices prefix.N, built the first time. Demos
+    opening the same volume again share the pyramid and its brick cache.
+    '''
+    key = (prefix, tuple(dimensions), tuple(image_range), tuple(spacing), byte_order, brick)
+    if key not in _pyramids:
+        _pyramids[key] = VolumePyramid(prefix, dimensions, image_range, spacing, byte_order, brick)
+    return _pyramids[key].open()
+
+def out_of_core(dimensions, image_range):
+    # whether a stack of 16 bit slices is larger than the memory budget
+    count = image_range[1] - image_range[0] + 1
+    return dimensions[0] * dimensions[1] * count * 2 > memory_budget()
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Build a volume pyramid and time reading slices from it.')
+    parser.add_argument('prefix', help='slice files are prefix.1, prefix.2, ...')
+    parser.add_argument('--dimensions', type=int, nargs=2, default=(64, 64))
+    parser.add_argument('--range', type=int, nargs=2, default=(1, 93))
+    parser.add_argument('--spacing', type=float, nargs=3, default=(3.2, 3.2, 1.5))
+    parser.add_argument('--big-endian', action='store_true')
+    parser.add_argument('--brick', type=int, default=BRICK)
+    parser.add_argument('--budget', type=float, default=None, help='brick cache megabytes')
+    args = parser.parse_args()
+
+    pyramid = VolumePyramid(args.prefix, args.dimensions, args.range, args.spacing,
+                            'big' if args.big_endian else 'little', args.brick,
+                            None if args.budget is None else int(args.budget * 1024 * 1024))
+    start = time.time()
+    built = pyramid.validate()
+    print '%s %s in %.1f ms' % ('Wrote' if built else 'Up to date:', pyramid.path, 1e3 * (time.time() - start))
+    pyramid.open()
+    print '%5s %16s %8s %12s %12s' % ('level', 'points', 'bricks', 'axial ms', 'again ms')
+    for level, dimensions in enumerate(pyramid.levels):
+        extent = list(pyramid.extent(level))
+        extent[4] = extent[5] = extent[5] // 2
+        start = time.time()
+        pyramid.read(level, extent)
+        first = time.time() - start
+        start = time.time()
+        pyramid.read(level, extent)
+        again = time.time() - start
+        print '%5d %16s %8d %12.2f %12.2f' % (level, 'x'.join(map(str, dimensions)), numpy.prod(pyramid.counts[level]),
+                                              1e3 * first, 1e3 * again)
+    print 'brick cache:', pyramid.cache.report()
@@ -0,0 +1,314 @@
+'''
+This example reads a volume dataset and renders it directly, without
+extracting any surfaces, with a multi-threaded CPU ray-cast mapper. While a
+gesture moves the camera the rays take fewer samples and fewer rays are
+cast, as coarse as needed to keep up the target frame rate; once the scene
+stops moving it is rendered again at full quality.
+'''
+
+import vtk
+import math
+import multiprocessing
+import numpy
+from VolumeCache import open_volume
+from VolumePyramid import open_pyramid, out_of_core, memory_budget
+from MultiTouch import CursorTracker, OneEuroFilter
+from LevelOfDetail import LodController
+from Interaction import SceneIntent, TripleBuffer
+from DemoContext import DemoContext
+from Instrumentation import TRACK, GESTURE, QUEUE, CAMERA
+from Gestures import GestureEngine, NONE, ROTATE, MANIPULATE, TERMINATE
+
+
+WIDTH = 480
+HEIGHT = 640
+
+# (distance between samples along a ray, in units of the finest voxel
+# spacing; distance between rays, in pixels) from full quality down to the
+# coarsest level used while moving
+SAMPLING = ((0.5, 1.0), (1.0, 1.5), (2.0, 2.0), (4.0, 3.0))
+
+class Marker:
+    def __init__(self, id):
+        # Create text mapper and 2d actor to display finger position.
+        self.textMapper = vtk.vtkTextMapper()
+        self.textMapper.SetInput(id)
+        self.tprop = self.textMapper.GetTextProperty()
+        self.tprop.SetFontFamilyToArial()
+        self.tprop.SetFontSize(30)
+        self.tprop.BoldOn()
+        self.tprop.ShadowOn()
+        self.tprop.SetColor(1, 0, 0)
+        self.textActor = vtk.vtkActor2D()
+        self.textActor.VisibilityOff()
+        self.textActor.SetMapper(self.textMapper)
+
+class VolumeRendering:
+    def __init__(self, context=None):
+
+        # Create the renderer. The render window and the interactor come from
+        # the context, which other demos may share (see DemoContext.py).
+        self.context = context or DemoContext()
+        self.ren = vtk.vtkRenderer()
+        self.renwin = self.context.renwin
+        self.iren = self.context.iren
+
+        # Create text mappers and 2d actors to display finger position.
+        self.fingerMarker1 = Marker("(1)")
+        self.fingerMarker2 = Marker("(2)")
+        self.fingerMarker3 = Marker("(3)")
+
+        # The same volume as the slice demos, memory-mapped from the volume
+        # cache. A volume larger than the memory budget is rendered from the
+        # finest level of its brick pyramid that fits (see VolumePyramid.py).
+        settings = self.context.volume
+        if out_of_core(settings.dimensions, settings.image_range):
+            pyramid = open_pyramid(*settings)
+            self.volume = pyramid.level_source(pyramid.level_within(memory_budget() // 2))
+        else:
+            self.volume = open_volume(*settings)
+
+        # The transfer functions give every value a colour and an opacity.
+        # Air is transparent, the skin (around 500) a faint orange haze and
+        # the bone (1150 and up) nearly opaque.
+        self.opacity = vtk.vtkPiecewiseFunction()
+        self.opacity.AddPoint(0, 0.0)
+        self.opacity.AddPoint(400, 0.0)
+        self.opacity.AddPoint(500, 0.05)
+        self.opacity.AddPoint(1000, 0.05)
+        self.opacity.AddPoint(1150, 0.8)
+        self.opacity.AddPoint(2000, 0.9)
+        self.color = vtk.vtkColorTransferFunction()
+        self.color.AddRGBPoint(0, 0.0, 0.0, 0.0)
+        self.color.AddRGBPoint(500, 1.0, 0.49, 0.25)
+        self.color.AddRGBPoint(1000, 1.0, 0.49, 0.25)
+        self.color.AddRGBPoint(1150, 1.0, 1.0, 0.9412)
+
+        self.property = vtk.vtkVolumeProperty()
+        self.property.SetColor(self.color)
+        self.property.SetScalarOpacity(self.opacity)
+        self.property.SetInterpolationTypeToLinear()
+        self.property.ShadeOn()
+        self.property.SetAmbient(0.3)
+        self.property.SetDiffuse(0.7)
+        self.property.SetSpecular(0.2)
+
+        # The fixed point ray caster runs on the CPU, one thread per core.
+        # Its own sample distance adjustment is off: the LodController below
+        # picks the sampling from measured frame times.
+        self.mapper = vtk.vtkFixedPointVolumeRayCastMapper()
+        self.mapper.SetInputConnection(self.volume.GetOutputPort())
+        self.mapper.SetNumberOfThreads(multiprocessing.cpu_count())
+        self.mapper.AutoAdjustSampleDistancesOff()
+        self.mapper.LockSampleDistanceToInputSpacingOff()
+        self.voxelSize = min(self.volume.GetDataSpacing())
+
+        self.head = vtk.vtkVolume()
+        self.head.SetMapper(self.mapper)
+        self.head.SetProperty(self.property)
+
+        # An outline provides context around the data.
+        self.outlineData = vtk.vtkOutlineFilter()
+        self.outlineData.SetInputConnection(self.volume.GetOutputPort())
+        self.mapOutline = vtk.vtkPolyDataMapper()
+        self.mapOutline.SetInputConnection(self.outlineData.GetOutputPort())
+        self.outline = vtk.vtkActor()
+        self.outline.SetMapper(self.mapOutline)
+        self.outline.GetProperty().SetColor(1, 1, 1)
+
+        # Look at the face, as MultipleSlices does.
+        self.aCamera = vtk.vtkCamera()
+        self.aCamera.SetViewUp(0, 0, -1)
+        self.aCamera.SetPosition(0, 1, 0)
+        self.aCamera.SetFocalPoint(0, 0, 0)
+        self.aCamera.ComputeViewPlaneNormal()
+
+        self.ren.AddVolume(self.head)
+        self.ren.AddActor(self.outline)
+        self.ren.AddActor2D(self.fingerMarker1.textActor)
+        self.ren.AddActor2D(self.fingerMarker2.textActor)
+        self.ren.AddActor2D(self.fingerMarker3.textActor)
+
+        self.ren.SetActiveCamera(self.aCamera)
+        self.ren.ResetCamera()
+        self.aCamera.Dolly(1.5)
+        self.ren.SetBackground(0, 0, 0)
+        self.size = (640, 480)
+        self.ren.ResetCameraClippingRange()
+
+        '''
+        TUIO STUFF
+        '''
+        # the socket, input thread, stats and log belong to the context
+        self.stats = self.context.stats
+        self.log = self.context.log
+        self.tracking = self.context.tracking
+        self.input = self.context.input
+        # smooth tracker jitter so a resting hand does not re-render the scene
+        self.tracker = CursorTracker(4, filter=OneEuroFilter(4))
+        self.gestures = GestureEngine(self.tracker, {0: NONE, 1: ROTATE, 2: MANIPULATE, 3: MANIPULATE, 4: TERMINATE})
+        self.gestures.on_transition(lambda old, new: self.log.info('gesture %s -> %s', old, new))
+        self.gestures.on(NONE, self.NoFingers)
+        self.gestures.on(ROTATE, self.OnRotate)
+        self.gestures.on(MANIPULATE, self.OnManipulate)
+        self.gestures.on(TERMINATE, self.OnTerminate)
+        self.fingerMarkers = [self.fingerMarker1, self.fingerMarker2, self.fingerMarker3]
+
+        # gesture handlers run on the input thread and only record what the
+        # scene should become, the render thread applies the newest record
+        self.intent = SceneIntent(len(self.fingerMarkers))
+        self.intents = TripleBuffer(lambda: SceneIntent(len(self.fingerMarkers)))
+        self.applied = numpy.zeros(6)
+
+        # the scene is marked dirty when an intent is applied, the scheduler renders it
+        self.scheduler = self.context.scheduler
+
+        # while a gesture moves the camera the rays are sampled coarser, as
+        # far as needed to hold the target frame rate (see LevelOfDetail.py)
+        self.lod = LodController(self.scheduler, len(SAMPLING), self.SetSampling)
+        self.SetSampling(0)
+        self.terminate = False
+
+    def Start(self):
+        self.Reset()
+        self.context.activate(self)
+        self.scheduler.render()
+        self.lod.resync()
+        self.RunTUIO()
+
+    def Reset(self):
+        # forget the fingers and the close gesture left over from the last run
+        self.terminate = False
+        self.intent.terminate = False
+        self.intents.read(0)
+        self.gestures.reset()
+        self.intent.markerCount = 0
+        self.ShowMarkers(self.intent)
+
+    def RunTUIO(self):
+        while not self.terminate :
+            # sleep until the input thread publishes a new scene state, a
+            # pending render is due or full quality should come back
+            timeout = self.scheduler.timeout()
+            if self.lod.timeout() is not None:
+                timeout = min(timeout, self.lod.timeout())
+            intent = self.intents.read(timeout)
+            if intent is not None:
+                self.ApplyIntent(intent)
+            self.lod.service()
+            self.scheduler.service()
+
+    def OnInput(self, timestamp, cursors):
+        # input thread: track the fingers, run the gestures, publish the result
+        start = self.stats.clock()
+        if self.tracker.update(cursors, timestamp) or self.gestures.pending():
+            start = self.stats.lap(TRACK, start)
+            self.gestures.process()
+            self.stats.lap(GESTURE, start)
+            self.intent.stamp = timestamp
+            self.intents.publish(self.intent)
+
+    def ApplyIntent(self, intent):
+        # render thread: bring the scene up to date with the newest intent
+        start = self.stats.lap(QUEUE, intent.stamp)
+        azimuth, elevation, roll, zoom, dx, dy = intent.camera - self.applied
+        self.applied[:] = intent.camera
+        camera = self.ren.GetActiveCamera()
+        if azimuth or elevation:
+            self.Rotate(self.ren, camera, azimuth, elevation)
+        if dx or dy or roll or zoom:
+            self.Manipulate(self.ren, camera, dx, dy, roll, math.exp(zoom))
+        if azimuth or elevation or dx or dy or roll or zoom:
+            self.lod.interacting()
+        self.ShowMarkers(intent)
+        if intent.terminate:
+            self.terminate = True
+        self.stats.lap(CAMERA, start)
+        self.scheduler.mark_dirty(intent.stamp)
+
+    def SetSampling(self, level):
+        sample, image = SAMPLING[level]
+        self.mapper.SetSampleDistance(sample * self.voxelSize)
+        self.mapper.SetImageSampleDistance(image)
+        self.log.debug('ray sampling level %d', level)
+        self.scheduler.mark_dirty()
+
+    def ShowMarkers(self, intent):
+        # one marker per finger, in touch order
+        for i, marker in enumerate(self.fingerMarkers):
+            if i < intent.markerCount:
+                marker.textActor.SetPosition(intent.markers[i])
+                marker.textActor.VisibilityOn()
+            else:
+                marker.textActor.VisibilityOff()
+
+    def NoFingers(self, frame):
+        self.log.debug('no fingers')
+        self.intent.set_markers(frame.positions)
+
+    def OnRotate(self, frame):
+        self.intent.set_markers(frame.positions)
+        prev, curr = frame.previous[0], frame.positions[0]
+        azimuth, elevation = (prev[0]-curr[0])/10, (prev[1]-curr[1])/10
+        self.log.debug('rotating %.2f %.2f', azimuth, elevation)
+        self.intent.rotate(azimuth, elevation)
+
+    def OnManipulate(self, frame):
+        # all fingers together pan, zoom and turn the scene
+        self.intent.set_markers(frame.positions)
+        if frame.moved:
+            dx, dy, angle, scale = frame.similarity()
+            self.intent.manipulate(dx, dy, angle, scale)
+
+    def OnTerminate(self, frame):
+        self.intent.terminate = True
+
+    def Rotate(self, ren, camera, azimuth, elevation):
+        camera.Azimuth(azimuth)
+        camera.Elevation(elevation)
+        camera.OrthogonalizeViewUp()
+
+    def Manipulate(self, ren, camera, dx, dy, angle, scale):
+        '''
+        Apply one frame of multi-finger motion as a single camera update:
+        the scene follows the fingers' translation (display pixels), turns
+        with their rotation (radians) and zooms with their spread.
+        '''
+        FPoint = camera.GetFocalPoint()
+        PPoint = camera.GetPosition()
+
+        # world offset matching the screen translation at the focal depth
+        ren.SetWorldPoint(FPoint[0], FPoint[1], FPoint[2], 1.0)
+        ren.WorldToDisplay()
+        DPoint = ren.GetDisplayPoint()
+        ren.SetDisplayPoint(DPoint[0]+dx, DPoint[1]+dy, DPoint[2])
+        ren.DisplayToWorld()
+        RPoint = ren.GetWorldPoint()
+        if RPoint[3] != 0.0:
+            RPoint = [c/RPoint[3] for c in RPoint[:3]]
+        offset = [FPoint[i]-RPoint[i] for i in range(3)]
+        camera.SetFocalPoint(FPoint[0]+offset[0], FPoint[1]+offset[1], FPoint[2]+offset[2])
+        camera.SetPosition(PPoint[0]+offset[0], PPoint[1]+offset[1], PPoint[2]+offset[2])
+
+        # rolling about the direction of projection turns the image the
+        # same way as the fingers
+        camera.Roll(math.degrees(angle))
+
+        if camera.GetParallelProjection():
+            camera.SetParallelScale(camera.GetParallelScale()/scale)
+        else:
+            camera.Dolly(scale)
+        ren.ResetCameraClippingRange()
+
+    def Kill(self):
+        print "Stopping VolumeRendering TUIO tracking"
+        self.log.flush()
+        print "%.1f renders/s" % self.scheduler.renders_per_second()
+        for level, elapsed in enumerate(self.lod.frameTimes):
+            if elapsed is not None:
+                print "Sampling %s: %.1f ms per frame" % (SAMPLING[level], 1e3 * elapsed)
+        if self.stats.enabled:
+            print self.stats.report()
+            print "Latency histograms written to %s" % self.stats.dump("VolumeRendering")
+        self.context.stop()
+        print "VolumeRendering.py Terminated"
@@ -0,0 +1,57 @@
+import threading
+import unittest
+from StringIO import StringIO
+
+from FlightRecorder import FlightRecorder
+
+class BlockingStream(object):
+    # holds the first write until released, counting writes in progress
+    def __init__(self):
+        self.lines = []
+        self.writing = 0
+        self.overlap = 0
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.writing += 1
+        self.overlap = max(self.overlap, self.writing)
+        if not self.entered.is_set():
+            self.entered.set()
+            self.release.wait(1.0)
+        self.lines += text.splitlines()
+        self.writing -= 1
+
+    def flush(self):
+        pass
+
+class FlushTest(unittest.TestCase):
+    def test_rate_limit(self):
+        stream = StringIO()
+        recorder = FlightRecorder(stream=stream, rate=5.0)
+        for i in range(100):
+            recorder.info('event %d', i)
+        recorder.flush()
+        self.assertEqual(stream.getvalue().count('event'), 5)
+        self.assertEqual(recorder._suppressed, 95)
+
+    def test_concurrent_flushes(self):
+        # a demo's Kill() flushes while the writer thread is writing
+        stream = BlockingStream()
+        recorder = FlightRecorder(stream=stream)
+        recorder.info('first')
+        writer = threading.Thread(target=recorder.flush)
+        writer.start()
+        self.assertTrue(stream.entered.wait(1.0))
+        recorder.info('second')
+        kill = threading.Thread(target=recorder.flush)
+        kill.start()
+        kill.join(0.2)
+        stream.release.set()
+        writer.join()
+        kill.join()
+        self.assertEqual(stream.overlap, 1)
+        self.assertEqual([line.split()[-1] for line in stream.lines], ['first', 'second'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import math
+import unittest
+
+import numpy
+
+from MultiTouch import Cursor, CursorTracker, OneEuroFilter
+from Gestures import GestureEngine, NONE, ROTATE, PICK, TERMINATE, solve_similarity
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class SettleTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.tracker = CursorTracker(4, filter=OneEuroFilter(4))
+        self.gestures = GestureEngine(self.tracker, {0: NONE, 1: ROTATE, 2: PICK, 4: TERMINATE},
+                                      settle=0.04, clock=self.clock)
+        self.fired = []
+        self.gestures.on_transition(lambda old, new: self.fired.append(new))
+
+    def input(self, cursors):
+        # what every demo's OnInput does with a frame
+        if self.tracker.update(cursors, self.clock.now) or self.gestures.pending():
+            self.gestures.process()
+
+    def hold(self, cursors, seconds, step=0.02):
+        # the input thread repeats the last frame while the fingers rest
+        end = self.clock.now + seconds
+        while self.clock.now < end:
+            self.clock.now += step
+            self.input(cursors)
+
+    def test_stationary_four_fingers_terminate(self):
+        hand = [Cursor(i, 0.25 + 0.125 * i, 0.5) for i in range(4)]
+        self.input(hand)
+        self.assertEqual(self.gestures.state, NONE)
+        self.assertTrue(self.gestures.pending())
+        self.hold(hand, 0.1)
+        self.assertEqual(self.fired, [TERMINATE])
+        self.assertFalse(self.gestures.pending())
+
+    def test_stationary_two_fingers_pick(self):
+        fingers = [Cursor(1, 0.25, 0.5), Cursor(2, 0.75, 0.5)]
+        self.input(fingers)
+        self.hold(fingers, 0.1)
+        self.assertEqual(self.fired, [PICK])
+
+    def test_fingers_landing_one_after_another(self):
+        hand = [Cursor(i, 0.25 + 0.125 * i, 0.5) for i in range(4)]
+        for count in range(1, 5):
+            self.input(hand[:count])
+            self.clock.now += 0.01
+        self.hold(hand, 0.1)
+        self.assertEqual(self.fired, [TERMINATE])
+
+    def test_lifting_every_finger_is_immediate(self):
+        finger = [Cursor(1, 0.25, 0.5)]
+        self.input(finger)
+        self.hold(finger, 0.1)
+        self.input([])
+        self.assertEqual(self.fired, [ROTATE, NONE])
+
+class SimilarityTest(unittest.TestCase):
+    def setUp(self):
+        self.previous = numpy.array([(100.0, 200.0), (180.0, 210.0), (150.0, 300.0)])
+
+    def transform(self, dx, dy, angle, scale):
+        # the fingers turned and scaled about their centroid, then moved
+        centroid = self.previous.mean(axis=0)
+        c, s = math.cos(angle), math.sin(angle)
+        p = self.previous - centroid
+        q = scale * numpy.column_stack((c * p[:, 0] - s * p[:, 1], s * p[:, 0] + c * p[:, 1]))
+        return q + centroid + (dx, dy)
+
+    def test_known_transform(self):
+        for expected in ((12.0, -7.0, 0.3, 1.5), (0.0, 0.0, -1.2, 0.8), (-3.5, 40.0, 0.0, 1.0)):
+            result = solve_similarity(self.previous, self.transform(*expected))
+            numpy.testing.assert_allclose(result, expected, atol=1e-9)
+
+    def test_noisy_fit(self):
+        # more fingers than unknowns: the fit averages out the noise
+        numpy.random.seed(1)
+        positions = self.transform(5.0, 5.0, 0.2, 1.25) + numpy.random.normal(0, 0.01, self.previous.shape)
+        numpy.testing.assert_allclose(solve_similarity(self.previous, positions), (5.0, 5.0, 0.2, 1.25), atol=0.02)
+
+    def test_one_finger_translates(self):
+        self.assertEqual(solve_similarity(numpy.array([(10.0, 20.0)]), numpy.array([(13.0, 16.0)])),
+                         (3.0, -4.0, 0.0, 1.0))
+
+    def test_no_fingers(self):
+        self.assertEqual(solve_similarity(numpy.zeros((0, 2)), numpy.zeros((0, 2))), (0.0, 0.0, 0.0, 1.0))
+
+if __name__ == '__main__':
+    unittest.main()
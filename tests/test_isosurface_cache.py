@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from IsosurfaceCache import IsosurfaceCache
+from IsosurfaceEngine import IsosurfaceEngine
+from test_isosurface_engine import image_source
+from test_span_space import sphere
+
+class FakeLog(object):
+    def __init__(self):
+        self.warnings = []
+
+    def warning(self, format, *args):
+        self.warnings.append(format % args)
+
+class StoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = image_source(sphere())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def cache(self, directory):
+        cache = IsosurfaceCache(directory, engine=IsosurfaceEngine(processes=1))
+        cache.log = FakeLog()
+        return cache
+
+    def test_stored_and_read_back(self):
+        cache = self.cache(os.path.join(self.directory, 'isosurfaces'))
+        cache.surface(self.source, 500)
+        cache.surface(self.source, 500)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.log.warnings, [])
+
+    def test_unwritable_directory(self):
+        # the directory cannot be made under a file
+        blocker = os.path.join(self.directory, 'file')
+        open(blocker, 'w').close()
+        cache = self.cache(os.path.join(blocker, 'isosurfaces'))
+        self.assertTrue(cache.surface(self.source, 500).GetOutput().GetNumberOfCells())
+        cache.surface(self.source, 580)
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(len(cache.log.warnings), 1)
+
+    def test_failed_rename(self):
+        cache = self.cache(self.directory)
+        os.mkdir(cache.path(self.source, 500, 60.0))
+        surface, = cache.contour(self.source, [500], 60.0)
+        self.assertTrue(surface.GetOutput().GetNumberOfCells())
+        self.assertEqual(len(cache.log.warnings), 1)
+        self.assertEqual([name for name in os.listdir(self.directory) if name.endswith('.tmp')], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+import numpy
+import vtk
+from vtk.util import numpy_support
+
+from IsosurfaceEngine import BACKENDS, IsosurfaceEngine
+from test_span_space import edge_counts, sphere
+
+def image_source(volume):
+    image = vtk.vtkImageData()
+    image.SetDimensions(volume.shape[::-1])
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(volume.ravel(), deep=1))
+    source = vtk.vtkImageChangeInformation()
+    source.SetInputData(image)
+    # spaced like headsq: vtkMarchingCubes then leaves points of a slab
+    # unmerged that it merges in the whole volume
+    source.SetOutputSpacing(3.2, 3.2, 1.5)
+    return source
+
+class PooledExtractTest(unittest.TestCase):
+    def check(self, volume, values):
+        source = image_source(volume)
+        for backend in sorted(BACKENDS):
+            single = IsosurfaceEngine(backend, 1).extract(source, values)
+            pooled = IsosurfaceEngine(backend, 3, pool_voxels=0).extract(source, values)
+            for value, expected, surface in zip(values, single, pooled):
+                self.assertEqual(edge_counts(surface), edge_counts(expected), (backend, value))
+
+    def test_integer_values(self):
+        # samples equal to the value put several vertices on the same point
+        self.check(sphere(), (500, 580, 600.5))
+
+    def test_plateaus(self):
+        # whole faces of samples equal to the value, some on the cut planes
+        self.check(sphere(40), (480, 600, 620))
+
+if __name__ == '__main__':
+    unittest.main()
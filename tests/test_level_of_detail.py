@@ -0,0 +1,42 @@
+import unittest
+
+from LevelOfDetail import LodController
+
+class FakeScheduler(object):
+    def __init__(self):
+        self.renders = 0
+        self.lastFrameTime = None
+
+    def render(self, elapsed):
+        self.renders += 1
+        self.lastFrameTime = elapsed
+
+class LodControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = FakeScheduler()
+        self.levels = []
+        self.lod = LodController(self.scheduler, 4, self.levels.append, target_fps=10.0)
+
+    def test_first_render_is_not_timed(self):
+        # the demo's first render runs the whole pipeline and is slow
+        self.scheduler.render(2.0)
+        self.lod.resync()
+        self.lod.interacting()
+        self.assertEqual(self.lod.frameTimes, [None] * 4)
+        self.assertEqual(self.lod.level, 0)
+        self.scheduler.render(0.05)
+        self.lod.interacting()
+        self.assertEqual(self.lod.frameTimes[0], 0.05)
+        self.assertEqual(self.levels, [])
+
+    def test_slow_level_steps_coarser(self):
+        self.scheduler.render(0.3)
+        self.lod.interacting()
+        self.assertEqual(self.lod.level, 1)
+        self.scheduler.render(0.05)
+        self.lod.interacting()
+        self.assertEqual(self.lod.level, 1)
+        self.assertEqual(self.levels, [1])
+
+if __name__ == '__main__':
+    unittest.main()
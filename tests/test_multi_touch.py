@@ -0,0 +1,66 @@
+import unittest
+
+import numpy
+
+from MultiTouch import WIDTH, HEIGHT, Cursor, CursorTracker, OneEuroFilter
+
+def cursor(id, x, y):
+    # the cursor at whole pixel (x, y), inverting CursorTracker.convert_coords
+    return Cursor(id, (x + 0.5) / WIDTH, (HEIGHT - y - 0.5) / HEIGHT)
+
+class DeadBandTest(unittest.TestCase):
+    def setUp(self):
+        self.tracker = CursorTracker(4, filter=OneEuroFilter(4, deadband=2.0))
+
+    def test_resting_finger_with_jitter(self):
+        self.assertTrue(self.tracker.update([cursor(1, 200, 100)], 0.0))
+        for frame in range(1, 60):
+            jitter = (frame % 3 - 1, (frame // 3) % 2)
+            changed = self.tracker.update([cursor(1, 200 + jitter[0], 100 + jitter[1])], frame / 60.0)
+            self.assertFalse(changed)
+            self.assertEqual(self.tracker._coords[1], (200, 100))
+
+    def test_moving_finger(self):
+        self.tracker.update([cursor(1, 200, 100)], 0.0)
+        changes = [self.tracker.update([cursor(1, 200 + 10 * frame, 100)], frame / 60.0) for frame in range(1, 20)]
+        self.assertTrue(all(changes[2:]))
+        x, y = self.tracker._coords[1]
+        self.assertTrue(300 < x <= 390)
+        self.assertEqual(y, 100)
+
+class MotionTest(unittest.TestCase):
+    def setUp(self):
+        self.tracker = CursorTracker(4, history=8)
+
+    def test_constant_velocity(self):
+        # 50 frames a second, one finger moving (500, -250) pixels/s, one resting
+        for frame in range(12):
+            self.tracker.update([cursor(3, 100 + 10 * frame, 300 - 5 * frame), cursor(4, 50, 50)], 0.02 * frame)
+        velocities = self.tracker.velocities()
+        accelerations = self.tracker.accelerations()
+        moving, resting = self.tracker._seen[3], self.tracker._seen[4]
+        numpy.testing.assert_allclose(velocities[moving], (500.0, -250.0), rtol=1e-9)
+        numpy.testing.assert_allclose(velocities[resting], (0.0, 0.0), atol=1e-9)
+        numpy.testing.assert_allclose(accelerations[moving], (0.0, 0.0), atol=1e-6)
+        free = [slot for slot in range(4) if slot not in (moving, resting)]
+        self.assertFalse(velocities[free].any())
+
+    def test_history_ring(self):
+        for frame in range(12):
+            self.tracker.update([cursor(3, 100 + frame, 100)], 0.02 * frame)
+        history = self.tracker.history(self.tracker._seen[3])
+        self.assertEqual(len(history), 8)
+        numpy.testing.assert_allclose(history[:, 0], numpy.arange(104, 112))
+        numpy.testing.assert_allclose(history[:, 2], 0.02 * numpy.arange(4, 12))
+
+    def test_new_touch_starts_a_new_history(self):
+        for frame in range(5):
+            self.tracker.update([cursor(3, 100 + 10 * frame, 100)], 0.02 * frame)
+        self.tracker.update([], 0.1)
+        self.tracker.update([cursor(5, 400, 400)], 0.12)
+        slot = self.tracker._seen[5]
+        self.assertEqual(len(self.tracker.history(slot)), 1)
+        self.assertFalse(self.tracker.velocities()[slot].any())
+
+if __name__ == '__main__':
+    unittest.main()
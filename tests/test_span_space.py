@@ -0,0 +1,48 @@
+import unittest
+
+import numpy
+
+import SpanSpace
+from IsosurfaceEngine import BACKENDS, polydata_to_triangles
+from SpanSpace import SpanIndex
+
+def sphere(step=1):
+    # int16 samples falling 20 per voxel from the centre, in steps of step
+    z, y, x = numpy.mgrid[:70, :66, :64]
+    r = numpy.sqrt((x - 31.3) ** 2 + (y - 33.1) ** 2 + (z - 35.2) ** 2)
+    return (numpy.round((1000 - 20 * r) / step) * step).astype(numpy.int16)
+
+def edge_counts(polys):
+    # open edges, edges of more than two triangles and triangles of a mesh
+    points, triangles = polydata_to_triangles(polys)
+    edges = numpy.sort(numpy.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]]), axis=1)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    counts = numpy.unique(edges[:, 0] * (len(points) + 1) + edges[:, 1], return_counts=True)[1]
+    return (counts == 1).sum(), (counts > 2).sum(), len(triangles)
+
+class BrickContourTest(unittest.TestCase):
+    def setUp(self):
+        # contour the active bricks however many there are
+        self.dense = SpanSpace.DENSE_FRACTION
+        SpanSpace.DENSE_FRACTION = 2.0
+
+    def tearDown(self):
+        SpanSpace.DENSE_FRACTION = self.dense
+
+    def check(self, volume, values):
+        index = SpanIndex(volume, (0, 0, 0), (1, 1, 1))
+        for backend in sorted(BACKENDS):
+            for value in values:
+                expected = edge_counts(index.contour_all(value, backend))
+                self.assertEqual(edge_counts(index.contour(value, backend)), expected, (backend, value))
+
+    def test_integer_values(self):
+        # samples equal to the value put several vertices on the same point
+        self.check(sphere(), (500, 580, 600.5))
+
+    def test_plateaus(self):
+        # whole faces of samples equal to the value, some on brick planes
+        self.check(sphere(40), (480, 600, 620))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+
+from MultiTouch import Cursor
+from TuioProtocol import (TuioDecoder, MAX_DATAGRAM, BUNDLE_TAG, IMMEDIATE, encode_cursor_bundle, _int32, _timetag,
+                          _osc_message)
+
+def decode(decoder, packet):
+    buf = bytearray(MAX_DATAGRAM)
+    buf[:len(packet)] = packet
+    return decoder.decode(buf, len(packet))
+
+class BundleParsingTest(unittest.TestCase):
+    def test_cursors_of_a_frame(self):
+        decoder = TuioDecoder()
+        packet = encode_cursor_bundle([(3, 0.25, 0.5), (7, 0.75, 0.125)], 1, b'table@10.0.0.2')
+        self.assertTrue(decode(decoder, packet))
+        self.assertEqual(decoder.cursors(), [Cursor(3, 0.25, 0.5), Cursor(7, 0.75, 0.125)])
+        self.assertEqual(decoder.fseq, 1)
+
+    def test_frame_split_over_bundles(self):
+        # the set messages of one frame may arrive before the fseq that commits it
+        decoder = TuioDecoder()
+        first = encode_cursor_bundle([(1, 0.125, 0.25)], -1, ids=[1, 2])
+        second = encode_cursor_bundle([(2, 0.375, 0.75)], 5, ids=[1, 2])
+        decode(decoder, first)
+        self.assertEqual(decoder.cursors(), [Cursor(1, 0.125, 0.25)])
+        self.assertTrue(decode(decoder, second))
+        self.assertEqual(decoder.cursors(), [Cursor(1, 0.125, 0.25), Cursor(2, 0.375, 0.75)])
+
+    def test_alive_keeps_cursors_without_set(self):
+        decoder = TuioDecoder()
+        decode(decoder, encode_cursor_bundle([(1, 0.125, 0.25), (2, 0.375, 0.75)], 1))
+        decode(decoder, encode_cursor_bundle([(2, 0.5, 0.625)], 2, ids=[1, 2]))
+        self.assertEqual(decoder.cursors(), [Cursor(1, 0.125, 0.25), Cursor(2, 0.5, 0.625)])
+        decode(decoder, encode_cursor_bundle([], 3, ids=[2]))
+        self.assertEqual(decoder.cursors(), [Cursor(2, 0.5, 0.625)])
+
+    def test_other_profiles_are_ignored(self):
+        decoder = TuioDecoder()
+        packet = encode_cursor_bundle([(1, 0.125, 0.25)], 1).replace(b'/tuio/2Dcur', b'/tuio/2Dobj')
+        self.assertFalse(decode(decoder, packet))
+        self.assertEqual(decoder.cursors(), [])
+
+def bundle(*messages):
+    packet = BUNDLE_TAG + _timetag.pack(*IMMEDIATE)
+    for message in messages:
+        packet += _int32.pack(len(message)) + message
+    return packet
+
+class MalformedPacketTest(unittest.TestCase):
+    def setUp(self):
+        # the buffer is reused, an earlier datagram is left behind the next one
+        self.decoder = TuioDecoder()
+        self.buf = bytearray(MAX_DATAGRAM)
+        self.decode(encode_cursor_bundle([(1, 0.25, 0.5), (2, 0.75, 0.75)], 1))
+
+    def decode(self, packet):
+        self.buf[:len(packet)] = packet
+        return self.decoder.decode(self.buf, len(packet))
+
+    def test_truncated_set(self):
+        alive = _osc_message(b'alive', b'i', (3,))
+        short = _osc_message(b'set', b'ifffff', (3, 0.5, 0.5, 0.0, 0.0, 0.0))[:-12]
+        fseq = _osc_message(b'fseq', b'i', (2,))
+        self.assertTrue(self.decode(bundle(alive, short, fseq)))
+        self.assertEqual(self.decoder.cursors(), [])
+
+    def test_set_cut_off_by_the_datagram(self):
+        packet = encode_cursor_bundle([(1, 0.125, 0.125)], 2)
+        self.assertFalse(self.decode(packet[:-24]))
+        self.assertEqual(self.decoder.cursors(), [Cursor(1, 0.25, 0.5), Cursor(2, 0.75, 0.75)])
+
+    def test_bad_bundle_size(self):
+        fseq = _osc_message(b'fseq', b'i', (2,))
+        for size in (-8, len(fseq) + 4, 1 << 30):
+            packet = BUNDLE_TAG + _timetag.pack(*IMMEDIATE) + _int32.pack(size) + fseq
+            self.assertFalse(self.decode(packet))
+        self.assertFalse(self.decode(BUNDLE_TAG + b'\0\0'))
+        self.assertEqual(self.decoder.fseq, 1)
+
+class FrameOrderTest(unittest.TestCase):
+    def setUp(self):
+        self.decoder = TuioDecoder()
+        for fseq in range(1, 41):
+            decode(self.decoder, encode_cursor_bundle([(1, fseq / 64.0, 0.5)], fseq, b'table'))
+
+    def test_late_and_duplicate_frames_are_dropped(self):
+        self.assertFalse(decode(self.decoder, encode_cursor_bundle([(1, 0.0, 0.0)], 40, b'table')))
+        self.assertFalse(decode(self.decoder, encode_cursor_bundle([(1, 0.0, 0.0)], 37, b'table')))
+        self.assertEqual(self.decoder.dropped, 2)
+        self.assertEqual(self.decoder.cursors(), [Cursor(1, 0.625, 0.5)])
+        self.assertTrue(decode(self.decoder, encode_cursor_bundle([(1, 0.9, 0.5)], 41, b'table')))
+        self.assertEqual(self.decoder.fseq, 41)
+
+    def test_restart_from_the_same_source(self):
+        # the tracker stopped at 40 and counts from 1 again
+        self.assertTrue(decode(self.decoder, encode_cursor_bundle([(9, 0.125, 0.125)], 1, b'table')))
+        self.assertEqual(self.decoder.restarts, 1)
+        for fseq in range(2, 41):
+            self.assertTrue(decode(self.decoder, encode_cursor_bundle([(9, 0.125, 0.125)], fseq, b'table')))
+        self.assertEqual(self.decoder.dropped, 0)
+
+    def test_restart_from_another_source(self):
+        self.assertTrue(decode(self.decoder, encode_cursor_bundle([(9, 0.125, 0.125)], 35, b'other')))
+        self.assertEqual(self.decoder.cursors(), [Cursor(9, 0.125, 0.125)])
+
+    def test_later_timetag_is_a_restart(self):
+        decoder = TuioDecoder()
+        decode(decoder, encode_cursor_bundle([(1, 0.125, 0.125)], 10, timetag=(100, 0)))
+        self.assertFalse(decode(decoder, encode_cursor_bundle([(1, 0.25, 0.25)], 9, timetag=(99, 0))))
+        self.assertTrue(decode(decoder, encode_cursor_bundle([(1, 0.375, 0.375)], 9, timetag=(101, 0))))
+        self.assertEqual(decoder.fseq, 9)
+
+    def test_short_session_restart(self):
+        # a restart shortly after the last one is still recognised
+        decoder = TuioDecoder()
+        for fseq in range(1, 11):
+            decode(decoder, encode_cursor_bundle([(1, 0.125, 0.125)], fseq))
+        self.assertTrue(decode(decoder, encode_cursor_bundle([(2, 0.25, 0.25)], 1)))
+
+if __name__ == '__main__':
+    unittest.main()